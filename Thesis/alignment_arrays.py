@@ -0,0 +1,206 @@
+# Filename: alignment_arrays.py
+# Tool Name: Alignment Arrays
+#
+# Shared NumPy helpers for the counters. Sequences are encoded as uint8 arrays
+# so that a whole S-gene row can be compared with a few vectorized operations
+# instead of a Python loop over every nucleotide position.
+
+
+# Import required libraries.
+import numpy as np
+
+# Set the nucleotide constants.
+# The column order matches the order of the inner dictionaries in mutation_counts.
+NUCLEOTIDES = ('A', 'T', 'G', 'C', '-')
+NUMBER_OF_BASES = 4
+NOT_A_NUCLEOTIDE = 255
+GAP = ord('-')
+
+# Build the lookup table from an ASCII byte to its column in the count matrix.
+# Any character that is not one of NUCLEOTIDES (N, lowercase, etc.) maps to NOT_A_NUCLEOTIDE.
+NUCLEOTIDE_CODES = np.full(256, NOT_A_NUCLEOTIDE, dtype=np.uint8)
+for column, nuc in enumerate(NUCLEOTIDES):
+    NUCLEOTIDE_CODES[ord(nuc)] = column
+
+
+def encode_sequence(sequence):
+    """
+    Encodes a sequence as an array of ASCII bytes without copying bytes-like input.
+
+    Parameter: sequence - the sequence as a str, bytes, memoryview, or uint8 array
+
+    Returns:   the sequence as a uint8 NumPy array
+    """
+
+    # If the sequence is already an array, return it unchanged.
+    if isinstance(sequence, np.ndarray):
+        return sequence
+
+    # Encode strings to ASCII bytes.
+    if isinstance(sequence, str):
+        sequence = sequence.encode('ascii')
+
+    return np.frombuffer(sequence, dtype=np.uint8)
+
+def find_mutations(reference, other):
+    """
+    Finds the positions and nucleotide columns of the substitutions and single nucleotide deletions
+    between a reference sequence and an other/variant sequence.
+
+    A position is counted when the reference has one of ATCG and the other/variant sequence has a different
+    one of ATCG-, which is the same rule as the original per-position loop.
+
+    Parameters: reference - the reference sequence
+                other     - the other/variant sequence
+
+    Returns:    positions - the array of mutated positions
+                columns   - the array of count matrix columns for the mutated nucleotides
+    """
+
+    # Encode both sequences.
+    reference = encode_sequence(reference)
+    other = encode_sequence(other)
+
+    # Look up the count matrix column for every position.
+    reference_columns = NUCLEOTIDE_CODES[reference]
+    other_columns = NUCLEOTIDE_CODES[other]
+
+    # Build the mutation mask in a single pass.
+    mask = (reference_columns < NUMBER_OF_BASES) & (other_columns != NOT_A_NUCLEOTIDE) & (reference != other)
+    positions = np.flatnonzero(mask)
+
+    return positions, other_columns[positions]
+
+def fix_sequences(reference, other, length=3822):
+    """
+    Removes columns from sequences for insertions (gaps in the reference).
+    
+    The non-gap mask of the reference is computed once and both sequences are projected
+    with a single boolean index, so the work is linear in the alignment length.
+    
+    Parameters: reference - the reference sequence
+                other     - the other/variant sequence
+                length    - the expected length of the sequences after the insertions are removed
+                
+    Returns:    new_ref    - the updated reference sequence as a uint8 array
+                new_other  - the updated other/variant sequence as a uint8 array
+                insertions - the (positions, residues) arrays for the removed insertion columns, where each
+                             position is the index of the reference nucleotide the insertion comes before
+    """
+    
+    # Encode both sequences.
+    reference = encode_sequence(reference)
+    other = encode_sequence(other)
+    
+    # Find the insertion columns.
+    mask = reference != GAP
+    
+    # Make sure the lengths are correct.
+    # Otherwise stop and print a message.
+    if np.count_nonzero(mask) != length or len(other) != len(reference):
+        print("Sequences were not the correct length. ({})".format(length))
+        exit()
+    
+    # Find the reference position of each insertion column and the inserted characters.
+    insertion_columns = np.flatnonzero(~mask)
+    insertions = (np.cumsum(mask)[insertion_columns], other[insertion_columns])
+    
+    return reference[mask], other[mask], insertions
+
+def stack_sequences(sequences, fill='-'):
+    """
+    Stacks a list of sequences into a single (N x L) byte matrix.
+    Rows shorter than the longest sequence are padded on the right with the fill character.
+
+    Parameters: sequences - the list of sequences
+                fill      - the padding character
+
+    Returns:    the (N x L) uint8 matrix
+    """
+
+    # Encode the sequences as byte strings.
+    sequences = [sequence.encode('ascii') if isinstance(sequence, str) else sequence if isinstance(sequence, (bytes, memoryview)) else bytes(sequence) for sequence in sequences]
+    width = max(len(sequence) for sequence in sequences)
+
+    # If every row has the same width, build the matrix from one joined buffer.
+    if all(len(sequence) == width for sequence in sequences):
+        return np.frombuffer(b''.join(sequences), dtype=np.uint8).reshape(len(sequences), width)
+
+    # Otherwise copy each row into a padded matrix.
+    block = np.full((len(sequences), width), ord(fill), dtype=np.uint8)
+    for row, sequence in enumerate(sequences):
+        block[row, :len(sequence)] = np.frombuffer(sequence, dtype=np.uint8)
+    return block
+
+def fix_sequence_block(reference_block, other_block, length=3822):
+    """
+    Removes the insertion columns (gaps in the reference) from every row of a block of sequence pairs.
+
+    Parameters: reference_block - the (N x L) matrix of reference sequences, padded with '-'
+                other_block     - the (N x L) matrix of other/variant sequences
+                length          - the expected length of each row after the insertions are removed
+
+    Returns:    the (N x length) reference and other/variant matrices
+    """
+
+    # Find the non-insertion columns of every row.
+    mask = reference_block != GAP
+
+    # Make sure the lengths are correct.
+    # Otherwise stop and print a message.
+    if not np.all(mask.sum(axis=1) == length):
+        print("Sequences were not the correct length. ({})".format(length))
+        exit()
+
+    # Keep the non-insertion columns and restore the row structure.
+    number_of_rows = reference_block.shape[0]
+    return reference_block[mask].reshape(number_of_rows, length), other_block[mask].reshape(number_of_rows, length)
+
+def find_mutation_block(reference_block, other_block):
+    """
+    Finds the substitutions and single nucleotide deletions in every row of a block of sequence pairs.
+
+    Parameters: reference_block - the (N x L) matrix of reference sequences
+                other_block     - the (N x L) matrix of other/variant sequences
+
+    Returns:    rows      - the row of each mutation
+                positions - the position of each mutation
+                columns   - the count matrix column of each mutation
+    """
+
+    # Look up the count matrix columns.
+    reference_columns = NUCLEOTIDE_CODES[reference_block]
+    other_columns = NUCLEOTIDE_CODES[other_block]
+
+    # Build the mutation mask for the whole block.
+    mask = (reference_columns < NUMBER_OF_BASES) & (other_columns != NOT_A_NUCLEOTIDE) & (reference_block != other_block)
+    rows, positions = np.nonzero(mask)
+
+    return rows, positions, other_columns[rows, positions]
+
+def find_deletion_runs(other_block):
+    """
+    Finds the contiguous deletions (runs of '-') in every row of a block with vectorized edge detection.
+    A run that reaches the end of the row is counted as well.
+
+    Parameter: other_block - the (N x L) matrix of other/variant sequences, or a single sequence
+
+    Returns:   rows    - the row of each deletion
+               starts  - the starting index of each deletion
+               lengths - the length of each deletion
+    """
+
+    # Treat a single sequence as a block with one row.
+    other_block = np.atleast_2d(encode_sequence(other_block))
+
+    # Mark the gaps and pad both ends of every row with a non-gap column.
+    gaps = np.zeros((other_block.shape[0], other_block.shape[1] + 2), dtype=np.int8)
+    gaps[:, 1:-1] = other_block == GAP
+
+    # The run starts and ends are the rising and falling edges of the gap mask.
+    # The padding column closes any run at the end of a row.
+    edges = np.diff(gaps, axis=1)
+    rows, starts = np.nonzero(edges == 1)
+    ends = np.nonzero(edges == -1)[1]
+
+    return rows, starts, ends - starts
@@ -0,0 +1,388 @@
+# Filename: benchmark_suite.py
+# Tool Name: Benchmark Suite
+#
+# Output file names:
+# benchmark_results.json (or the file passed with --output)
+#
+# Times the hot path of each counter and analyzer on fixed synthetic inputs at several sizes and reports the
+# throughput and peak memory of each stage. Each (stage, size) case runs in a fresh process, so that the peak
+# resident set size belongs to that case alone. With --baseline, the results are compared to a saved results
+# file and the exit code is 1 if any case is slower or uses more memory than the threshold allows.
+# The module of each stage is imported when the stage runs, so the counter stages can run without
+# the plotting libraries of the analyzers and the analyzer stages without the pairwise readers.
+# A case that fails (for example, on a missing dependency) is recorded as failed in the results and the
+# other cases still run, but the exit code is 1.
+
+
+# Import required libraries.
+import sys
+import io
+import json
+import time
+import platform
+import argparse
+import traceback
+import datetime
+import resource
+import contextlib
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+import numpy as np
+import pandas as pd
+from synthetic_maf_generator import BASES, make_haplotype, parse_length_distribution
+
+# Set the input sizes of the counter stages (number of sequences)
+# and of the analyzer stages (number of datasets, number of variants).
+COUNTER_SIZES = {'small': 1000, 'medium': 100000, 'large': 1000000}
+ANALYZER_SIZES = {'small': (2, 5), 'medium': (5, 50), 'large': (10, 500)}
+
+# Set the synthetic input constants.
+NUMBER_OF_HAPLOTYPES = 1000
+BLOCK_SIZE = 1000
+MUTATIONS_PER_VARIANT = 30
+LENGTH_OF_S_GENE = 3822
+SEED = 0
+
+
+# The main function.
+def main():
+
+    # Parse the command line arguments.
+    parser = argparse.ArgumentParser(description='Benchmarks the counter and analyzer hot paths on synthetic inputs.')
+    parser.add_argument('--stages', default=','.join(STAGES), help='the comma separated stages to run: ' + ', '.join(STAGES))
+    parser.add_argument('--sizes', default=','.join(COUNTER_SIZES), help='the comma separated sizes to run: ' + ', '.join(COUNTER_SIZES))
+    parser.add_argument('--repeat', type=int, default=1, help='the number of runs of each case, keeping the fastest')
+    parser.add_argument('--output', default='benchmark_results.json', help='the output results file')
+    parser.add_argument('--baseline', help='the saved results file to compare against')
+    parser.add_argument('--threshold', type=float, default=0.1, help='the allowed fractional loss of throughput or growth of peak memory')
+    args = parser.parse_args()
+
+    # Make sure every requested stage and size exists.
+    stage_names = args.stages.split(',')
+    size_names = args.sizes.split(',')
+    for stage_name in stage_names:
+        if stage_name not in STAGES:
+            parser.error('unknown stage: {}'.format(stage_name))
+    for size_name in size_names:
+        if size_name not in COUNTER_SIZES:
+            parser.error('unknown size: {}'.format(size_name))
+
+    # Initialize the results.
+    results = {'created': str(datetime.datetime.now()),
+               'python': platform.python_version(),
+               'numpy': np.__version__,
+               'pandas': pd.__version__,
+               'machine': platform.machine(),
+               'cases': {}}
+
+    # Run every case in a fresh process.
+    for stage_name in stage_names:
+        for size_name in size_names:
+            case_name = '{}:{}'.format(stage_name, size_name)
+            case = None
+            for i in range(args.repeat):
+                # Run the case, recording it as failed and going on to the next case if it raises an exception.
+                try:
+                    with ProcessPoolExecutor(1, mp_context=multiprocessing.get_context('spawn')) as executor:
+                        run = executor.submit(run_case, stage_name, size_name).result()
+                except Exception:
+                    case = {'failed': True, 'error': traceback.format_exc().strip().splitlines()[-1]}
+                    break
+                if case is None or run['seconds'] < case['seconds']:
+                    case = run
+            results['cases'][case_name] = case
+            if case.get('failed'):
+                print("{:<50} FAILED ({})".format(case_name, case['error']))
+            else:
+                print("{:<50} {:>12.4g} {}/s {:>8.1f} MB".format(case_name, case['throughput'], case['unit'], case['peak_rss_mb']))
+
+    # Save the results.
+    with open(args.output, 'w') as output_file:
+        json.dump(results, output_file, indent=2)
+
+    # If a baseline was passed, compare the results.
+    regressions = []
+    if args.baseline is not None:
+        with open(args.baseline) as baseline_file:
+            baseline = json.load(baseline_file)
+        regressions = find_regressions(results, baseline, args.threshold)
+
+    # List the failed cases, and stop with an error code if any case failed or regressed.
+    failures = [case_name for case_name, case in results['cases'].items() if case.get('failed')]
+    if failures:
+        print("\n{} failed cases: {}".format(len(failures), ', '.join(failures)))
+    if failures or regressions:
+        sys.exit(1)
+
+def run_case(stage_name, size_name):
+    """
+    Runs one stage at one size and measures it. The stage output is discarded.
+
+    Parameters: stage_name - the name of the stage
+                size_name - the name of the size
+
+    Returns:    case - the dictionary of the items processed, seconds, throughput and peak resident set size
+    """
+    stage, unit = STAGES[stage_name]
+    with contextlib.redirect_stdout(io.StringIO()):
+        items, seconds = stage(size_name)
+
+    # The peak resident set size is reported in kilobytes on Linux.
+    return {'items': items,
+            'unit': unit,
+            'seconds': seconds,
+            'throughput': items / seconds,
+            'peak_rss_mb': resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024}
+
+def find_regressions(results, baseline, threshold):
+    """
+    Prints the change of every case found in the baseline and finds the regressions.
+    A case that failed or is missing in either run is listed but not compared.
+
+    Parameters: results - the results of this run
+                baseline - the saved baseline results
+                threshold - the allowed fractional loss of throughput or growth of peak memory
+
+    Returns:    regressions - the list of case names that regressed
+    """
+    regressions = []
+    print("\nComparison with the baseline ({}):".format(baseline['created']))
+    for case_name, case in results['cases'].items():
+        # Skip the cases that failed in this run, or are missing or failed in the baseline.
+        baseline_case = baseline['cases'].get(case_name)
+        if case.get('failed'):
+            print("{:<50} failed in this run".format(case_name))
+            continue
+        if baseline_case is None or baseline_case.get('failed'):
+            print("{:<50} {} in the baseline".format(case_name, 'missing' if baseline_case is None else 'failed'))
+            continue
+
+        # Find the relative changes of throughput and memory.
+        throughput_change = case['throughput'] / baseline_case['throughput'] - 1
+        memory_change = case['peak_rss_mb'] / baseline_case['peak_rss_mb'] - 1
+
+        # Check the changes against the threshold.
+        regressed = throughput_change < -threshold or memory_change > threshold
+        if regressed:
+            regressions.append(case_name)
+        print("{:<50} throughput {:+.1%} memory {:+.1%}{}".format(case_name, throughput_change, memory_change, '  REGRESSION' if regressed else ''))
+
+    # List the baseline cases that are missing in this run.
+    for case_name in baseline['cases']:
+        if case_name not in results['cases']:
+            print("{:<50} missing in this run".format(case_name))
+
+    print("{} regressions beyond {:.0%}.".format(len(regressions), threshold))
+    return regressions
+
+def make_sequence_pairs(number_of_sequences):
+    """
+    Makes the synthetic aligned S-gene pairs of the counter stages.
+    The sequences are drawn from a fixed set of haplotypes, so the memory used does not grow with the number of sequences.
+
+    Parameter: number_of_sequences - the number of sequence pairs
+
+    Returns:   pairs - the list of aligned (reference, other/variant) byte strings of each haplotype
+               haplotype_ids - the list of the haplotype of each sequence
+    """
+
+    # Generate the haplotypes with the default rates of the generator.
+    rng = np.random.default_rng(SEED)
+    reference = BASES[rng.integers(len(BASES), size=LENGTH_OF_S_GENE)]
+    deletion_lengths, deletion_probabilities = parse_length_distribution('1:4,3:3,6:2,9:1')
+    pairs = []
+    for i in range(NUMBER_OF_HAPLOTYPES):
+        ref_aligned, other_aligned = make_haplotype(reference, 0.001, 0.0005, deletion_lengths, deletion_probabilities, 0.0001, rng)
+        pairs.append((ref_aligned.tobytes(), other_aligned.tobytes()))
+
+    return pairs, rng.integers(NUMBER_OF_HAPLOTYPES, size=number_of_sequences).tolist()
+
+def benchmark_fix_sequences(size_name):
+    """
+    Times alignment_arrays.fix_sequences on every sequence pair.
+    """
+    from alignment_arrays import fix_sequences
+    pairs, haplotype_ids = make_sequence_pairs(COUNTER_SIZES[size_name])
+
+    start_time = time.perf_counter()
+    for haplotype_id in haplotype_ids:
+        fix_sequences(*pairs[haplotype_id])
+    return len(haplotype_ids), time.perf_counter() - start_time
+
+def benchmark_find_pair_mutations(size_name):
+    """
+    Times the per-pair mutation counting of multi_mutation_counter.py (insertion removal, comparison and postings).
+    """
+    from multi_mutation_counter import new_mutation_counts, find_pair_mutations
+    pairs, haplotype_ids = make_sequence_pairs(COUNTER_SIZES[size_name])
+    mutation_counts = new_mutation_counts()
+
+    start_time = time.perf_counter()
+    for group_id, haplotype_id in enumerate(haplotype_ids):
+        positions, columns = find_pair_mutations(*pairs[haplotype_id])
+        mutation_counts.add(positions, columns, group_id)
+    mutation_counts.freeze()
+    return len(haplotype_ids), time.perf_counter() - start_time
+
+def benchmark_compare_sequence_block(size_name):
+    """
+    Times the block mutation counting of multi_mutation_counter.py on blocks of BLOCK_SIZE pairs.
+    """
+    from alignment_arrays import stack_sequences, fix_sequence_block
+    from multi_mutation_counter import new_mutation_counts, compare_sequence_block
+    pairs, haplotype_ids = make_sequence_pairs(COUNTER_SIZES[size_name])
+    mutation_counts = new_mutation_counts()
+
+    start_time = time.perf_counter()
+    for block_start in range(0, len(haplotype_ids), BLOCK_SIZE):
+        block_ids = haplotype_ids[block_start:block_start + BLOCK_SIZE]
+        reference_block, other_block = fix_sequence_block(stack_sequences([pairs[i][0] for i in block_ids]), stack_sequences([pairs[i][1] for i in block_ids]))
+        compare_sequence_block(reference_block, other_block, mutation_counts, list(range(block_start, block_start + len(block_ids))))
+    mutation_counts.freeze()
+    return len(haplotype_ids), time.perf_counter() - start_time
+
+def benchmark_find_pair_deletions(size_name):
+    """
+    Times the per-pair deletion counting of multi_deletion_counter.py.
+    """
+    from deletion_events import DeletionEventCounter
+    from multi_deletion_counter import find_pair_deletions
+    pairs, haplotype_ids = make_sequence_pairs(COUNTER_SIZES[size_name])
+    deletion_counter = DeletionEventCounter()
+
+    start_time = time.perf_counter()
+    for haplotype_id in haplotype_ids:
+        deletion_counter.add_runs(*find_pair_deletions(*pairs[haplotype_id]))
+    deletion_counter.coalesce()
+    return len(haplotype_ids), time.perf_counter() - start_time
+
+def benchmark_count_contiguous_deletion_block(size_name):
+    """
+    Times the block deletion counting of multi_deletion_counter.py on blocks of BLOCK_SIZE pairs.
+    """
+    from alignment_arrays import stack_sequences, fix_sequence_block
+    from deletion_events import DeletionEventCounter
+    from multi_deletion_counter import count_contiguous_deletion_block
+    pairs, haplotype_ids = make_sequence_pairs(COUNTER_SIZES[size_name])
+    deletion_counter = DeletionEventCounter()
+
+    start_time = time.perf_counter()
+    for block_start in range(0, len(haplotype_ids), BLOCK_SIZE):
+        block_ids = haplotype_ids[block_start:block_start + BLOCK_SIZE]
+        reference_block, other_block = fix_sequence_block(stack_sequences([pairs[i][0] for i in block_ids]), stack_sequences([pairs[i][1] for i in block_ids]))
+        count_contiguous_deletion_block(other_block, deletion_counter)
+    deletion_counter.coalesce()
+    return len(haplotype_ids), time.perf_counter() - start_time
+
+def benchmark_count_contiguous_deletions(size_name):
+    """
+    Times the per-file deletion counting of pairwise_deletion_counter.py on the aligned other/variant sequences.
+    """
+    from deletion_events import DeletionEventCounter
+    from pairwise_deletion_counter import count_contiguous_deletions
+    pairs, haplotype_ids = make_sequence_pairs(COUNTER_SIZES[size_name])
+    other_sequences = [other_sequence.decode('ascii') for ref_sequence, other_sequence in pairs]
+    deletion_counter = DeletionEventCounter()
+
+    start_time = time.perf_counter()
+    for haplotype_id in haplotype_ids:
+        count_contiguous_deletions(None, other_sequences[haplotype_id], deletion_counter)
+    deletion_counter.coalesce()
+    return len(haplotype_ids), time.perf_counter() - start_time
+
+def make_datasets(number_of_datasets):
+    """
+    Makes synthetic multi datasets with the columns of new_mutation_counts_freq_for_S_all.csv.
+    About one position in ten has substitutions and one in fifty has deletions.
+
+    Parameter: number_of_datasets - the number of datasets
+
+    Returns:   datasets - the dictionary containing the dataset information
+    """
+    rng = np.random.default_rng(SEED)
+    datasets = {}
+    for dataset_number in range(number_of_datasets):
+        sequence_number = 100000
+        substitution_counts = rng.integers(1, sequence_number, size=LENGTH_OF_S_GENE) * (rng.random(LENGTH_OF_S_GENE) < 0.1)
+        deletion_counts = rng.integers(1, sequence_number, size=LENGTH_OF_S_GENE) * (rng.random(LENGTH_OF_S_GENE) < 0.02)
+        counts_freqs = pd.DataFrame({'Index': np.arange(LENGTH_OF_S_GENE),
+                                     'Substitution_Count': substitution_counts,
+                                     'Deletion_Count': deletion_counts,
+                                     'Substitution_Freq': substitution_counts / sequence_number,
+                                     'Deletion_Freq': deletion_counts / sequence_number})
+        dataset_name = 'dataset{}'.format(dataset_number + 1)
+        datasets[dataset_name] = {'id': dataset_number + 1,
+                                  'name': dataset_name,
+                                  'sequence_number': sequence_number,
+                                  'type': 'multi',
+                                  'counts_freqs': counts_freqs}
+    return datasets
+
+def make_variants(number_of_variants):
+    """
+    Makes synthetic variants with MUTATIONS_PER_VARIANT S-gene nonsynonymous mutations each, a fifth of them deletions.
+
+    Parameter: number_of_variants - the number of variants
+
+    Returns:   variants - the dictionary containing the variant information
+    """
+    rng = np.random.default_rng(SEED)
+    variants = {}
+    for variant_number in range(number_of_variants):
+        amino_acids = np.where(np.arange(MUTATIONS_PER_VARIANT) % 5 == 0, '-', 'K')
+        variant_nonsynon_mutations_S = pd.DataFrame({'gene': 'S',
+                                                     'position': np.sort(rng.choice(np.arange(1, LENGTH_OF_S_GENE // 3 + 1), MUTATIONS_PER_VARIANT, replace=False)),
+                                                     'amino acid': amino_acids})
+        variant_name = 'variant{}'.format(variant_number + 1)
+        variants[variant_name] = {'name': variant_name,
+                                  'nonsynon_mutations': variant_nonsynon_mutations_S,
+                                  'nonsynon_mutations_S': variant_nonsynon_mutations_S,
+                                  'substitutions': variant_nonsynon_mutations_S[variant_nonsynon_mutations_S['amino acid'] != '-'],
+                                  'deletions': variant_nonsynon_mutations_S[variant_nonsynon_mutations_S['amino acid'] == '-']}
+    return variants
+
+def benchmark_add_mutation_classification_attributes(size_name):
+    """
+    Times general_variant_finder.add_mutation_classification_attributes.
+    """
+    from general_variant_finder import add_mutation_classification_attributes
+    number_of_datasets, number_of_variants = ANALYZER_SIZES[size_name]
+    datasets = make_datasets(number_of_datasets)
+    variants = make_variants(number_of_variants)
+
+    start_time = time.perf_counter()
+    add_mutation_classification_attributes(datasets, variants)
+    return number_of_datasets * number_of_variants, time.perf_counter() - start_time
+
+def benchmark_find_variant_frequency_ranks_per_dataset(size_name):
+    """
+    Times general_variant_finder.find_variant_frequency_ranks_per_dataset.
+    The position columns added by add_mutation_classification_attributes are added directly.
+    """
+    from general_variant_finder import find_variant_frequency_ranks_per_dataset
+    number_of_datasets, number_of_variants = ANALYZER_SIZES[size_name]
+    datasets = make_datasets(number_of_datasets)
+    variants = make_variants(number_of_variants)
+    for dataset in datasets.values():
+        counts_freqs_data = dataset['counts_freqs']
+        counts_freqs_data['Nucleotide Position'] = counts_freqs_data['Index'] + 1
+        counts_freqs_data['Amino Acid Position'] = (counts_freqs_data['Index'] // 3) + 1
+        counts_freqs_data.set_index(['Index'], inplace=True)
+
+    start_time = time.perf_counter()
+    find_variant_frequency_ranks_per_dataset(datasets, variants)
+    return number_of_datasets * number_of_variants, time.perf_counter() - start_time
+
+# The available stages and the unit of their throughput.
+STAGES = {'fix_sequences': (benchmark_fix_sequences, 'sequences'),
+          'find_pair_mutations': (benchmark_find_pair_mutations, 'sequences'),
+          'compare_sequence_block': (benchmark_compare_sequence_block, 'sequences'),
+          'find_pair_deletions': (benchmark_find_pair_deletions, 'sequences'),
+          'count_contiguous_deletion_block': (benchmark_count_contiguous_deletion_block, 'sequences'),
+          'count_contiguous_deletions': (benchmark_count_contiguous_deletions, 'sequences'),
+          'add_mutation_classification_attributes': (benchmark_add_mutation_classification_attributes, 'dataset-variants'),
+          'find_variant_frequency_ranks_per_dataset': (benchmark_find_variant_frequency_ranks_per_dataset, 'dataset-variants')}
+
+# Run the main function.
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,149 @@
+# Filename: chart_scheduler.py
+# Tool Name: Chart Scheduler
+#
+# Builds and saves the Altair charts of the general_* analyzers in a pool of worker processes.
+# A chart job is a module-level function that builds the chart, its arguments and the output file name, so the job
+# can be sent to a worker, which builds the chart and saves it. At most a fixed number of jobs are queued at a time,
+# so the data of every chart is not held in memory at once. A chart that fails to build or save is reported and
+# skipped, and the failures are summarized when the scheduler is closed.
+# With one worker, the charts are built and saved in the calling process.
+
+
+# Import required libraries.
+import collections
+import multiprocessing
+import traceback
+
+# Set the number of queued jobs per worker.
+QUEUED_JOBS_PER_WORKER = 4
+
+
+class ChartScheduler:
+    """
+    Builds and saves charts in a pool of worker processes.
+
+    Attributes: workers        - the number of worker processes, where 1 saves the charts in the calling process
+                max_queued     - the maximum number of jobs queued at a time
+                pool           - the multiprocessing.Pool, started at the first job
+                queued         - the deque of the pending results of the queued jobs, oldest first
+                saved_number   - the number of charts saved
+                failures       - the list of (filename, error) pairs of the charts that failed
+    """
+
+    def __init__(self, workers=1, max_queued=None):
+        self.workers = max(1, workers)
+        self.max_queued = max_queued or self.workers * QUEUED_JOBS_PER_WORKER
+        self.pool = None
+        self.queued = collections.deque()
+        self.saved_number = 0
+        self.failures = []
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def submit(self, filename, build_chart, *args):
+        """
+        Adds a chart job, waiting for the oldest job first if the queue is full.
+
+        Parameters: filename    - the name of the output .html file
+                    build_chart - the module-level function that builds the chart
+                    args        - the arguments for build_chart
+        """
+
+        # Build and save the chart now if there are no worker processes.
+        if self.workers == 1:
+            self.collect(render_chart(filename, build_chart, args))
+            return
+
+        # Start the pool at the first job.
+        if self.pool is None:
+            self.pool = multiprocessing.Pool(self.workers)
+
+        # Wait for the oldest job while the queue is full, then queue the new job.
+        while len(self.queued) >= self.max_queued:
+            self.collect_oldest()
+        self.queued.append((filename, self.pool.apply_async(render_chart, (filename, build_chart, args))))
+
+    def collect_oldest(self):
+        """
+        Waits for the oldest queued job and records its result.
+        """
+        filename, pending_result = self.queued.popleft()
+        try:
+            self.collect(pending_result.get())
+        except Exception:
+            self.collect((filename, traceback.format_exc()))
+
+    def collect(self, result):
+        """
+        Records the result of a job, printing the error if the chart failed.
+
+        Parameter: result - the (filename, error) pair, where error is None if the chart was saved
+        """
+        filename, error = result
+        if error is None:
+            self.saved_number += 1
+        else:
+            print("Failed to save {}:\n{}".format(filename, error))
+            self.failures.append((filename, error))
+
+    def wait(self):
+        """
+        Waits for every queued job.
+        """
+        while self.queued:
+            self.collect_oldest()
+
+    def close(self):
+        """
+        Waits for every queued job, stops the worker processes and prints the summary of the charts.
+        """
+        self.wait()
+        if self.pool is not None:
+            self.pool.close()
+            self.pool.join()
+            self.pool = None
+
+        # Print the summary of the charts and list the failed charts.
+        print("Charts saved: {}, failed: {}".format(self.saved_number, len(self.failures)))
+        for filename, error in self.failures:
+            print("Failed chart: {} ({})".format(filename, error.strip().splitlines()[-1]))
+
+
+def render_chart(filename, build_chart, args):
+    """
+    Builds a chart and saves it as an .html file.
+
+    Parameters: filename    - the name of the output .html file
+                build_chart - the function that builds the chart
+                args        - the arguments for build_chart
+
+    Returns:    filename - the name of the output file
+                error    - the formatted exception if the chart failed, otherwise None
+    """
+    try:
+        build_chart(*args).save(filename)
+        return filename, None
+    except Exception:
+        return filename, traceback.format_exc()
+
+def add_chart_arguments(parser):
+    """
+    Adds the --chart-workers option to an analyzer's argument parser.
+
+    Parameter: parser - the argparse.ArgumentParser
+    """
+    parser.add_argument('--chart-workers', type=int, default=1, help='the number of worker processes building and saving the charts')
+
+def chart_scheduler_from_arguments(args):
+    """
+    Makes the chart scheduler selected by the parsed command line arguments.
+
+    Parameter: args - the parsed arguments
+
+    Returns:   the ChartScheduler
+    """
+    return ChartScheduler(args.chart_workers)
@@ -0,0 +1,241 @@
+# Filename: checkpoints.py
+# Tool Name: Checkpoints
+#
+# Resumable checkpoints for the multi alignment counters.
+# A shard of the file is counted with one reader, which stops at alignment block boundaries about every
+# CHUNK_BYTES to check for a checkpoint. If enough sequences were read or enough time has passed, the counts and
+# the byte offset reached in the file are written atomically to a checkpoint file. A --resume run loads the
+# checkpoint and continues the counts from that offset.
+#
+# A state file keeps the raw counts and the number of sequences of earlier runs, so that the counts of a new
+# (delta) multi alignment file can be added to them without recounting the earlier files.
+
+
+# Import required libraries.
+import os
+import pickle
+import time
+from compressed_maf import maf_size
+
+# Set the number of bytes read between checks for a checkpoint (about 500 sequence pairs).
+CHUNK_BYTES = 1 << 22
+
+
+class Checkpointer:
+    """
+    Stores the checkpoint settings of a counter run.
+
+    Attributes: directory        - the directory containing one checkpoint file for each shard
+                every_sequences  - the number of sequences read between checkpoints, or None
+                every_seconds    - the number of seconds between checkpoints, or None
+                resume           - whether to continue from existing checkpoints
+    """
+
+    def __init__(self, directory, every_sequences=None, every_seconds=None, resume=False):
+        self.directory = directory
+        self.every_sequences = every_sequences
+        self.every_seconds = every_seconds
+        self.resume = resume
+
+    def path(self, start):
+        """
+        Gets the checkpoint file of the shard starting at a byte offset.
+
+        Parameter: start - the byte offset of the shard
+
+        Returns:   the path to the checkpoint file
+        """
+        return os.path.join(self.directory, 'shard_{}.pkl'.format(start))
+
+    def is_due(self, sequences, seconds):
+        """
+        Checks whether a checkpoint should be written.
+
+        Parameters: sequences - the number of sequences read since the last checkpoint
+                    seconds   - the number of seconds since the last checkpoint
+
+        Returns:    True if either checkpoint interval has been reached
+        """
+        return ((self.every_sequences is not None and sequences >= self.every_sequences) or
+                (self.every_seconds is not None and seconds >= self.every_seconds))
+
+    def save(self, filepath, start, end, offset, pairs, result):
+        """
+        Atomically writes the checkpoint of a shard.
+        The checkpoint is written to a temporary file first and then renamed over the previous checkpoint.
+
+        Parameters: filepath - the path to the multi alignment file
+                    start, end - the byte offsets of the shard
+                    offset - the byte offset reached in the shard
+                    pairs - the number of sequence pairs read from start to offset
+                    result - the counter result for the bytes from start to offset
+        """
+        os.makedirs(self.directory, exist_ok=True)
+        state = {'file_size': maf_size(filepath), 'start': start, 'end': end, 'offset': offset, 'pairs': pairs, 'result': result}
+        save_atomically(self.path(start), state)
+
+    def load(self, filepath, start, end):
+        """
+        Loads the checkpoint of a shard if resuming and one exists.
+
+        Parameters: filepath - the path to the multi alignment file
+                    start, end - the byte offsets of the shard
+
+        Returns:    offset - the byte offset to continue from
+                    pairs  - the number of sequence pairs read up to the offset
+                    result - the counter result up to the offset, or None if there is no checkpoint
+        """
+
+        # If not resuming, or there is no checkpoint, start from the beginning of the shard.
+        if not self.resume or not os.path.exists(self.path(start)):
+            return start, 0, None
+
+        with open(self.path(start), 'rb') as checkpoint_file:
+            state = pickle.load(checkpoint_file)
+
+        # Make sure the checkpoint belongs to the same file and shard.
+        # Otherwise stop and print a message.
+        if (state['file_size'], state['start'], state['end']) != (maf_size(filepath), start, end):
+            print("Checkpoint {} does not match this file and number of workers.".format(self.path(start)))
+            exit()
+
+        return state['offset'], state['pairs'], state['result']
+
+def save_atomically(filepath, state):
+    """
+    Pickles a state to a temporary file and renames it over the previous file, so that a killed run
+    never leaves a partially written file behind.
+
+    Parameters: filepath - the path to the output file
+                state    - the object to save
+    """
+    with open(filepath + '.tmp', 'wb') as state_file:
+        pickle.dump(state, state_file)
+        state_file.flush()
+        os.fsync(state_file.fileno())
+    os.replace(filepath + '.tmp', filepath)
+
+def update_state(filepath, counter_name, merge_shard_counts, result):
+    """
+    Adds the counts of this run to the counts saved in a state file and saves the sum back to the file.
+    The counts are sums, so delta files can be added in any order.
+
+    Parameters: filepath - the path to the state file, which is created if it does not exist
+                counter_name - the name of the counter, which must match the counter that saved the state
+                merge_shard_counts - the function merging a list of counter results
+                result - the counter result of this run
+
+    Returns:    result - the counter result of every run added to the state file
+    """
+
+    # If the state file exists, add its counts before the counts of this run.
+    if os.path.exists(filepath):
+        with open(filepath, 'rb') as state_file:
+            state = pickle.load(state_file)
+
+        # Make sure the state was saved by the same counter.
+        # Otherwise stop and print a message.
+        if state['counter'] != counter_name:
+            print("State file {} was saved by {}, not {}.".format(filepath, state['counter'], counter_name))
+            exit()
+
+        print("Adding {} sequences from the state file.".format(state['result'][0]))
+        result = merge_shard_counts([state['result'], result])
+
+    # Save the updated state.
+    save_atomically(filepath, {'counter': counter_name, 'result': result})
+
+    return result
+
+def add_checkpoint_arguments(parser, directory):
+    """
+    Adds the checkpoint options to a counter's argument parser.
+
+    Parameters: parser    - the argparse.ArgumentParser
+                directory - the default checkpoint directory
+    """
+    parser.add_argument('--checkpoint-dir', default=directory, help='the directory for the checkpoint files')
+    parser.add_argument('--checkpoint-every', type=int, help='write a checkpoint every this many sequences')
+    parser.add_argument('--checkpoint-seconds', type=float, help='write a checkpoint every this many seconds')
+    parser.add_argument('--resume', action='store_true', help='continue from the checkpoints in the checkpoint directory')
+
+def checkpointer_from_arguments(args):
+    """
+    Creates the Checkpointer for the parsed command line arguments.
+
+    Parameter: args - the parsed arguments
+
+    Returns:   the Checkpointer, or None if no checkpoint option was passed
+    """
+    if args.checkpoint_every is None and args.checkpoint_seconds is None and not args.resume:
+        return None
+    return Checkpointer(args.checkpoint_dir, args.checkpoint_every, args.checkpoint_seconds, args.resume)
+
+def count_shard_with_checkpoints(filepath, start, end, checkpointer, count_shard, *args, progress):
+    """
+    Counts one shard, writing checkpoints along the way.
+    The shard is read with one reader and one event cache. The counter calls a checkpoint function at the end of
+    each alignment block, and a checkpoint is written at the first block boundary after every CHUNK_BYTES
+    if enough sequences were read or enough time has passed.
+
+    Parameters: filepath - the path to the multi alignment file
+                start, end - the byte offsets of the shard, where end is None for the end of the file
+                checkpointer - the Checkpointer, or None to count the shard without checkpoints
+                count_shard - the counter function, called as count_shard(filepath, start, end, *args, progress=..., result=..., checkpoint=...)
+                args - the additional arguments for the counter function
+                progress - the function called with the number of new sequences read
+
+    Returns:    result - the counter result for the shard
+    """
+
+    # If checkpoints are not used, count the whole shard at once.
+    if checkpointer is None:
+        return count_shard(filepath, start, end, *args, progress=progress)
+
+    # Files without random access (gzip, zstd and stdin) can only be counted at once.
+    if maf_size(filepath) is None:
+        print("Checkpoints are not written for {}, which can only be read from start to end.".format(filepath))
+        return count_shard(filepath, start, end, *args, progress=progress)
+
+    # Get the end of the shard.
+    if end is None:
+        end = maf_size(filepath)
+
+    # Continue from the checkpoint, if there is one.
+    offset, pairs, result = checkpointer.load(filepath, start, end)
+    if result is not None:
+        print("Resuming from byte {} of {} with {} sequences.".format(offset, end, pairs))
+        progress(pairs)
+
+    # Initialize the checkpoint interval counters.
+    pairs_at_checkpoint = pairs
+    next_check = offset + CHUNK_BYTES
+    last_checkpoint_time = time.time()
+
+    def count_progress(new_pairs):
+        # Count the sequence pairs read and pass them on.
+        nonlocal pairs
+        pairs += new_pairs
+        progress(new_pairs)
+
+    def checkpoint(block_end, block_result):
+        nonlocal pairs_at_checkpoint, next_check, last_checkpoint_time
+
+        # Check the intervals at the first block boundary after every CHUNK_BYTES.
+        if block_end < next_check:
+            return
+        next_check = block_end + CHUNK_BYTES
+
+        # Write a checkpoint if one of the intervals was reached.
+        if checkpointer.is_due(pairs - pairs_at_checkpoint, time.time() - last_checkpoint_time):
+            checkpointer.save(filepath, start, end, block_end, pairs, block_result)
+            pairs_at_checkpoint = pairs
+            last_checkpoint_time = time.time()
+
+    # Count the rest of the shard, continuing the counts of the checkpoint.
+    result = count_shard(filepath, offset, end, *args, progress=count_progress, result=result, checkpoint=checkpoint)
+
+    # Write the final checkpoint of the completed shard.
+    checkpointer.save(filepath, start, end, end, pairs, result)
+
+    return result
@@ -0,0 +1,356 @@
+# Filename: compressed_maf.py
+# Tool Name: Compressed MAF
+#
+# Opens multi alignment .maf files that are stored uncompressed, gzipped, block gzipped (bgzip) or zstd
+# compressed, or read from stdin ('-'), so the counters can read them without a temporary decompressed copy.
+# The compression is found from the first bytes of the file, not from its name.
+#
+# Compressed input is decompressed by a background thread that reads ahead of the parser.
+# An uncompressed or bgzip file can also be opened for random access by uncompressed byte offset, so it can be
+# split into shards for the worker processes and checkpointed. For bgzip, the offsets are mapped to the
+# compressed blocks with an index built from the block headers, without decompressing the file.
+# Gzip, zstd and stdin input can only be read from start to end, by one process.
+# Zstd input requires the zstandard package.
+
+
+# Import required libraries.
+import io
+import os
+import sys
+import zlib
+import gzip
+import queue
+import struct
+import bisect
+import threading
+
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+# The magic bytes of each compression format.
+GZIP_MAGIC = b'\x1f\x8b'
+ZSTD_MAGIC = b'\x28\xb5\x2f\xfd'
+
+# Set the size of the decompressed chunks read ahead and the number of chunks held in the queue.
+READ_AHEAD_BYTES = 1 << 20
+READ_AHEAD_CHUNKS = 16
+
+# The bgzip block indexes built in this process, by (path, size, modification time).
+bgzf_indexes = {}
+
+
+class ReadAheadReader(io.RawIOBase):
+    """
+    Reads a stream in a background thread, so that decompressing the next chunks overlaps the parsing of the current one.
+
+    Attributes: source  - the binary stream to read from
+                compressed_file - the compressed file under a decompressing source, closed with the source, or None
+                chunks  - the queue of chunks read ahead, ending with b'' (or the exception raised by the thread)
+                chunk   - the memoryview of the rest of the current chunk
+                stopped - the event telling the thread to stop early
+                thread  - the reading thread
+    """
+
+    def __init__(self, source, compressed_file=None):
+        self.source = source
+        self.compressed_file = compressed_file
+        self.chunks = queue.Queue(READ_AHEAD_CHUNKS)
+        self.chunk = memoryview(b'')
+        self.stopped = threading.Event()
+        self.thread = threading.Thread(target=self.read_ahead, daemon=True)
+        self.thread.start()
+
+    def read_ahead(self):
+        """
+        Reads the chunks of the source into the queue until the end of the stream.
+        """
+        try:
+            while True:
+                chunk = self.source.read(READ_AHEAD_BYTES)
+                self.put(chunk)
+                if not chunk:
+                    return
+        except Exception as error:
+            self.put(error)
+
+    def put(self, item):
+        """
+        Adds an item to the queue, giving up if the reader was closed.
+
+        Parameter: item - the chunk or exception
+        """
+        while not self.stopped.is_set():
+            try:
+                self.chunks.put(item, timeout=0.1)
+                return
+            except queue.Full:
+                pass
+
+    def readable(self):
+        return True
+
+    def readinto(self, buffer):
+        """
+        Copies the next bytes read ahead into a buffer.
+
+        Parameter: buffer - the writable buffer
+
+        Returns:   the number of bytes copied, or 0 at the end of the stream
+        """
+
+        # Get the next chunk once the current one is used up.
+        if not self.chunk:
+            chunk = self.chunks.get()
+            if isinstance(chunk, Exception):
+                raise chunk
+            if not chunk:
+                # Put the end marker back, so that later reads also see the end of the stream.
+                self.chunks.put(chunk)
+                return 0
+            self.chunk = memoryview(chunk)
+
+        # Copy as much of the chunk as fits.
+        size = min(len(buffer), len(self.chunk))
+        buffer[:size] = self.chunk[:size]
+        self.chunk = self.chunk[size:]
+        return size
+
+    def close(self):
+        """
+        Stops the reading thread and closes the source and the compressed file. Stdin is left open, since its thread
+        may be waiting for input.
+        """
+        if not self.closed:
+            self.stopped.set()
+            if sys.stdin.buffer not in (self.source, self.compressed_file):
+                self.thread.join()
+                self.source.close()
+                if self.compressed_file is not None:
+                    self.compressed_file.close()
+        super().close()
+
+class BgzfReader(io.RawIOBase):
+    """
+    Reads a bgzip file by uncompressed byte offset, decompressing only the blocks that are read.
+
+    Attributes: maf_file           - the compressed file
+                compressed_starts  - the list of the compressed offsets of the non-empty blocks, followed by the file size
+                starts             - the list of the uncompressed offsets of the non-empty blocks, followed by the uncompressed size
+                position           - the current uncompressed offset
+                block_number       - the number of the block held in block, or None
+                block              - the decompressed bytes of the current block
+    """
+
+    def __init__(self, filepath):
+        self.maf_file = open(filepath, 'rb')
+        self.compressed_starts, self.starts = read_bgzf_index(filepath)
+        self.position = 0
+        self.block_number = None
+        self.block = b''
+
+    def readable(self):
+        return True
+
+    def seekable(self):
+        return True
+
+    def tell(self):
+        return self.position
+
+    def seek(self, offset, whence=io.SEEK_SET):
+        """
+        Moves to an uncompressed byte offset.
+
+        Parameters: offset - the byte offset
+                    whence - io.SEEK_SET, io.SEEK_CUR or io.SEEK_END
+
+        Returns:    the new uncompressed offset
+        """
+        self.position = offset + (0, self.position, self.starts[-1])[whence]
+        return self.position
+
+    def readinto(self, buffer):
+        """
+        Copies the decompressed bytes at the current offset into a buffer, up to the end of their block.
+
+        Parameter: buffer - the writable buffer
+
+        Returns:   the number of bytes copied, or 0 at the end of the file
+        """
+
+        # Stop at the end of the file.
+        if self.position >= self.starts[-1]:
+            return 0
+
+        # Decompress the block holding the current offset, if it is not the current block.
+        block_number = bisect.bisect_right(self.starts, self.position) - 1
+        if block_number != self.block_number:
+            self.maf_file.seek(self.compressed_starts[block_number])
+            self.block = zlib.decompress(self.maf_file.read(self.compressed_starts[block_number + 1] - self.compressed_starts[block_number]), 31)
+            self.block_number = block_number
+
+        # Copy the rest of the block, as much as fits.
+        block_offset = self.position - self.starts[block_number]
+        size = min(len(buffer), len(self.block) - block_offset)
+        buffer[:size] = self.block[block_offset:block_offset + size]
+        self.position += size
+        return size
+
+    def close(self):
+        if not self.closed:
+            self.maf_file.close()
+        super().close()
+
+
+def find_compression(header):
+    """
+    Finds the compression format from the first bytes of a file.
+
+    Parameter: header - at least the first 18 bytes of the file, if it has that many
+
+    Returns:   'bgzf', 'gzip', 'zstd' or None for an uncompressed file
+    """
+    if header.startswith(ZSTD_MAGIC):
+        return 'zstd'
+    if not header.startswith(GZIP_MAGIC):
+        return None
+
+    # A bgzip block is a gzip member with a 'BC' extra field holding the size of the block.
+    if len(header) >= 18 and header[3] & 4 and header[12:16] == b'BC\x02\x00':
+        return 'bgzf'
+    return 'gzip'
+
+def maf_compression(filepath):
+    """
+    Finds the compression format of a multi alignment file.
+
+    Parameter: filepath - the path to the file, or '-' for stdin
+
+    Returns:   'bgzf', 'gzip', 'zstd' or None for an uncompressed file, where bgzip on stdin is read as gzip
+    """
+    if filepath == '-':
+        compression = find_compression(sys.stdin.buffer.peek(18)[:18])
+        return 'gzip' if compression == 'bgzf' else compression
+    with open(filepath, 'rb') as maf_file:
+        return find_compression(maf_file.read(18))
+
+def read_bgzf_index(filepath):
+    """
+    Builds the offsets of the blocks of a bgzip file from the block headers and sizes, without decompressing the blocks.
+    The index is kept for the rest of the process, and is inherited by forked worker processes.
+
+    Parameter: filepath - the path to the bgzip file
+
+    Returns:   compressed_starts - the list of the compressed offsets of the non-empty blocks, followed by the file size
+               starts            - the list of the uncompressed offsets of the non-empty blocks, followed by the uncompressed size
+    """
+
+    # Reuse the index if the file has not changed.
+    file_stat = os.stat(filepath)
+    key = (os.path.abspath(filepath), file_stat.st_size, file_stat.st_mtime_ns)
+    if key in bgzf_indexes:
+        return bgzf_indexes[key]
+
+    # Initialize the offsets.
+    compressed_starts = []
+    starts = []
+    compressed_offset = 0
+    offset = 0
+
+    with open(filepath, 'rb') as bgzf_file:
+        file_descriptor = bgzf_file.fileno()
+
+        # For each block, read its size from the header and its uncompressed size (ISIZE) from its last 4 bytes.
+        while compressed_offset < file_stat.st_size:
+            header = os.pread(file_descriptor, 18, compressed_offset)
+            if find_compression(header) != 'bgzf':
+                raise ValueError('{} is not a valid bgzip file at byte {}'.format(filepath, compressed_offset))
+            block_size = struct.unpack('<H', header[16:18])[0] + 1
+            block_length = struct.unpack('<I', os.pread(file_descriptor, 4, compressed_offset + block_size - 4))[0]
+
+            # Keep the blocks that hold data, leaving out the empty end-of-file block.
+            if block_length > 0:
+                compressed_starts.append(compressed_offset)
+                starts.append(offset)
+            compressed_offset += block_size
+            offset += block_length
+
+    # Add the ends of the file.
+    compressed_starts.append(compressed_offset)
+    starts.append(offset)
+
+    bgzf_indexes[key] = compressed_starts, starts
+    return compressed_starts, starts
+
+def open_maf(filepath, start=0):
+    """
+    Opens a multi alignment file for reading from a byte offset to the end.
+
+    Parameters: filepath - the path to the file, or '-' for stdin
+                start    - the uncompressed byte offset to start reading from, which must be 0 for gzip, zstd and stdin input
+
+    Returns:    the binary file object, which can be iterated by line
+    """
+
+    # Open uncompressed files directly.
+    compression = maf_compression(filepath)
+    if compression is None and filepath != '-':
+        maf_file = open(filepath, 'rb')
+        maf_file.seek(start)
+        return maf_file
+
+    # Open the decompressed stream.
+    compressed_file = None
+    if compression == 'bgzf':
+        source = io.BufferedReader(BgzfReader(filepath), READ_AHEAD_BYTES)
+        source.seek(start)
+    elif start != 0:
+        raise ValueError('{} can only be read from the start'.format(filepath))
+    else:
+        source = sys.stdin.buffer if filepath == '-' else open(filepath, 'rb')
+        if compression == 'zstd' and zstandard is None:
+            source.close()
+            raise ImportError('the zstandard package is required to read zstd compressed files')
+
+        # Decompress the opened file, which is closed with the decompressed stream.
+        if compression == 'gzip':
+            compressed_file, source = source, gzip.GzipFile(fileobj=source)
+        elif compression == 'zstd':
+            compressed_file, source = source, zstandard.ZstdDecompressor().stream_reader(source, read_across_frames=True)
+
+    # Decompress ahead of the parser in a background thread.
+    return io.BufferedReader(ReadAheadReader(source, compressed_file), READ_AHEAD_BYTES)
+
+def open_seekable_maf(filepath):
+    """
+    Opens an uncompressed or bgzip multi alignment file for random access by uncompressed byte offset.
+
+    Parameter: filepath - the path to the file
+
+    Returns:   the binary file object
+    """
+    compression = maf_compression(filepath)
+    if compression == 'bgzf':
+        return io.BufferedReader(BgzfReader(filepath))
+    if compression is not None or filepath == '-':
+        raise ValueError('{} does not support random access'.format(filepath))
+    return open(filepath, 'rb')
+
+def maf_size(filepath):
+    """
+    Gets the uncompressed size of a multi alignment file.
+
+    Parameter: filepath - the path to the file, or '-' for stdin
+
+    Returns:   the number of uncompressed bytes, or None for input without random access (gzip, zstd and stdin)
+    """
+    if filepath == '-':
+        return None
+    compression = maf_compression(filepath)
+    if compression is None:
+        return os.path.getsize(filepath)
+    if compression == 'bgzf':
+        return read_bgzf_index(filepath)[1][-1]
+    return None
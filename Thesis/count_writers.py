@@ -0,0 +1,114 @@
+# Filename: count_writers.py
+# Tool Name: Count Writers
+#
+# Output file names (for an output named <name>.csv):
+# <name>.csv with --output-format csv (the default)
+# <name>.csv.gz with --output-format csv.gz
+# <name>.parquet with --output-format parquet (requires pyarrow or fastparquet)
+#
+# Bulk writers for the count/frequency files of the counters. The rows of a file are built as columnar arrays,
+# the frequencies are divided once for the whole column, and the file is written in a single call, instead of
+# formatting and writing one row at a time. Each number is formatted with str(), exactly as the row writers
+# did, and the column names are unchanged, so the analyzers read the same files.
+
+
+# Import required libraries.
+import gzip
+import numpy as np
+import pandas as pd
+from alignment_arrays import NUCLEOTIDES
+
+# The available output formats.
+OUTPUT_FORMATS = ('csv', 'csv.gz', 'parquet')
+
+# The column names of each output file.
+MUTATION_COUNTS_COLUMNS = ('Index', 'Substitution_Count', 'Deletion_Count', 'Substitution_Freq', 'Deletion_Freq')
+CONTIGUOUS_DELETION_COLUMNS = ('Starting_Nucleotide_Position', 'Deletion_Length', 'Ending_Nucleotide_Position', 'Deletion_Count',
+                               'Deletion_Freq', 'Num_Sequences_With_Deletions', 'Ratio_With_Deletions')
+DELETION_LENGTH_COLUMNS = ('Deletion Length', 'Count', 'Frequency')
+
+
+def write_table(filename, column_names, columns, output_format='csv'):
+    """
+    Writes equal length columns as one table.
+
+    Parameters: filename      - the name of the .csv file
+                column_names  - the list of column names
+                columns       - the list of numpy arrays, one for each column
+                output_format - 'csv', 'csv.gz' (the .csv file gzipped) or 'parquet' (the .csv extension replaced by .parquet)
+    """
+
+    # Write the parquet file through pandas.
+    if output_format == 'parquet':
+        pd.DataFrame(dict(zip(column_names, columns))).to_parquet(filename[:-len('.csv')] + '.parquet', index=False)
+        return
+
+    # Format each column at once, then join the columns of each row.
+    text_columns = [list(map(str, np.asarray(column).tolist())) for column in columns]
+    lines = [','.join(column_names)]
+    lines.extend(map(','.join, zip(*text_columns)))
+    text = '\n'.join(lines) + '\n'
+
+    # Write the text in a single call.
+    if output_format == 'csv.gz':
+        with gzip.open(filename + '.gz', 'wt', compresslevel=6) as output_file:
+            output_file.write(text)
+    else:
+        with open(filename, 'w') as output_file:
+            output_file.write(text)
+
+def write_mutation_counts(counts, sequence_number, filename, output_format='csv'):
+    """
+    Writes the substitution and deletion counts and frequencies of each position.
+
+    Parameters: counts          - the (length x 5) matrix of mutation counts, with the columns in NUCLEOTIDES order
+                sequence_number - the total number of sequences
+                filename        - the name of the .csv file
+                output_format   - the output format
+    """
+    counts = np.asarray(counts)
+    substitution_counts = counts[:, [NUCLEOTIDES.index(nuc) for nuc in ('A','T','C','G')]].sum(axis=1)
+    deletion_counts = counts[:, NUCLEOTIDES.index('-')]
+    write_table(filename, MUTATION_COUNTS_COLUMNS,
+                [np.arange(len(counts)), substitution_counts, deletion_counts, substitution_counts / sequence_number, deletion_counts / sequence_number],
+                output_format)
+
+def write_contiguous_deletion_counts(starts, lengths, counts, sequence_number, num_sequences_with_deletions, filename, output_format='csv'):
+    """
+    Writes the count and frequency of each contiguous deletion.
+
+    Parameters: starts, lengths, counts - the arrays of the 0-based starting index, length and count of each deletion
+                sequence_number - the total number of sequences
+                num_sequences_with_deletions - the number of sequences with deletions
+                filename        - the name of the .csv file
+                output_format   - the output format
+    """
+    starts = np.asarray(starts, dtype=np.int64)
+    lengths = np.asarray(lengths, dtype=np.int64)
+    counts = np.asarray(counts)
+
+    # The number and ratio of sequences with deletions are the same on every row.
+    write_table(filename, CONTIGUOUS_DELETION_COLUMNS,
+                [starts + 1, lengths, starts + lengths, counts, counts / sequence_number,
+                 np.full(len(starts), num_sequences_with_deletions), np.full(len(starts), num_sequences_with_deletions) / sequence_number],
+                output_format)
+
+def write_deletion_length_counts(lengths, counts, sequence_number, filename, output_format='csv'):
+    """
+    Writes the count and frequency of each deletion length.
+
+    Parameters: lengths, counts - the arrays of the deletion lengths and their counts
+                sequence_number - the total number of sequences
+                filename        - the name of the .csv file
+                output_format   - the output format
+    """
+    counts = np.asarray(counts)
+    write_table(filename, DELETION_LENGTH_COLUMNS, [np.asarray(lengths, dtype=np.int64), counts, counts / sequence_number], output_format)
+
+def add_output_arguments(parser):
+    """
+    Adds the --output-format option to a counter's argument parser.
+
+    Parameter: parser - the argparse.ArgumentParser
+    """
+    parser.add_argument('--output-format', choices=OUTPUT_FORMATS, default='csv', help='the format of the count/frequency files')
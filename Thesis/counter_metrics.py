@@ -0,0 +1,283 @@
+# Filename: counter_metrics.py
+# Tool Name: Counter Metrics
+#
+# Progress and throughput instrumentation for the multi alignment counters.
+# The counters time their stages (parsing, fix_sequences, comparison, counting and output) with the shared
+# metrics object, and ProgressPrinter passes it the number of sequences read. When enabled, the metrics are
+# written as JSON lines every few seconds, and optionally as a Prometheus text file for the node_exporter
+# textfile collector. When disabled, the timers are a shared empty context and the updates return at once.
+#
+# The bytes read are estimated from the average size of the first alignment blocks, so the throughput and
+# ETA need no work per sequence and are also known when the file is counted by worker processes.
+# For gzip, zstd and stdin input the size is unknown, so only the sequence rates are reported.
+# The stage timers run in the process that counts the sequences, so they are reported for serial runs.
+
+
+# Import required libraries.
+import os
+import json
+import time
+import contextlib
+from multi_maf_reader import find_block_start
+from compressed_maf import open_seekable_maf, maf_size
+
+# Set the number of alignment blocks used to estimate the size of one record.
+SAMPLE_BLOCKS = 100
+
+# The timer returned while the metrics are disabled.
+NULL_TIMER = contextlib.nullcontext()
+
+
+class StageTimer:
+    """
+    Adds up the time spent in one stage.
+
+    Attributes: seconds - the total seconds spent in the stage
+                calls   - the number of times the stage was entered
+                start   - the perf_counter value when the stage was last entered
+    """
+
+    def __init__(self):
+        self.seconds = 0.0
+        self.calls = 0
+        self.start = 0.0
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc_info):
+        self.seconds += time.perf_counter() - self.start
+        self.calls += 1
+        return False
+
+class CounterMetrics:
+    """
+    Stores the stage timers and progress of a counter run and writes them periodically.
+
+    Attributes: enabled           - whether the metrics are collected
+                counter_name      - the name of the counter in the metrics
+                metrics_file      - the path to the JSON lines metrics file, or None
+                prometheus_file   - the path to the Prometheus text file, or None
+                interval          - the number of seconds between writes
+                total_bytes       - the uncompressed size of the multi alignment file, or None if it is unknown
+                record_bytes      - the estimated size of one alignment block (sequence pair) in the file, or None
+                timers            - the dictionary from stage name to StageTimer
+                sequence_number   - the number of sequences read
+                start_time        - the monotonic time the run started
+                last_write_time   - the monotonic time the metrics were last written
+                last_write_sequences - the number of sequences read when the metrics were last written
+                owner_pid         - the process that writes the metrics, so that forked workers never write them
+    """
+
+    def __init__(self):
+        self.enabled = False
+        self.timers = {}
+
+    def configure(self, counter_name, filepath, metrics_file=None, prometheus_file=None, interval=10.0):
+        """
+        Enables the metrics for a counter run over a multi alignment file.
+
+        Parameters: counter_name    - the name of the counter in the metrics
+                    filepath        - the path to the multi alignment file
+                    metrics_file    - the path to the JSON lines metrics file, or None
+                    prometheus_file - the path to the Prometheus text file, or None
+                    interval        - the number of seconds between writes
+        """
+        self.enabled = True
+        self.counter_name = counter_name
+        self.metrics_file = metrics_file
+        self.prometheus_file = prometheus_file
+        self.interval = interval
+        self.total_bytes = maf_size(filepath)
+        self.record_bytes = estimate_record_bytes(filepath) if self.total_bytes is not None else None
+        self.timers = {}
+        self.sequence_number = 0
+        self.start_time = time.monotonic()
+        self.last_write_time = self.start_time
+        self.last_write_sequences = 0
+        self.owner_pid = os.getpid()
+
+    def timer(self, stage):
+        """
+        Gets the timer of a stage, to be used as a context manager around the stage.
+
+        Parameter: stage - the name of the stage
+
+        Returns:   the StageTimer, or an empty context if the metrics are disabled
+        """
+        if not self.enabled:
+            return NULL_TIMER
+        if stage not in self.timers:
+            self.timers[stage] = StageTimer()
+        return self.timers[stage]
+
+    def timed(self, stage, iterable):
+        """
+        Times the time spent waiting on each item of an iterable, such as the pairs read from a file.
+
+        Parameters: stage    - the name of the stage
+                    iterable - the iterable to time
+
+        Returns:    the timed iterable, or the iterable itself if the metrics are disabled
+        """
+        if not self.enabled:
+            return iterable
+        return self.time_items(self.timer(stage), iter(iterable))
+
+    def time_items(self, stage_timer, iterator):
+        """
+        Yields the items of an iterator, adding the time of each step to a stage timer.
+
+        Parameters: stage_timer - the StageTimer
+                    iterator    - the iterator
+        """
+        while True:
+            with stage_timer:
+                try:
+                    item = next(iterator)
+                except StopIteration:
+                    return
+            yield item
+
+    def update(self, sequence_number):
+        """
+        Sets the number of sequences read and writes the metrics if the interval has passed.
+
+        Parameter: sequence_number - the total number of sequences read
+        """
+        if not self.enabled:
+            return
+        self.sequence_number = sequence_number
+        if time.monotonic() - self.last_write_time >= self.interval:
+            self.write()
+
+    def snapshot(self):
+        """
+        Builds the current metrics.
+
+        Returns: the dictionary of metrics
+        """
+
+        # Find the overall and recent rates.
+        now = time.monotonic()
+        elapsed = now - self.start_time
+        sequences_per_second = self.sequence_number / elapsed if elapsed > 0 else 0.0
+        recent_sequences_per_second = (self.sequence_number - self.last_write_sequences) / (now - self.last_write_time) if now > self.last_write_time else 0.0
+
+        # Estimate the bytes read and the time left from the size of the records, if the size of the file is known.
+        bytes_read = None
+        eta_seconds = None
+        if self.total_bytes is not None:
+            bytes_read = min(self.sequence_number * self.record_bytes, self.total_bytes)
+            eta_seconds = (self.total_bytes - bytes_read) / self.record_bytes / sequences_per_second if sequences_per_second > 0 else None
+
+        return {'time': time.time(),
+                'counter': self.counter_name,
+                'elapsed_seconds': elapsed,
+                'sequences': self.sequence_number,
+                'sequences_per_second': sequences_per_second,
+                'recent_sequences_per_second': recent_sequences_per_second,
+                'bytes': bytes_read,
+                'total_bytes': self.total_bytes,
+                'bytes_per_second': sequences_per_second * self.record_bytes if self.record_bytes is not None else None,
+                'eta_seconds': eta_seconds,
+                'stages': {stage: {'seconds': stage_timer.seconds, 'calls': stage_timer.calls} for stage, stage_timer in self.timers.items()}}
+
+    def write(self):
+        """
+        Appends the metrics to the JSON lines file and rewrites the Prometheus text file.
+        """
+
+        # Only the process that configured the metrics writes them.
+        if not self.enabled or os.getpid() != self.owner_pid:
+            return
+        metrics = self.snapshot()
+
+        # Append a JSON line.
+        if self.metrics_file is not None:
+            with open(self.metrics_file, 'a') as metrics_file:
+                metrics_file.write(json.dumps(metrics) + '\n')
+
+        # Write the Prometheus text file to a temporary file and rename it, so the collector never reads a partial file.
+        if self.prometheus_file is not None:
+            with open(self.prometheus_file + '.tmp', 'w') as prometheus_file:
+                prometheus_file.write(format_prometheus(metrics))
+            os.replace(self.prometheus_file + '.tmp', self.prometheus_file)
+
+        self.last_write_time = time.monotonic()
+        self.last_write_sequences = self.sequence_number
+
+# The metrics shared by the counters, disabled until configured.
+metrics = CounterMetrics()
+
+
+def estimate_record_bytes(filepath):
+    """
+    Estimates the size of one alignment block from the first SAMPLE_BLOCKS blocks of a multi alignment file.
+
+    Parameter: filepath - the path to the multi alignment file
+
+    Returns:   the average number of bytes of an alignment block
+    """
+    file_size = maf_size(filepath)
+    with open_seekable_maf(filepath) as maf_file:
+        # Find the first block and the start of the block SAMPLE_BLOCKS blocks later.
+        first_block = find_block_start(maf_file, 0, file_size)
+        block_start = first_block
+        number_of_blocks = 0
+        while block_start < file_size and number_of_blocks < SAMPLE_BLOCKS:
+            block_start = find_block_start(maf_file, block_start, file_size)
+            number_of_blocks += 1
+
+    return max(block_start - first_block, 1) / max(number_of_blocks, 1)
+
+def format_prometheus(metrics):
+    """
+    Formats the metrics in the Prometheus text exposition format.
+
+    Parameter: metrics - the dictionary of metrics from CounterMetrics.snapshot
+
+    Returns:   the text of the metrics file
+    """
+    label = 'counter="{}"'.format(metrics['counter'])
+    lines = ['# HELP thesis_counter_sequences_total Sequences read by the counter.',
+             '# TYPE thesis_counter_sequences_total counter',
+             'thesis_counter_sequences_total{{{}}} {}'.format(label, metrics['sequences']),
+             '# HELP thesis_counter_bytes_total Estimated bytes of the alignment file read by the counter.',
+             '# TYPE thesis_counter_bytes_total counter',
+             'thesis_counter_bytes_total{{{}}} {}'.format(label, metrics['bytes'] if metrics['bytes'] is not None else 'NaN'),
+             '# HELP thesis_counter_total_bytes Size of the alignment file.',
+             '# TYPE thesis_counter_total_bytes gauge',
+             'thesis_counter_total_bytes{{{}}} {}'.format(label, metrics['total_bytes'] if metrics['total_bytes'] is not None else 'NaN'),
+             '# HELP thesis_counter_sequences_per_second Sequences read per second since the start of the run.',
+             '# TYPE thesis_counter_sequences_per_second gauge',
+             'thesis_counter_sequences_per_second{{{}}} {}'.format(label, metrics['sequences_per_second']),
+             '# HELP thesis_counter_eta_seconds Estimated seconds until the file is read.',
+             '# TYPE thesis_counter_eta_seconds gauge',
+             'thesis_counter_eta_seconds{{{}}} {}'.format(label, metrics['eta_seconds'] if metrics['eta_seconds'] is not None else 'NaN'),
+             '# HELP thesis_counter_stage_seconds_total Seconds spent in each stage of the counter.',
+             '# TYPE thesis_counter_stage_seconds_total counter']
+    for stage, stage_metrics in metrics['stages'].items():
+        lines.append('thesis_counter_stage_seconds_total{{{},stage="{}"}} {}'.format(label, stage, stage_metrics['seconds']))
+    return '\n'.join(lines) + '\n'
+
+def add_metrics_arguments(parser):
+    """
+    Adds the metrics options to a counter's argument parser.
+
+    Parameter: parser - the argparse.ArgumentParser
+    """
+    parser.add_argument('--metrics-file', help='the JSON lines file the progress and stage timing metrics are appended to')
+    parser.add_argument('--prometheus-file', help='the Prometheus text file (for the node_exporter textfile collector) the metrics are written to')
+    parser.add_argument('--metrics-interval', type=float, default=10.0, help='the number of seconds between metrics writes')
+
+def configure_metrics_from_arguments(args, counter_name):
+    """
+    Enables the shared metrics if a metrics file was passed on the command line.
+
+    Parameters: args         - the parsed arguments, including maf_file
+                counter_name - the name of the counter in the metrics
+    """
+    if args.metrics_file is not None or args.prometheus_file is not None:
+        metrics.configure(counter_name, args.maf_file, args.metrics_file, args.prometheus_file, args.metrics_interval)
@@ -0,0 +1,217 @@
+# Filename: dataset_loader.py
+# Tool Name: Dataset Loader
+#
+# Input files (the dataset manifests):
+# finder_data.in, subunit_data.in and deletion_data.in, which share one layout:
+#   Number of datasets: <N>
+#   and for each dataset:
+#   Dataset name: <name>
+#   Number of sequences: <number>
+#   Counts/frequencies file: <filepath>
+#   Deletion lengths file: <filepath>        (deletion_data.in only)
+# Only the last word of each line is read, so the labels can be anything.
+#
+# Loads the counter output files listed in a manifest for the general_* analyzers. The dataset type (pairwise or multi)
+# is found from the file name, and the pairwise column names are renamed to the multi column names.
+# Each parsed .csv file is kept in a binary (pickle) cache, so that repeated analyzer runs skip the .csv parsing.
+# A cache entry is used while the size and modification time of its .csv file are unchanged, or, if they changed,
+# while the SHA-1 hash of its contents is unchanged.
+
+
+# Import required libraries.
+import os
+import pickle
+import hashlib
+import pandas as pd
+from checkpoints import save_atomically
+
+# Set the default cache directory.
+CACHE_DIRECTORY = '.dataset_cache'
+
+# The pairwise mutation counts column names and the multi column names they are renamed to.
+PAIRWISE_COLUMN_NAMES = {'Count': 'Substitution_Count', ' Deletion Count': 'Deletion_Count'}
+
+
+def read_manifest(filepath, number_of_files=1):
+    """
+    Reads the dataset entries of a manifest (.in) file.
+
+    Parameters: filepath        - the path to the manifest file
+                number_of_files - the number of filepath lines of each dataset
+
+    Returns:    entries - the list of dictionaries with the id, name, sequence_number and filepaths of each dataset
+    """
+
+    # Initialize the list of dataset entries.
+    entries = []
+
+    with open(filepath) as manifest_file:
+        # Read the number of datasets.
+        number_of_datasets = int(manifest_file.readline().split()[-1])
+
+        # For each dataset, read the name, the number of sequences and the filepaths.
+        for dataset_number in range(number_of_datasets):
+            entries.append({'id': dataset_number + 1,
+                            'name': manifest_file.readline().split()[-1],
+                            'sequence_number': int(manifest_file.readline().split()[-1]),
+                            'filepaths': [manifest_file.readline().split()[-1] for file_number in range(number_of_files)]})
+
+    return entries
+
+def find_dataset_type(filepath):
+    """
+    Finds the dataset type from the name of a counts/frequencies file.
+    Otherwise prints an error message and stops.
+
+    Parameter: filepath - the path to the counts/frequencies file
+
+    Returns:   'pairwise' or 'multi'
+    """
+
+    # If the filepath starts with pairwise or ends with combined_mutation_counts.csv, the type is pairwise.
+    if filepath.startswith('pairwise') or filepath.endswith('combined_mutation_counts.csv'):
+        return 'pairwise'
+
+    # Else if the filepath starts with multi or ends with new_mutation_counts_freq_for_S_all.csv, the type is multi.
+    if filepath.startswith('multi') or filepath.endswith('new_mutation_counts_freq_for_S_all.csv'):
+        return 'multi'
+
+    # Otherwise print an error message.
+    print("{} does not use the correct naming convention.\nDataset names should start with either 'pairwise' or 'multi'".format(filepath))
+    exit()
+
+def hash_file(filepath):
+    """
+    Hashes the contents of a file.
+
+    Parameter: filepath - the path to the file
+
+    Returns:   the SHA-1 hex digest
+    """
+    file_hash = hashlib.sha1()
+    with open(filepath, 'rb') as input_file:
+        for block in iter(lambda: input_file.read(1 << 20), b''):
+            file_hash.update(block)
+    return file_hash.hexdigest()
+
+def read_csv_cached(filepath, index_col=None, cache_directory=CACHE_DIRECTORY):
+    """
+    Reads a .csv file into a DataFrame through the cache.
+
+    Parameters: filepath        - the path to the .csv file
+                index_col       - the index column passed to pd.read_csv
+                cache_directory - the cache directory, or None to read the .csv file without the cache
+
+    Returns:    data - the DataFrame
+    """
+
+    # Read the file directly if the cache is turned off.
+    if cache_directory is None:
+        return pd.read_csv(filepath, index_col=index_col)
+
+    # Find the cache entry of the file and the read options.
+    file_stat = os.stat(filepath)
+    cache_key = '{}|{}'.format(os.path.abspath(filepath), index_col)
+    cache_filepath = os.path.join(cache_directory, hashlib.sha1(cache_key.encode()).hexdigest() + '.pkl')
+
+    # Load the cache entry, if there is a readable one.
+    entry = None
+    if os.path.exists(cache_filepath):
+        try:
+            with open(cache_filepath, 'rb') as cache_file:
+                entry = pickle.load(cache_file)
+        except (OSError, EOFError, pickle.UnpicklingError):
+            entry = None
+
+    # Use the entry if the file has the same size and modification time.
+    if entry is not None and (entry['size'], entry['mtime']) == (file_stat.st_size, file_stat.st_mtime_ns):
+        return entry['data']
+
+    # Otherwise use the entry if the file has the same contents, or read the .csv file.
+    file_hash = hash_file(filepath)
+    if entry is not None and entry['hash'] == file_hash:
+        data = entry['data']
+    else:
+        data = pd.read_csv(filepath, index_col=index_col)
+
+    # Save the entry for the current version of the file.
+    os.makedirs(cache_directory, exist_ok=True)
+    save_atomically(cache_filepath, {'size': file_stat.st_size, 'mtime': file_stat.st_mtime_ns, 'hash': file_hash, 'data': data})
+    return data
+
+def load_mutation_datasets(manifest_filepath, cache_directory=CACHE_DIRECTORY):
+    """
+    Loads the mutation counts/frequencies datasets listed in a manifest (finder_data.in or subunit_data.in).
+    Pairwise files are read with their first column as the index, and their columns are renamed to the multi column names.
+
+    Parameters: manifest_filepath - the path to the manifest file
+                cache_directory   - the cache directory, or None to read the .csv files without the cache
+
+    Returns:    datasets - a dictionary containing the dataset information
+    """
+
+    # Initialize the datasets dictionary.
+    datasets = {}
+
+    # For each dataset in the manifest:
+    for entry in read_manifest(manifest_filepath):
+        # Find the dataset type and read the dataset into memory.
+        counts_freqs_filepath = entry['filepaths'][0]
+        dataset_type = find_dataset_type(counts_freqs_filepath)
+        if dataset_type == 'pairwise':
+            counts_freqs = read_csv_cached(counts_freqs_filepath, 0, cache_directory).rename(columns=PAIRWISE_COLUMN_NAMES)
+        else:
+            counts_freqs = read_csv_cached(counts_freqs_filepath, None, cache_directory)
+
+        # Add the dataset information to the dictionary.
+        datasets[entry['name']] = {'id': entry['id'],
+                                   'name': entry['name'],
+                                   'sequence_number': entry['sequence_number'],
+                                   'type': dataset_type,
+                                   'counts_freqs': counts_freqs}
+
+    return datasets
+
+def load_deletion_datasets(manifest_filepath, cache_directory=CACHE_DIRECTORY):
+    """
+    Loads the contiguous deletion and deletion length counts/frequencies datasets listed in a manifest (deletion_data.in).
+
+    Parameters: manifest_filepath - the path to the manifest file
+                cache_directory   - the cache directory, or None to read the .csv files without the cache
+
+    Returns:    datasets - a dictionary containing the dataset information
+    """
+
+    # Initialize the datasets dictionary.
+    datasets = {}
+
+    # For each dataset in the manifest, read both files into memory and add the dataset information to the dictionary.
+    for entry in read_manifest(manifest_filepath, 2):
+        counts_freqs_filepath, lengths_counts_freqs_filepath = entry['filepaths']
+        datasets[entry['name']] = {'id': entry['id'],
+                                   'name': entry['name'],
+                                   'sequence_number': entry['sequence_number'],
+                                   'type': find_dataset_type(counts_freqs_filepath),
+                                   'counts_freqs': read_csv_cached(counts_freqs_filepath, None, cache_directory),
+                                   'lengths_counts_freqs': read_csv_cached(lengths_counts_freqs_filepath, None, cache_directory)}
+
+    return datasets
+
+def add_loader_arguments(parser):
+    """
+    Adds the --cache-directory and --no-cache options to an analyzer's argument parser.
+
+    Parameter: parser - the argparse.ArgumentParser
+    """
+    parser.add_argument('--cache-directory', default=CACHE_DIRECTORY, help='the directory of the cached parsed .csv files')
+    parser.add_argument('--no-cache', action='store_true', help='read the .csv files without the cache')
+
+def cache_directory_from_arguments(args):
+    """
+    Gets the cache directory from the parsed command line arguments.
+
+    Parameter: args - the parsed arguments
+
+    Returns:   the cache directory, or None if --no-cache was passed
+    """
+    return None if args.no_cache else args.cache_directory
@@ -0,0 +1,111 @@
+# Filename: deletion_events.py
+# Tool Name: Deletion Events
+#
+# Sparse (COO) counter for contiguous deletions.
+# Each deletion is stored as a (starting index, deletion length) event, and repeated events are
+# summed into a single (start, length, count) entry when the counter is coalesced.
+
+
+# Import required libraries.
+import numpy as np
+
+# Set the number of pending events that triggers coalescing.
+COALESCE_THRESHOLD = 1000000
+
+
+class DeletionEventCounter:
+    """
+    Counts contiguous deletions as sparse (start, length, count) entries.
+
+    Attributes: deletion_chunks - the list of (starts, lengths, counts) arrays not yet coalesced
+                length_chunks   - the list of (lengths, counts) arrays for the sequences with deletions of each length
+                pending         - the number of events added since the last coalesce
+    """
+
+    def __init__(self):
+        self.deletion_chunks = []
+        self.length_chunks = []
+        self.pending = 0
+
+    def __repr__(self):
+        return 'DeletionEventCounter({} deletions, {} lengths)'.format(len(self.deletion_counts()[0]), len(self.length_counts()[0]))
+
+    def add_runs(self, rows, starts, lengths, weights=None):
+        """
+        Adds the deletion runs found in a block of sequences.
+
+        Parameters: rows    - the row (sequence) of each deletion
+                    starts  - the starting index of each deletion
+                    lengths - the length of each deletion
+                    weights - the number of sequences each row stands for, or None for 1 each
+        """
+
+        # If no deletions were found, there is nothing to add.
+        if len(starts) == 0:
+            return
+
+        # Add the events with the weight of their row as the count.
+        row_weights = np.ones(len(starts), dtype=np.int64) if weights is None else np.asarray(weights, dtype=np.int64)[rows]
+        self.deletion_chunks.append((np.asarray(starts, dtype=np.int64), np.asarray(lengths, dtype=np.int64), row_weights))
+
+        # Count each deletion length once per sequence.
+        sequence_lengths, first_events = np.unique(np.stack((rows, lengths)), axis=1, return_index=True)
+        self.length_chunks.append((sequence_lengths[1].astype(np.int64), row_weights[first_events]))
+
+        # Coalesce the events once enough of them are pending.
+        self.pending += len(starts)
+        if self.pending > COALESCE_THRESHOLD:
+            self.coalesce()
+
+    def merge(self, other):
+        """
+        Adds the events from another deletion counter.
+
+        Parameter: other - the other DeletionEventCounter
+        """
+        self.deletion_chunks.extend(other.deletion_chunks)
+        self.length_chunks.extend(other.length_chunks)
+        self.pending += other.pending
+        self.coalesce()
+
+    def coalesce(self):
+        """
+        Sums the repeated events so that each (start, length) pair and each length is stored once.
+        """
+
+        # Coalesce the deletion events.
+        if len(self.deletion_chunks) > 0:
+            starts, lengths, counts = (np.concatenate(column) for column in zip(*self.deletion_chunks))
+            deletions, inverse = np.unique(np.stack((starts, lengths)), axis=1, return_inverse=True)
+            self.deletion_chunks = [(deletions[0], deletions[1], np.bincount(inverse.ravel(), weights=counts).astype(np.int64))]
+
+        # Coalesce the deletion length events.
+        if len(self.length_chunks) > 0:
+            lengths, counts = (np.concatenate(column) for column in zip(*self.length_chunks))
+            length_values, inverse = np.unique(lengths, return_inverse=True)
+            self.length_chunks = [(length_values, np.bincount(inverse.ravel(), weights=counts).astype(np.int64))]
+
+        # Reset the number of pending events.
+        self.pending = 0
+
+    def deletion_counts(self):
+        """
+        Gets the coalesced deletion counts sorted by starting index and then deletion length.
+
+        Returns: starts, lengths, counts - the arrays of deletion counts
+        """
+        self.coalesce()
+        if len(self.deletion_chunks) == 0:
+            return tuple(np.zeros(0, dtype=np.int64) for i in range(3))
+        return self.deletion_chunks[0]
+
+    def length_counts(self):
+        """
+        Gets the number of sequences with a deletion of each length sorted by deletion length.
+
+        Returns: lengths, counts - the arrays of deletion length counts
+        """
+        self.coalesce()
+        if len(self.length_chunks) == 0:
+            return tuple(np.zeros(0, dtype=np.int64) for i in range(2))
+        return self.length_chunks[0]
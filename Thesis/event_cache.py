@@ -0,0 +1,67 @@
+# Filename: event_cache.py
+# Tool Name: Event Cache
+#
+# Many of the aligned sequences in a multi alignment file are identical, so the mutations and deletions
+# found in them are identical too. The cache keys each (reference, other/variant) pair by a hash of its aligned
+# sequences and keeps the events found in the most recently used pairs, so that a repeated pair skips the insertion
+# removal and the comparisons and only has its events added again under its own group_id.
+
+
+# Import required libraries.
+import hashlib
+from collections import OrderedDict
+
+
+class EventCache:
+    """
+    A bounded least recently used cache from the hash of a sequence pair to the events found in it.
+
+    Attributes: max_size - the maximum number of cached pairs, or 0 to turn the cache off
+                entries  - the ordered dictionary of cached events, from the least to the most recently used
+                hits     - the number of pairs found in the cache
+                misses   - the number of pairs not found in the cache
+    """
+
+    def __init__(self, max_size=10000):
+        self.max_size = max_size
+        self.entries = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+
+    def find(self, ref_sequence, other_sequence, find_events):
+        """
+        Gets the events of a sequence pair from the cache, or finds them and adds them to the cache.
+        The cached events are shared by every identical pair, so they must not be modified.
+
+        Parameters: ref_sequence   - the aligned reference sequence bytes
+                    other_sequence - the aligned other/variant sequence bytes
+                    find_events    - the function called as find_events(ref_sequence, other_sequence) on a miss
+
+        Returns:    the events of the pair
+        """
+
+        # If the cache is turned off, find the events every time.
+        if self.max_size == 0:
+            return find_events(ref_sequence, other_sequence)
+
+        # Hash the pair.
+        pair_hash = hashlib.blake2b(digest_size=16)
+        pair_hash.update(ref_sequence)
+        pair_hash.update(b'\n')
+        pair_hash.update(other_sequence)
+        key = pair_hash.digest()
+
+        # If the pair was seen recently, mark it as the most recently used and return its events.
+        events = self.entries.get(key)
+        if events is not None:
+            self.hits += 1
+            self.entries.move_to_end(key)
+            return events
+
+        # Otherwise, find the events and add them, dropping the least recently used pair if the cache is full.
+        self.misses += 1
+        events = find_events(ref_sequence, other_sequence)
+        self.entries[key] = events
+        if len(self.entries) > self.max_size:
+            self.entries.popitem(last=False)
+        return events
@@ -0,0 +1,33 @@
+# Filename: gene_sets.py
+# Tool Name: Gene Sets
+#
+# Maps the genes annotated by gene_reader.dna_reader() onto whole genome alignments.
+# Once the insertion columns are removed, the alignment columns are the reference genome positions,
+# so each gene is a fixed slice of the aligned genome.
+
+
+# Set the length of the SARS-CoV-2 reference genome (NC_045512.2).
+GENOME_LENGTH = 29903
+
+
+def select_genes(genes, gene_names):
+    """
+    Finds the slices of the aligned genome for the selected genes.
+
+    Parameters: genes      - the gene information from dna_reader
+                gene_names - the list of protein names to select
+
+    Returns:    gene_set - the list of (protein_name, start index, length) for each selected gene
+    """
+
+    # Get the 1-based (start, end) location of each gene.
+    locations = {gene['protein_name']: gene['location'] for gene in genes}
+
+    # Make sure every selected gene is annotated.
+    # Otherwise stop and print a message.
+    for gene_name in gene_names:
+        if gene_name not in locations:
+            print("Gene {} is not in the gene information. ({})".format(gene_name, ', '.join(locations)))
+            exit()
+
+    return [(gene_name, locations[gene_name][0] - 1, locations[gene_name][1] - locations[gene_name][0] + 1) for gene_name in gene_names]
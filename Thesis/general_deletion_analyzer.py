@@ -3,67 +3,24 @@
 # Email: thewelfmi@hotmail.com
 
 # Import required libraries/packages.
+import argparse
 import pandas as pd
 import altair as alt
 import datetime
+from step_profiler import add_profile_arguments, profiler_from_arguments
+from dataset_loader import CACHE_DIRECTORY, load_deletion_datasets, add_loader_arguments, cache_directory_from_arguments
+from chart_scheduler import ChartScheduler, add_chart_arguments, chart_scheduler_from_arguments
 
-def import_data():
-    """Imports the deletion datasets into dictionaries.
+def import_data(cache_directory=CACHE_DIRECTORY):
+    """Imports the deletion datasets listed in deletion_data.in into dictionaries.
+       
+    Parameter: cache_directory - the directory of the cached .csv files, or None to read the .csv files without the cache
        
     Returns: datasets - a dictionary containing the dataset information
     """
     
-    # Initialize the datasets dictionary.
-    datasets = {}
-    
-    # With the deletion_data.in file open:
-    with open('deletion_data.in') as deletion_infile:
-    
-        # Read the number of datasets.
-        number_of_datasets = int(deletion_infile.readline().split()[-1])
-        
-        # For each dataset:
-        for dataset_number in range(number_of_datasets):
-            # Read the dataset name.
-            dataset_name = deletion_infile.readline().split()[-1]
-            
-            # Read the number of sequences in the dataset.
-            dataset_sequence_number = int(deletion_infile.readline().split()[-1])
-            
-            # Read the filepath to the counts/frequencies file with unique deletions.
-            dataset_counts_freqs_filepath = deletion_infile.readline().split()[-1]
-            
-            # Read the .csv file for counts/freqs into memory.
-            dataset_counts_freqs = pd.read_csv(dataset_counts_freqs_filepath)
-            
-            # Read the filepath to the counts/frequencies .csv file for deletion lengths.
-            dataset_lengths_counts_freqs_filepath = deletion_infile.readline().split()[-1]
-            
-            # Read the .csv file into memory.
-            dataset_lengths_counts_freqs = pd.read_csv(dataset_lengths_counts_freqs_filepath)
-            
-            # Increment the dataset id number.
-            dataset_id = dataset_number + 1
-            
-            # Get the dataset type based on the starting of the filepath.
-            dataset_type = ''
-            if dataset_counts_freqs_filepath.startswith('pairwise'):
-                dataset_type = 'pairwise'
-            elif dataset_counts_freqs_filepath.startswith('multi'):
-                dataset_type = 'multi'
-            else:
-                print("{} does not use the correct naming convention.\nDataset names should start with either 'pairwise' or 'multi'".format(dataset_counts_freqs_filepath))
-                exit()
-            
-            # Save the dataset information in the datasets dictionary.
-            datasets[dataset_name] = {'id': dataset_id,
-                                      'name': dataset_name,
-                                      'sequence_number':dataset_sequence_number,
-                                      'type': dataset_type,
-                                      'counts_freqs': dataset_counts_freqs,
-                                      'lengths_counts_freqs': dataset_lengths_counts_freqs}
-                                      
-        return datasets
+    # Load the datasets through the shared dataset loader.
+    return load_deletion_datasets('deletion_data.in', cache_directory)
                                       
 def is_frameshift(length):
     """
@@ -278,208 +235,248 @@ def print_unique_deletions_summaries(datasets):
         print(unique_deletion_data[['Unique Deletion Frequency']].sort_values('Unique Deletion Frequency', ascending=False).head(20))
         print()
 
-def plot_sequences_with_deletions_histograms(datasets):
+def plot_sequences_with_deletions_histograms(datasets, scheduler=None):
     """
     Plots the length histograms for the sequences with deletions (metric 1).
     
-    Parameter: datasets - the dictionary containing dataset information
+    Parameters: datasets - the dictionary containing dataset information
+                scheduler - the ChartScheduler saving the charts, or None to save them in this process
     """
+    # Save the charts in this process if no scheduler was passed.
+    scheduler = scheduler or ChartScheduler()
+    
+    # Build the histograms of each dataset once.
+    dataset_hists = {dataset['name']: build_sequences_with_deletions_histograms(dataset) for dataset in datasets.values()}
+    
     # For each pair of datasets:
     for first_dataset in datasets.values():
         for second_dataset in datasets.values():
             # If the two datasets have different names:
             if first_dataset['name'] != second_dataset['name']:
-                # Get the lengths data.
-                first_data_deletion_lengths = first_dataset['lengths_counts_freqs']
-                second_data_deletion_lengths = second_dataset['lengths_counts_freqs']
-                
-                # Generate plots.
-                first_hist = alt.Chart(first_data_deletion_lengths).mark_bar(color='black').encode(
-                             x = alt.X('Deletion Length', axis=alt.Axis(titleFontSize=14, labelFontSize=12),scale=alt.Scale(nice=False)),
-                             y = alt.Y('Frequency', title='Log(Frequency)',axis=alt.Axis(titleFontSize=14, labelFontSize=12),scale=alt.Scale(type='log'))).properties(title={"text":'Histogram of Deletion Lengths: '+first_dataset['name'],
-                                                                        "fontSize":14})
-                second_hist = alt.Chart(second_data_deletion_lengths).mark_bar(color='black').encode(
+                # Combine the histograms and save the figure as a .html file.
+                scheduler.submit(first_dataset['name']+'_'+second_dataset['name']+'_sequences_with_deletions_histograms.html', combine_histograms, dataset_hists[first_dataset['name']], dataset_hists[second_dataset['name']])
+    
+    # Wait for the figures to be saved.
+    scheduler.wait()
+
+def build_sequences_with_deletions_histograms(dataset):
+    """
+    Builds the length histograms for the sequences with deletions (metric 1) of a dataset.
+    
+    Parameter: dataset - the dictionary containing the dataset information
+    
+    Returns: hist - the histogram of all the deletion lengths
+             hist_10 - the histogram of the deletion lengths <= 10
+    """
+    # Get the lengths data.
+    data_deletion_lengths = dataset['lengths_counts_freqs']
+    
+    # Generate the plot.
+    hist = alt.Chart(data_deletion_lengths).mark_bar(color='black').encode(
+                 x = alt.X('Deletion Length', axis=alt.Axis(titleFontSize=14, labelFontSize=12),scale=alt.Scale(nice=False)),
+                 y = alt.Y('Frequency', title='Log(Frequency)',axis=alt.Axis(titleFontSize=14, labelFontSize=12),scale=alt.Scale(type='log'))).properties(title={"text":'Histogram of Deletion Lengths: '+dataset['name'],
+                                                            "fontSize":14})
+    
+    # Create a subset to just show lengths <= 10.
+    data_deletion_lengths_subset = data_deletion_lengths[data_deletion_lengths['Deletion Length'] <= 10]
+    
+    hist_10 = alt.Chart(data_deletion_lengths_subset).mark_bar(color='black').encode(
                              x = alt.X('Deletion Length', axis=alt.Axis(titleFontSize=14, labelFontSize=12),scale=alt.Scale(nice=False)),
-                             y = alt.Y('Frequency', title='Log(Frequency)',axis=alt.Axis(titleFontSize=14, labelFontSize=12),scale=alt.Scale(type='log'))).properties(title={"text":'Histogram of Deletion Lengths: '+second_dataset['name'],
-                                                                        "fontSize":14})
-                # Combine the top plots.
-                top_hists = first_hist | second_hist
-                
-                # Create subsets to just show lengths <= 10.
-                first_data_deletion_lengths_subset = first_data_deletion_lengths[first_data_deletion_lengths['Deletion Length'] <= 10]
-                second_data_deletion_lengths_subset = second_data_deletion_lengths[second_data_deletion_lengths['Deletion Length'] <= 10]
-                
-                first_hist_10 = alt.Chart(first_data_deletion_lengths_subset).mark_bar(color='black').encode(
-                                         x = alt.X('Deletion Length', axis=alt.Axis(titleFontSize=14, labelFontSize=12),scale=alt.Scale(nice=False)),
-                                         y = alt.Y('Frequency', axis=alt.Axis(titleFontSize=14, labelFontSize=12),scale=alt.Scale(domain=[0,1]))).properties(title={"text":'Histogram of Deletion Lengths: '+first_dataset['name'],
-                                                                         "fontSize":14, "subtitle":"Lengths: 1-10"})
-                                                                         
-                second_hist_10 = alt.Chart(second_data_deletion_lengths_subset).mark_bar(color='black').encode(
-                                         x = alt.X('Deletion Length', axis=alt.Axis(titleFontSize=14, labelFontSize=12),scale=alt.Scale(nice=False)),
-                                         y = alt.Y('Frequency', axis=alt.Axis(titleFontSize=14, labelFontSize=12),scale=alt.Scale(domain=[0,1]))).properties(title={"text":'Histogram of Deletion Lengths: '+second_dataset['name'],
-                                                                         "fontSize":14, "subtitle":"Lengths: 1-10"})
-                
-                # Combine the bottom plots.
-                bottom_hists = first_hist_10 | second_hist_10
-                
-                # Create the full figure.
-                combined_hists = top_hists & bottom_hists
-                
-                # Save the figure as a .html file.
-                combined_hists.save(first_dataset['name']+'_'+second_dataset['name']+'_sequences_with_deletions_histograms.html')
-                
-def plot_deletion_occurances_histograms(datasets):
+                             y = alt.Y('Frequency', axis=alt.Axis(titleFontSize=14, labelFontSize=12),scale=alt.Scale(domain=[0,1]))).properties(title={"text":'Histogram of Deletion Lengths: '+dataset['name'],
+                                                             "fontSize":14, "subtitle":"Lengths: 1-10"})
+    
+    return hist, hist_10
+
+def plot_deletion_occurances_histograms(datasets, scheduler=None):
     """
     Plots the length histograms for the deletion occurances (metric 2).
     
-    Parameter: datasets - the dictionary containing dataset information
+    Parameters: datasets - the dictionary containing dataset information
+                scheduler - the ChartScheduler saving the charts, or None to save them in this process
     """
+    # Save the charts in this process if no scheduler was passed.
+    scheduler = scheduler or ChartScheduler()
+    
+    # Build the histograms of each dataset once.
+    dataset_hists = {dataset['name']: build_deletion_occurances_histograms(dataset) for dataset in datasets.values()}
+    
     # For each pair of datasets:
     for first_dataset in datasets.values():
         for second_dataset in datasets.values():
             # If the two datasets have different names:
             if first_dataset['name'] != second_dataset['name']:
-                # Get the lengths data.
-                first_data_deletion_lengths = first_dataset['counts_freqs']
-                second_data_deletion_lengths = second_dataset['counts_freqs']
-                
-                # Generate plots.
-                first_hist = alt.Chart(first_data_deletion_lengths).mark_bar(color='black').encode(
-                             x = alt.X('Deletion_Length', title='Deletion Length',axis=alt.Axis(titleFontSize=14, labelFontSize=12),scale=alt.Scale(nice=False)),
-                             y = alt.Y('Deletion Occurances Frequency', title='Log(Deletion Occurances Frequency)',axis=alt.Axis(titleFontSize=14, labelFontSize=12),scale=alt.Scale(type='log'))).properties(title={"text":'Histogram of Deletion Lengths: '+first_dataset['name'],
-                                                                        "fontSize":14})
-                second_hist = alt.Chart(second_data_deletion_lengths).mark_bar(color='black').encode(
+                # Combine the histograms and save the figure as a .html file.
+                scheduler.submit(first_dataset['name']+'_'+second_dataset['name']+'_deletion_occurances_histograms.html', combine_histograms, dataset_hists[first_dataset['name']], dataset_hists[second_dataset['name']])
+    
+    # Wait for the figures to be saved.
+    scheduler.wait()
+
+def build_deletion_occurances_histograms(dataset):
+    """
+    Builds the length histograms for the deletion occurances (metric 2) of a dataset.
+    
+    Parameter: dataset - the dictionary containing the dataset information
+    
+    Returns: hist - the histogram of all the deletion lengths
+             hist_10 - the histogram of the deletion lengths <= 10
+    """
+    # Get the lengths data.
+    data_deletion_lengths = dataset['counts_freqs']
+    
+    # Generate the plot.
+    hist = alt.Chart(data_deletion_lengths).mark_bar(color='black').encode(
+                 x = alt.X('Deletion_Length', title='Deletion Length',axis=alt.Axis(titleFontSize=14, labelFontSize=12),scale=alt.Scale(nice=False)),
+                 y = alt.Y('Deletion Occurances Frequency', title='Log(Deletion Occurances Frequency)',axis=alt.Axis(titleFontSize=14, labelFontSize=12),scale=alt.Scale(type='log'))).properties(title={"text":'Histogram of Deletion Lengths: '+dataset['name'],
+                                                            "fontSize":14})
+    
+    # Create a subset to just show lengths <= 10.
+    data_deletion_lengths_subset = data_deletion_lengths[data_deletion_lengths['Deletion_Length'] <= 10]
+    
+    hist_10 = alt.Chart(data_deletion_lengths_subset).mark_bar(color='black').encode(
                              x = alt.X('Deletion_Length', title='Deletion Length', axis=alt.Axis(titleFontSize=14, labelFontSize=12),scale=alt.Scale(nice=False)),
-                             y = alt.Y('Deletion Occurances Frequency', title='Log(Deletion Occurances Frequency)',axis=alt.Axis(titleFontSize=14, labelFontSize=12),scale=alt.Scale(type='log'))).properties(title={"text":'Histogram of Deletion Lengths: '+second_dataset['name'],
-                                                                        "fontSize":14})
-                # Combine the top plots.
-                top_hists = first_hist | second_hist
-                
-                # Create subsets to just show lengths <= 10.
-                first_data_deletion_lengths_subset = first_data_deletion_lengths[first_data_deletion_lengths['Deletion_Length'] <= 10]
-                second_data_deletion_lengths_subset = second_data_deletion_lengths[second_data_deletion_lengths['Deletion_Length'] <= 10]
-                
-                first_hist_10 = alt.Chart(first_data_deletion_lengths_subset).mark_bar(color='black').encode(
-                                         x = alt.X('Deletion_Length', title='Deletion Length', axis=alt.Axis(titleFontSize=14, labelFontSize=12),scale=alt.Scale(nice=False)),
-                                         y = alt.Y('Deletion Occurances Frequency', axis=alt.Axis(titleFontSize=14, labelFontSize=12),scale=alt.Scale(domain=[0,1]))).properties(title={"text":'Histogram of Deletion Lengths: '+first_dataset['name'],
-                                                                         "fontSize":14, "subtitle":"Lengths: 1-10"})
-                                                                         
-                second_hist_10 = alt.Chart(second_data_deletion_lengths_subset).mark_bar(color='black').encode(
-                                         x = alt.X('Deletion_Length', title='Deletion Length', axis=alt.Axis(titleFontSize=14, labelFontSize=12),scale=alt.Scale(nice=False)),
-                                         y = alt.Y('Deletion Occurances Frequency', axis=alt.Axis(titleFontSize=14, labelFontSize=12),scale=alt.Scale(domain=[0,1]))).properties(title={"text":'Histogram of Deletion Lengths: '+second_dataset['name'],
-                                                                         "fontSize":14, "subtitle":"Lengths: 1-10"})
-                # Combine the bottom plots.                                                        
-                bottom_hists = first_hist_10 | second_hist_10
-                
-                # Create the full figure.
-                combined_hists = top_hists & bottom_hists
-                
-                # Save the figure as a .html file.
-                combined_hists.save(first_dataset['name']+'_'+second_dataset['name']+'_deletion_occurances_histograms.html')
+                             y = alt.Y('Deletion Occurances Frequency', axis=alt.Axis(titleFontSize=14, labelFontSize=12),scale=alt.Scale(domain=[0,1]))).properties(title={"text":'Histogram of Deletion Lengths: '+dataset['name'],
+                                                             "fontSize":14, "subtitle":"Lengths: 1-10"})
+    
+    return hist, hist_10
 
-def plot_unique_deletion_histograms(datasets):
+def plot_unique_deletion_histograms(datasets, scheduler=None):
     """
     Plots the length histograms for unique deletions (metric 1).
     
-    Parameter: datasets - the dictionary containing dataset information
+    Parameters: datasets - the dictionary containing dataset information
+                scheduler - the ChartScheduler saving the charts, or None to save them in this process
     """
+    # Save the charts in this process if no scheduler was passed.
+    scheduler = scheduler or ChartScheduler()
+    
+    # Build the histograms of each dataset once.
+    dataset_hists = {dataset['name']: build_unique_deletion_histograms(dataset) for dataset in datasets.values()}
+    
     # For each pair of datasets:
     for first_dataset in datasets.values():
         for second_dataset in datasets.values():
             # If the two datasets have different names:
             if first_dataset['name'] != second_dataset['name']:
-                # Get the lengths data.
-                first_unique_deletion_data = first_dataset['counts_freqs'].groupby('Deletion_Length').count()
-                first_unique_deletion_data['Unique Deletion Frequency'] = first_unique_deletion_data.Deletion_Count / first_unique_deletion_data.Deletion_Count.sum()
-                
-                second_unique_deletion_data = second_dataset['counts_freqs'].groupby('Deletion_Length').count()
-                second_unique_deletion_data['Unique Deletion Frequency'] = second_unique_deletion_data.Deletion_Count / second_unique_deletion_data.Deletion_Count.sum()
+                # Combine the histograms and save the figure as a .html file.
+                scheduler.submit(first_dataset['name']+'_'+second_dataset['name']+'_unique_deletion_histograms.html', combine_histograms, dataset_hists[first_dataset['name']], dataset_hists[second_dataset['name']])
+    
+    # Wait for the figures to be saved.
+    scheduler.wait()
+
+def build_unique_deletion_histograms(dataset):
+    """
+    Builds the length histograms for unique deletions (metric 1) of a dataset.
+    
+    Parameter: dataset - the dictionary containing the dataset information
+    
+    Returns: hist - the histogram of all the deletion lengths
+             hist_10 - the histogram of the deletion lengths <= 20
+    """
+    # Get the lengths data.
+    unique_deletion_data = dataset['counts_freqs'].groupby('Deletion_Length').count()
+    unique_deletion_data['Unique Deletion Frequency'] = unique_deletion_data.Deletion_Count / unique_deletion_data.Deletion_Count.sum()
+    
+    # Generate the plot.
+    hist = alt.Chart(unique_deletion_data.reset_index()).mark_bar(color='black').encode(
+                 x = alt.X('Deletion_Length', axis=alt.Axis(titleFontSize=14, labelFontSize=12),scale=alt.Scale(nice=False)),
+                 y = alt.Y('Unique Deletion Frequency',axis=alt.Axis(titleFontSize=14, labelFontSize=12),scale=alt.Scale(domain=[0,0.35]))).properties(title={"text":'Histogram of Deletion Lengths: '+dataset['name'],
+                                                            "fontSize":14})
+    
+    # Create a subset to just show lengths <= 20.
+    unique_deletion_data_subset = unique_deletion_data.reset_index()[unique_deletion_data.reset_index()['Deletion_Length'] <= 20]
+    
+    hist_10 = alt.Chart(unique_deletion_data_subset.reset_index()).mark_bar(color='black').encode(
+                             x = alt.X('Deletion_Length', axis=alt.Axis(title='Deletion Length', titleFontSize=14, labelFontSize=12),scale=alt.Scale(nice=False)),
+                             y = alt.Y('Unique Deletion Frequency', axis=alt.Axis(titleFontSize=14, labelFontSize=12),scale=alt.Scale(domain=[0,0.35]))).properties(title={"text":'Histogram of Deletion Lengths: '+dataset['name'],
+                                                             "fontSize":14})
+    
+    return hist, hist_10
+
+def combine_histograms(first_hists, second_hists):
+    """
+    Combines the already built histograms of a pair of datasets, with the full histograms on top
+    and the histograms of the short deletion lengths on the bottom.
+    
+    Parameters: first_hists - the (hist, hist_10) histograms of the first dataset
+                second_hists - the (hist, hist_10) histograms of the second dataset
+    
+    Returns: combined_hists - the combined Altair chart
+    """
+    # Combine the top plots and the bottom plots.
+    top_hists = first_hists[0] | second_hists[0]
+    bottom_hists = first_hists[1] | second_hists[1]
+    
+    # Create the full figure.
+    combined_hists = top_hists & bottom_hists
+    
+    return combined_hists
 
-                
-                # Generate plots.
-                first_hist = alt.Chart(first_unique_deletion_data.reset_index()).mark_bar(color='black').encode(
-                             x = alt.X('Deletion_Length', axis=alt.Axis(titleFontSize=14, labelFontSize=12),scale=alt.Scale(nice=False)),
-                             y = alt.Y('Unique Deletion Frequency',axis=alt.Axis(titleFontSize=14, labelFontSize=12),scale=alt.Scale(domain=[0,0.35]))).properties(title={"text":'Histogram of Deletion Lengths: '+first_dataset['name'],
-                                                                        "fontSize":14})
-                second_hist = alt.Chart(second_unique_deletion_data.reset_index()).mark_bar(color='black').encode(
-                             x = alt.X('Deletion_Length', axis=alt.Axis(titleFontSize=14, labelFontSize=12),scale=alt.Scale(nice=False)),
-                             y = alt.Y('Unique Deletion Frequency',axis=alt.Axis(titleFontSize=14, labelFontSize=12),scale=alt.Scale(domain=[0,0.35]))).properties(title={"text":'Histogram of Deletion Lengths: '+second_dataset['name'],
-                                                                        "fontSize":14})
-                # Combine the top plots.
-                top_hists = first_hist | second_hist
-                
-                # Create subsets to just show lengths <= 10.
-                first_unique_deletion_data_subset = first_unique_deletion_data.reset_index()[first_unique_deletion_data.reset_index()['Deletion_Length'] <= 20]
-                second_unique_deletion_data_subset = second_unique_deletion_data.reset_index()[second_unique_deletion_data.reset_index()['Deletion_Length'] <= 20]
-                
-                first_hist_10 = alt.Chart(first_unique_deletion_data_subset.reset_index()).mark_bar(color='black').encode(
-                                         x = alt.X('Deletion_Length', axis=alt.Axis(title='Deletion Length', titleFontSize=14, labelFontSize=12),scale=alt.Scale(nice=False)),
-                                         y = alt.Y('Unique Deletion Frequency', axis=alt.Axis(titleFontSize=14, labelFontSize=12),scale=alt.Scale(domain=[0,0.35]))).properties(title={"text":'Histogram of Deletion Lengths: '+first_dataset['name'],
-                                                                         "fontSize":14})
-                                                                         
-                second_hist_10 = alt.Chart(second_unique_deletion_data_subset.reset_index()).mark_bar(color='black').encode(
-                                         x = alt.X('Deletion_Length', axis=alt.Axis(title='Deletion Length', titleFontSize=14, labelFontSize=12),scale=alt.Scale(nice=False)),
-                                         y = alt.Y('Unique Deletion Frequency', axis=alt.Axis(titleFontSize=14, labelFontSize=12),scale=alt.Scale(domain=[0,0.35]))).properties(title={"text":'Histogram of Deletion Lengths: '+second_dataset['name'],
-                                                                         "fontSize":14})
-                # Combine the bottom plots.                                                         
-                bottom_hists = first_hist_10 | second_hist_10
-                
-                # Create the full figure.
-                combined_hists = top_hists & bottom_hists
-                
-                # Save the figure as a .html file.
-                combined_hists.save(first_dataset['name']+'_'+second_dataset['name']+'_unique_deletion_histograms.html')               
 if __name__ == '__main__':
+    # Parse the command line arguments.
+    parser = argparse.ArgumentParser(description='Analyzes the deletions in the datasets listed in deletion_data.in.')
+    add_profile_arguments(parser)
+    add_loader_arguments(parser)
+    add_chart_arguments(parser)
+    args = parser.parse_args()
+    profiler = profiler_from_arguments(args, 'general_deletion_analyzer')
+    scheduler = chart_scheduler_from_arguments(args)
+    
     # Disable the maximum number of columns shown in the output.
     pd.set_option('display.max_columns', None)
     
     print("Output of general_deletion_analyzer.py")
     print("Generated at {}.\n".format(datetime.datetime.now()))
     print("!Importing datasets.\n")
-    datasets = import_data()
+    datasets = profiler.call("Importing datasets", import_data, cache_directory_from_arguments(args))
     
     print("!Adding amino acid positions.\n")
-    add_amino_acid_positions(datasets)
+    profiler.call("Adding amino acid positions", add_amino_acid_positions, datasets)
     
     print("!Adding frameshift category.\n")
-    add_frameshift_category(datasets)
+    profiler.call("Adding frameshift category", add_frameshift_category, datasets)
     
     print("!Adding deletion occurances frequency.\n")
-    add_deletion_occurances_frequency(datasets)
+    profiler.call("Adding deletion occurances frequency", add_deletion_occurances_frequency, datasets)
     
     print("!Previewing datasets.\n")
-    preview_datasets(datasets)
+    profiler.call("Previewing datasets", preview_datasets, datasets)
     
     # Disable the maximum number of rows shown in the output.
     pd.set_option('display.max_rows', None)
     
     
     print("!Printing the top deletion lengths.\n")
-    print_top_deletion_lengths(datasets)
+    profiler.call("Printing the top deletion lengths", print_top_deletion_lengths, datasets)
     
     print("!Printing deletion length summaries.\n")
-    print_deletion_length_summaries(datasets)
+    profiler.call("Printing deletion length summaries", print_deletion_length_summaries, datasets)
     
     print("!Printing high frequency deletions.\n")
-    print_high_frequency_deletions(datasets)
+    profiler.call("Printing high frequency deletions", print_high_frequency_deletions, datasets)
     
     print("!Plotting the histograms for the sequences with deletions metric.\n")
-    plot_sequences_with_deletions_histograms(datasets)
+    profiler.call("Plotting the histograms for the sequences with deletions metric", plot_sequences_with_deletions_histograms, datasets, scheduler)
     
     print("!Printing top deletion lengths by occurances.\n")
-    print_top_deletion_lengths_by_occurances(datasets)
+    profiler.call("Printing top deletion lengths by occurances", print_top_deletion_lengths_by_occurances, datasets)
     
     print("!Plotting the histograms for the deletion occurances metric.\n")
-    plot_deletion_occurances_histograms(datasets)
+    profiler.call("Plotting the histograms for the deletion occurances metric", plot_deletion_occurances_histograms, datasets, scheduler)
     
     print("!Printing the unique deletion sumamries.\n")
-    print_unique_deletions_summaries(datasets)
+    profiler.call("Printing the unique deletion sumamries", print_unique_deletions_summaries, datasets)
     
     print("!Plotting the histograms for the unique deletion metric.\n")
-    plot_unique_deletion_histograms(datasets)
+    profiler.call("Plotting the histograms for the unique deletion metric", plot_unique_deletion_histograms, datasets, scheduler)
     
     print("!Printing the top frameshift deletions.\n")
-    print_top_frameshift_deletions(datasets)
+    profiler.call("Printing the top frameshift deletions", print_top_frameshift_deletions, datasets)
     
     print("!Printing frameshift deletion metric summaries.\n")
-    print_frameshift_deletion_metric_summaries(datasets)
\ No newline at end of file
+    profiler.call("Printing frameshift deletion metric summaries", print_frameshift_deletion_metric_summaries, datasets)
+    
+    # Wait for the last charts and print the summary of the saved and failed charts.
+    scheduler.close()
+    
+    # Write the profile, if --profile was passed.
+    profiler.write()
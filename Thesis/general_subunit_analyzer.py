@@ -3,67 +3,31 @@
 # Email: thewelfmi@hotmail.com
 
 # Import required libraries.
+import argparse
 import pandas as pd
 import altair as alt
 import datetime
+from step_profiler import add_profile_arguments, profiler_from_arguments
+from dataset_loader import CACHE_DIRECTORY, load_mutation_datasets, read_csv_cached, add_loader_arguments, cache_directory_from_arguments
+from chart_scheduler import ChartScheduler, add_chart_arguments, chart_scheduler_from_arguments
 
 # Set gene constants.
 LENGTH_OF_S_GENE = 3822
 
-def import_data():
-    """Imports the mutation datasets and subunit information into dictionaries.
+def import_data(cache_directory=CACHE_DIRECTORY):
+    """Imports the mutation datasets listed in subunit_data.in and the subunit information into dictionaries.
+       
+    Parameter: cache_directory - the directory of the cached .csv files, or None to read the .csv files without the cache
        
     Returns: datasets - a dictionary containing the dataset information
              subunits - a dictionary containing the subunit information
     """
-    # Initialize the datasets dictionary.
-    datasets = {}
     
-    # With subunit_data.in open:
-    with open('subunit_data.in') as subunit_infile:
-        # Read the number of datasets studied.
-        number_of_datasets = int(subunit_infile.readline().split()[-1])
-        
-        # For each dataset:
-        for dataset_number in range(number_of_datasets):
-            # Read the name of the dataset.
-            dataset_name = subunit_infile.readline().split()[-1]
-            
-            # Read the number of unique sequences in the dataset.
-            dataset_sequence_number = int(subunit_infile.readline().split()[-1])
-            
-            # Read the filepath to the counts/frequencies file.
-            dataset_counts_freqs_filepath = subunit_infile.readline().split()[-1]
-            
-            # Increment the dataset id number.
-            dataset_id = dataset_number + 1
-            
-            # Find the dataset type based on the filename.
-            dataset_type = ''
-            
-            # If the filepath starts with pairwise or ends with combined_mutation_counts.csv,
-            # set the type as pairwise and read the dataset into memory.
-            if dataset_counts_freqs_filepath.startswith('pairwise') or dataset_counts_freqs_filepath.endswith('combined_mutation_counts.csv'):
-                dataset_type = 'pairwise'
-                dataset_counts_freqs = pd.read_csv(dataset_counts_freqs_filepath, index_col=0)
-            # Else if the filepath starts with multi or ends with new_mutation_counts_freqs_for_S_all.csv,
-            # set the type as multi and read the dataset into memory.
-            elif dataset_counts_freqs_filepath.startswith('multi') or dataset_counts_freqs_filepath.endswith('new_mutation_counts_freq_for_S_all.csv'):
-                dataset_type = 'multi'
-                dataset_counts_freqs = pd.read_csv(dataset_counts_freqs_filepath)
-            # Otherwise print an error message.
-            else:
-                print("{} does not use the correct naming convention.\nDataset names should start with either 'pairwise' or 'multi'".format(dataset_counts_freqs_filepath))
-                exit()
-            # Add the dataset information to the dictionary.
-            datasets[dataset_name] = {'id': dataset_id,
-                                      'name': dataset_name,
-                                      'sequence_number':dataset_sequence_number,
-                                      'type': dataset_type,
-                                      'counts_freqs': dataset_counts_freqs}
+    # Load the datasets through the shared dataset loader.
+    datasets = load_mutation_datasets('subunit_data.in', cache_directory)
     
     # Read the csv file containing the subunit information into the subunits dictionary.    
-    subunits = pd.read_csv('subunit_info.csv').to_dict('index')
+    subunits = read_csv_cached('subunit_info.csv', None, cache_directory).to_dict('index')
                                       
     return datasets, subunits
 
@@ -89,10 +53,6 @@ def add_new_attributes(datasets):
         # Reset the index.
         data.set_index(['Index'], inplace=True)
         
-        # If the dataset is pairwise, update the column names to match those in the multi-alignment datasets.
-        if dataset['type'] == 'pairwise':
-            data.rename(columns={'Count': 'Substitution_Count',' Deletion Count': 'Deletion_Count'}, inplace=True)
-         
         # Create an attribute for the substitutition count + deletion count.         
         data['Overall_Count'] = data.Substitution_Count + data.Deletion_Count
         
@@ -275,7 +235,7 @@ def plot_region_lines_deletions(dataset,
     
     return deletion_plot
 
-def construct_subplots_all_datasets(datasets, subunits, min_sub_freq, min_del_freq):
+def construct_subplots_all_datasets(datasets, subunits, min_sub_freq, min_del_freq, scheduler=None):
     """
     Constructs the subunit plots for multiple datasets given minimum substitution and deletion frequencies.
     
@@ -283,8 +243,12 @@ def construct_subplots_all_datasets(datasets, subunits, min_sub_freq, min_del_fr
                 subunits - the dictionary containing the subunit information
                 min_sub_freq - the minimum substitution frequency as a decimal
                 min_del_freq - the minimum deletion frequency as a decimal
+                scheduler - the ChartScheduler saving the plots, or None to save them in this process
     """
     
+    # Save the plots in this process if no scheduler was passed.
+    scheduler = scheduler or ChartScheduler()
+    
     # For each subunit:
     for subunit in subunits.values():
         # Get the region name.
@@ -294,52 +258,57 @@ def construct_subplots_all_datasets(datasets, subunits, min_sub_freq, min_del_fr
         start_aa = subunit['start_aa']
         end_aa = subunit['end_aa']
         
+        # Generate the subplot of each dataset once for the subunit.
+        dataset_plots = {dataset['name']: construct_subplots_single_dataset(dataset, min_sub_freq, min_del_freq, region_name, start_aa, end_aa)
+                         for dataset in datasets.values()}
+        
         # For each first dataset:
         for first_dataset in datasets.values():
-            # Generate the top subplot.
-            first_dataset_plot = construct_subplots_single_dataset(first_dataset,
-                                                                    min_sub_freq,
-                                                                    min_del_freq,
-                                                                    region_name,
-                                                                    start_aa,
-                                                                    end_aa)
-            # Save the plot as an html file.
-            first_dataset_plot.save(first_dataset['name']+'_'+
-                                    region_name+'_'+
-                                    'sub_freq='+
-                                    str(float(min_sub_freq))+'_'+
-                                    'del_freq='+
-                                    str(float(min_del_freq))+
-                                    '_subunit_plot.html')
+            # Save the top subplot as an html file.
+            scheduler.submit(first_dataset['name']+'_'+
+                             region_name+'_'+
+                             'sub_freq='+
+                             str(float(min_sub_freq))+'_'+
+                             'del_freq='+
+                             str(float(min_del_freq))+
+                             '_subunit_plot.html',
+                             combine_subplots,
+                             dataset_plots[first_dataset['name']])
             # For each second dataset.
             for second_dataset in datasets.values():
                 # If the datasets have different names:
                 if first_dataset['name'] != second_dataset['name']:
-                    # Create the bottom second plot.
-                    second_dataset_plot = construct_subplots_single_dataset(second_dataset,
-                                                                            min_sub_freq,
-                                                                            min_del_freq,
-                                                                            region_name,
-                                                                            start_aa,
-                                                                            end_aa)
-                                                                            
-                    # Combine the two plots.
-                    combined_plot = first_dataset_plot & second_dataset_plot
-                    
-                    # Save the combined plot.
-                    combined_plot.save(first_dataset['name']+
-                                       '_vs_'+
-                                       second_dataset['name']+
-                                       '_'+
-                                       region_name+
-                                       '_'+
-                                       'sub_freq='+
-                                       str(float(min_sub_freq))+
-                                       '_'+
-                                       'del_freq='+
-                                       str(float(min_del_freq))+
-                                       '_subunit_plot.html')                   
-            
+                    # Combine the top plot with the bottom second plot and save the combined plot.
+                    scheduler.submit(first_dataset['name']+
+                                     '_vs_'+
+                                     second_dataset['name']+
+                                     '_'+
+                                     region_name+
+                                     '_'+
+                                     'sub_freq='+
+                                     str(float(min_sub_freq))+
+                                     '_'+
+                                     'del_freq='+
+                                     str(float(min_del_freq))+
+                                     '_subunit_plot.html',
+                                     combine_subplots,
+                                     dataset_plots[first_dataset['name']],
+                                     dataset_plots[second_dataset['name']])
+    
+    # Wait for the plots to be saved.
+    scheduler.wait()
+
+def combine_subplots(top_plot, bottom_plot=None):
+    """
+    Combines the already built subunit plots of two datasets, with the first dataset on top.
+    
+    Parameters: top_plot - the subunit plot of the first dataset
+                bottom_plot - the subunit plot of the second dataset, or None to use the top plot alone
+                
+    Returns: the combined subunit plot
+    """
+    return top_plot if bottom_plot is None else top_plot & bottom_plot
+
 
 def construct_subplots_single_dataset(dataset, min_sub_freq,min_del_freq, region_name, start_aa, end_aa):
     """
@@ -536,27 +505,42 @@ def print_subunit_summaries(datasets, subunits):
 
 # If the user runs the file:       
 if __name__ == '__main__':
+    # Parse the command line arguments.
+    parser = argparse.ArgumentParser(description='Analyzes the mutations in the subunits of the datasets listed in subunit_data.in.')
+    add_profile_arguments(parser)
+    add_loader_arguments(parser)
+    add_chart_arguments(parser)
+    args = parser.parse_args()
+    profiler = profiler_from_arguments(args, 'general_subunit_analyzer')
+    scheduler = chart_scheduler_from_arguments(args)
+    
     print("Output of general_subunit_analyzer.py")
     print("Generated at {}.\n".format(datetime.datetime.now()))
     print("!Importing dataset and subunit information.\n")
-    datasets, subunits = import_data()
+    datasets, subunits = profiler.call("Importing dataset and subunit information", import_data, cache_directory_from_arguments(args))
     
     print("!Adding mutation classification attributes.\n")
-    add_new_attributes(datasets)
+    profiler.call("Adding mutation classification attributes", add_new_attributes, datasets)
     
     print("!Printing general mutation summaries.\n")
-    print_general_summaries(datasets)
+    profiler.call("Printing general mutation summaries", print_general_summaries, datasets)
     
     print("!Constructing mutated position plots for all datasets and subunits.")
     print("!Generating plots of positions with at least one substitution or deletion.")
-    construct_subplots_all_datasets(datasets, subunits, 0, 0)
+    profiler.call("Generating plots of positions with at least one mutation", construct_subplots_all_datasets, datasets, subunits, 0, 0, scheduler)
     
     print("!Generating plots of high frequency mutation positions (>= 0.01).")
-    construct_subplots_all_datasets(datasets, subunits, 0.01, 0.01)
+    profiler.call("Generating plots of high frequency mutation positions", construct_subplots_all_datasets, datasets, subunits, 0.01, 0.01, scheduler)
     
     
     print("\n!Printing subunit summaries.\n")
-    print_subunit_summaries(datasets, subunits)
+    profiler.call("Printing subunit summaries", print_subunit_summaries, datasets, subunits)
+    
+    # Wait for the last charts and print the summary of the saved and failed charts.
+    scheduler.close()
+    
+    # Write the profile, if --profile was passed.
+    profiler.write()
 
         
         
@@ -3,69 +3,29 @@
 # Email: thewelfmi@hotmail.com
 
 # Import required libraries.
+import argparse
+import numpy as np
 import pandas as pd
 import altair as alt
 import datetime
+from step_profiler import add_profile_arguments, profiler_from_arguments
+from dataset_loader import CACHE_DIRECTORY, load_mutation_datasets, add_loader_arguments, cache_directory_from_arguments
+from chart_scheduler import ChartScheduler, add_chart_arguments, chart_scheduler_from_arguments
+from variant_positions import VariantPositionIndex
 
 # Set gene constants.
 LENGTH_OF_S_GENE = 3822
 
 
-def import_counts_freqs_data():
-    """Imports the mutation datasets into a dictionary.
+def import_counts_freqs_data(cache_directory=CACHE_DIRECTORY):
+    """Imports the mutation datasets listed in finder_data.in into a dictionary.
+       
+       Parameter: cache_directory - the directory of the cached .csv files, or None to read the .csv files without the cache
        
        Returns: datasets - a dictionary containing the dataset information"""
     
-    #Initialize the datasets dictionary.
-    datasets = {}
-    
-    # With the finder input file open:
-    with open('finder_data.in') as subunit_infile:
-        # Read the number of datasets.
-        number_of_datasets = int(subunit_infile.readline().split()[-1])
-        
-        # For each dataset in the input file:
-        for dataset_number in range(number_of_datasets):
-        
-            # Get the dataset name.
-            dataset_name = subunit_infile.readline().split()[-1]
-            
-            # Get the number of unique samples in the dataset.
-            dataset_sequence_number = int(subunit_infile.readline().split()[-1])
-            
-            # Get the filepath to the counts/frequencies file.
-            dataset_counts_freqs_filepath = subunit_infile.readline().split()[-1]
-            
-            # Increment the dataset id number.
-            dataset_id = dataset_number + 1
-            
-            # Find the dataset type based on the filename.
-            dataset_type = ''
-            
-            # If the filepath starts with pairwise or ends with combined_mutation_counts.csv,
-            # set the type as pairwise and read the dataset into memory.
-            if dataset_counts_freqs_filepath.startswith('pairwise') or dataset_counts_freqs_filepath.endswith('combined_mutation_counts.csv'):
-                dataset_type = 'pairwise'
-                dataset_counts_freqs = pd.read_csv(dataset_counts_freqs_filepath, index_col=0)
-            # Else if the filepath starts with multi or ends with new_mutation_counts_freqs_for_S_all.csv,
-            # set the type as multi and read the dataset into memory.
-            elif dataset_counts_freqs_filepath.startswith('multi') or dataset_counts_freqs_filepath.endswith('new_mutation_counts_freq_for_S_all.csv'):
-                dataset_type = 'multi'
-                dataset_counts_freqs = pd.read_csv(dataset_counts_freqs_filepath)
-            # Otherwise print an error message.
-            else:
-                print("{} does not use the correct naming convention.\nDataset names should start with either 'pairwise' or 'multi'".format(dataset_counts_freqs_filepath))
-                exit()
-            
-            # Add the dataset information to the dictionary.
-            datasets[dataset_name] = {'id': dataset_id,
-                                      'name': dataset_name,
-                                      'sequence_number':dataset_sequence_number,
-                                      'type': dataset_type,
-                                      'counts_freqs': dataset_counts_freqs}
-                                      
-                                      
-    return datasets
+    # Load the datasets through the shared dataset loader.
+    return load_mutation_datasets('finder_data.in', cache_directory)
 
 def print_numbers_of_variant_mutations(variants):
     """
@@ -87,10 +47,19 @@ def add_mutation_classification_attributes(datasets, variants):
     Add various mutation classification attributes to the datasets as columns
     based on the different variants studied.
     
+    The position index of every variant is built once, and the columns of all the variants
+    are made from them with array operations and added to each dataset at once.
+    
     Parameters: datasets - the dictionary containing the dataset information
                 variants - the dictionary containg the variant information
     """
     
+    # Index the positions of each variant for each mutation type.
+    variant_list = list(variants.values())
+    position_indexes = {'Substitution': VariantPositionIndex([variant['substitutions'] for variant in variant_list]),
+                        'Deletion': VariantPositionIndex([variant['deletions'] for variant in variant_list]),
+                        'All': VariantPositionIndex([variant['nonsynon_mutations_S'] for variant in variant_list])}
+    
     # For each dataset:
     for dataset in datasets.values():
     
@@ -102,24 +71,38 @@ def add_mutation_classification_attributes(datasets, variants):
         
         # Add the amino acid position to the dataset.
         counts_freqs_data['Amino Acid Position'] = (counts_freqs_data['Index'] // 3) + 1
+        amino_acid_positions = counts_freqs_data['Amino Acid Position'].to_numpy()
         
-        # For each variant:
-        for variant in variants.values():
+        # Find the (positions x variants) masks of the positions mutated in each variant, for each mutation type.
+        masks = {mutation_type: position_index.masks(amino_acid_positions) for mutation_type, position_index in position_indexes.items()}
+        
+        # Get the frequencies of each mutation type.
+        frequencies = {'Substitution': counts_freqs_data['Substitution_Freq'].to_numpy(),
+                       'Deletion': counts_freqs_data['Deletion_Freq'].to_numpy()}
+        frequencies['All'] = frequencies['Substitution'] + frequencies['Deletion']
         
+        # Make the frequency columns of every variant (the frequencies at its mutated positions) and the
+        # compliment columns (the frequencies at the other positions), setting the other positions to 0.
+        variant_columns = {mutation_type: np.where(masks[mutation_type], frequencies[mutation_type][:, None], 0) for mutation_type in masks}
+        nonvariant_columns = {mutation_type: np.where(masks[mutation_type], 0, frequencies[mutation_type][:, None]) for mutation_type in masks}
+        
+        # Collect the columns of each variant in order.
+        new_columns = {}
+        for variant_number, variant in enumerate(variant_list):
             # Add a variant to say if a position has mutated in the variant.
-            counts_freqs_data['Is_'+variant['name']] = counts_freqs_data['Amino Acid Position'].isin(variant['nonsynon_mutations_S'].position)
-            
-            # Add Substitution and Deletion classifications.
-            counts_freqs_data[variant['name']+' Substitution'] = counts_freqs_data.apply(get_variant_plotable_data, args=(variant['substitutions'],"Substitution"),axis=1)
-            counts_freqs_data[variant['name']+' Deletion'] = counts_freqs_data.apply(get_variant_plotable_data, args=(variant['deletions'],"Deletion"),axis=1)
+            new_columns['Is_'+variant['name']] = masks['All'][:, variant_number]
             
-            # Add attribute for either substitutions or deletions.
-            counts_freqs_data[variant['name']+' All'] = counts_freqs_data.apply(get_variant_plotable_data, args=(variant['nonsynon_mutations_S'],"All"),axis=1)
+            # Add Substitution and Deletion classifications, and the attribute for either substitutions or deletions.
+            for mutation_type in ('Substitution', 'Deletion', 'All'):
+                new_columns[variant['name']+' '+mutation_type] = plotable_column(variant_columns[mutation_type][:, variant_number], masks[mutation_type][:, variant_number])
             
             # Create compliment attributes.
-            counts_freqs_data['Non'+variant['name']+' Substitution'] = counts_freqs_data.apply(get_nonvariant_plotable_data, args=(variant['substitutions'],"Substitution"),axis=1)
-            counts_freqs_data['Non'+variant['name']+' Deletion'] = counts_freqs_data.apply(get_nonvariant_plotable_data, args=(variant['deletions'],"Deletion"),axis=1)
-            counts_freqs_data['Non'+variant['name']+' All'] = counts_freqs_data.apply(get_nonvariant_plotable_data, args=(variant['nonsynon_mutations_S'],"All"),axis=1)
+            for mutation_type in ('Substitution', 'Deletion', 'All'):
+                new_columns['Non'+variant['name']+' '+mutation_type] = plotable_column(nonvariant_columns[mutation_type][:, variant_number], ~masks[mutation_type][:, variant_number])
+        
+        # Add the variant columns to the dataset at once.
+        counts_freqs_data = pd.concat([counts_freqs_data, pd.DataFrame(new_columns, index=counts_freqs_data.index)], axis=1)
+        dataset['counts_freqs'] = counts_freqs_data
         
         # Add boolean attribute to show which positions have at least one mutation.
         counts_freqs_data['At Least One'] = pd.Series((counts_freqs_data.Substitution_Freq > 0) | (counts_freqs_data.Deletion_Freq > 0)).astype(int)
@@ -132,6 +115,19 @@ def add_mutation_classification_attributes(datasets, variants):
         print(counts_freqs_data)
         print()
         
+def plotable_column(values, mask):
+    """
+    Makes a plottable column, which keeps its frequencies where the mask is True and is 0 elsewhere.
+    
+    Parameters: values - the array of frequencies, already set to 0 where the mask is False
+                mask - the boolean array of the kept positions
+                
+    Returns:    the column, which is an integer column of 0s if no position is kept
+    """
+    if mask.any():
+        return values
+    return np.zeros(len(values), dtype=np.int64)
+
 def import_variant_data():
     """
     Imports the variant information into memory.
@@ -183,28 +179,45 @@ def print_variant_counts_in_each_dataset(datasets, variants):
                 variants - the dictionary containing the variant information
     """
     
+    # Index the substitution and deletion positions of every variant.
+    variant_list = list(variants.values())
+    substitution_index = VariantPositionIndex([variant['substitutions'] for variant in variant_list])
+    deletion_index = VariantPositionIndex([variant['deletions'] for variant in variant_list])
+    
     # For each dataset:
     for dataset in datasets.values():
     
         print("Printing variant counts for dataset {}.".format(dataset['name']))
         
+        # Get the positions with substitutions and the positions with deletions.
+        substitution_positions = dataset['counts_freqs'][dataset['counts_freqs']['Substitution_Freq'] > 0]['Amino Acid Position']
+        deletion_positions = dataset['counts_freqs'][dataset['counts_freqs']['Deletion_Freq'] > 0]['Amino Acid Position']
+        
+        # Count the positions of every variant found in the dataset.
+        substitution_counts = substitution_index.count([substitution_positions])[0]
+        deletion_counts = deletion_index.count([deletion_positions])[0]
+        
         # For each variant:
-        for variant in variants.values():
+        for variant_number, variant in enumerate(variant_list):
             # Print the variant name.
             print('Variant: {}'.format(variant['name']))
             
             # Print the number of substitutions.
             print("Substitutions:")
-            print('Substitution Count: {}'.format(get_variant_counts(variant['name'], variant['substitutions'], dataset['counts_freqs'][dataset['counts_freqs']['Substitution_Freq'] > 0], "Substitutions")))
+            print_variant_count(variant['name'], substitution_counts[variant_number], substitution_index.sizes[variant_number], len(substitution_positions), "Substitutions")
+            print('Substitution Count: {}'.format(substitution_counts[variant_number]))
             
             # Print the number of deletions.
             print("Deletions:")
-            print('Deletion Count: {}'.format(get_variant_counts(variant['name'], variant['deletions'], dataset['counts_freqs'][dataset['counts_freqs']['Deletion_Freq'] > 0], "Deletions")))
+            print_variant_count(variant['name'], deletion_counts[variant_number], deletion_index.sizes[variant_number], len(deletion_positions), "Deletions")
+            print('Deletion Count: {}'.format(deletion_counts[variant_number]))
             print()
             
 def find_variant_frequency_ranks_per_dataset(datasets, variants):
     """
     Finds the variant frequency ranks for each dataset and each variant.
+    The positions of a dataset are sorted by frequency once, and the variant positions found in the top i
+    positions are counted for every rank i and every variant at once with the position index.
     
     Parameters: datasets - the dictionary containing the dataset information
                 variants - the dictionary containing the variant information
@@ -212,6 +225,11 @@ def find_variant_frequency_ranks_per_dataset(datasets, variants):
     Returns:    frequency_ranks_data - the dictionary containing the frequency ranks data
     """
     
+    # Index the substitution and deletion positions of every variant.
+    variant_list = list(variants.values())
+    position_indexes = {'substitutions': VariantPositionIndex([variant['substitutions'] for variant in variant_list]),
+                        'deletions': VariantPositionIndex([variant['deletions'] for variant in variant_list])}
+    
     # Initialize the frequency ranks dictionary.
     frequency_ranks_data = {}
     
@@ -219,152 +237,77 @@ def find_variant_frequency_ranks_per_dataset(datasets, variants):
     for dataset in datasets.values():
         print("Finding frequency ranks for {}.".format(dataset['name']))
         
-        # Initialize the frequency ranks inner dicitionary for the dataset.
-        frequency_ranks_data[dataset['name']] = {}
+        # Initialize the frequency ranks inner dicitionaries for the dataset and each variant.
+        frequency_ranks_data[dataset['name']] = {variant['name']: {} for variant in variant_list}
+        
+        # For substitutions and deletions, sort the positions by frequency and count the variant positions found
+        # in the top i positions for each rank i.
+        rank_counts = {}
+        for mutation_type, frequency_column in (('substitutions', 'Substitution_Freq'), ('deletions', 'Deletion_Freq')):
+            ranked_positions = dataset['counts_freqs'].sort_values(by=[frequency_column], ascending=False)['Amino Acid Position']
+            rank_counts[mutation_type] = position_indexes[mutation_type].count_ranks(ranked_positions)
         
         # For each variant:
-        for variant in variants.values():
-            # Initialize the inner dictionaries for the variant, substitutions, and deletions:
-            frequency_ranks_data[dataset['name']][variant['name']] = {}
-            frequency_ranks_data[dataset['name']][variant['name']]['substitutions'] = {}
-            frequency_ranks_data[dataset['name']][variant['name']]['deletions'] = {}
-            
-            # Initialize the lists of frequency ranks data points.
-            frequency_ranks_substitutions = []
-            frequency_ranks_deletions = []
-            
-            print("\nSubstitution Frequency Ranks for {}:".format(dataset['name']))
-            # For i from 0 to the number of nucleotide positions:
-            for i in range(0, len(dataset['counts_freqs']) + 1, 1):
-                # Get the top  i substitution positions.
-                top_mutation_subset = dataset['counts_freqs'].sort_values(by=['Substitution_Freq'], ascending=False).head(i).sort_values(by=['Nucleotide Position'])
-                
-                # Get the number of substitution positions of the variant in the subset.
-                count = get_variant_counts(variant['name'], variant['substitutions'], top_mutation_subset, "Substitutions")
-                
-                # Append the rank, frequency pair to the list.
-                frequency_ranks_substitutions.append({'Frequency Rank':i, 'Variant Frequency':count/(len(variant['substitutions']))})
-                
-                # Break the loop if all the substitution positions in the variant are found.
-                if count == len(variant['substitutions']):
-                    break
-                    
-            # Convert the list to a Pandas DataFrame and set it as a dictionary value.
-            frequency_ranks_data[dataset['name']][variant['name']]['substitutions'] = pd.DataFrame(frequency_ranks_substitutions)
-            
-            print("\nDeletion Frequency Ranks for {}:".format(dataset['name']))
-            
-            # For i form 0 to the number of nucleotide positions:
-            for i in range(0, len(dataset['counts_freqs']) + 1, 1):
-                # Get the top i  deletion positions.
-                top_mutation_subset = dataset['counts_freqs'].sort_values(by=['Deletion_Freq'], ascending=False).head(i).sort_values(by=['Nucleotide Position'])
-                
-                # Get the number of deletion positions of the variant in the subset.
-                count = get_variant_counts(variant['name'], variant['deletions'], top_mutation_subset, "Deletions")
+        for variant_number, variant in enumerate(variant_list):
+            # For substitutions and then deletions:
+            for mutation_type in ('substitutions', 'deletions'):
+                print("\n{} Frequency Ranks for {}:".format(mutation_type[:-1].capitalize(), dataset['name']))
                 
-                # Append the rank, frequency pair to the list.
-                frequency_ranks_deletions.append({'Frequency Rank':i, 'Variant Frequency':count/(len(variant['deletions']))})
+                # Convert the counts to a DataFrame of rank, frequency pairs and set it as a dictionary value.
+                variant_size = position_indexes[mutation_type].sizes[variant_number]
+                frequency_ranks = get_frequency_ranks(rank_counts[mutation_type][:, variant_number], variant_size)
+                frequency_ranks_data[dataset['name']][variant['name']][mutation_type] = frequency_ranks
                 
-                # Break the loop if all deletion positions in the variant are found.
-                if count == len(variant['deletions']):
-                    break
-                    
-            # Convert the list to a Pandas DataFrame and set it as a dictionary value.
-            frequency_ranks_data[dataset['name']][variant['name']]['deletions'] = pd.DataFrame(frequency_ranks_deletions)
+                # Print the number of sites and the percentage of the variant positions found at each rank.
+                for rank in range(len(frequency_ranks)):
+                    print_variant_count(variant['name'], rank_counts[mutation_type][rank, variant_number], variant_size, rank, mutation_type.capitalize())
 
     return frequency_ranks_data    
 
-        
-def get_variant_counts(variant_name, variant_mutation_list, subset, mutation_type):
+def get_frequency_ranks(counts, variant_size):
     """
-    Gets the count of variant positions found in the subset of positions.
+    Gets the fraction of the variant positions found in the top i positions, for each rank i from 0 until
+    all the variant positions are found (or all the positions are included).
     
-    Parameter: variant_name - the name of the variant
-               variant_mutation_list - the list of substitutions/deletions in the variant
-               subset - the subset of positions in the form of a DataFrame
-               mutation_type - the type of mutations counted
+    Parameters: counts - the array of the number of variant positions found in the top i positions, for each rank i
+                variant_size - the number of substitutions/deletions in the variant
     
-    Returns: count - the count of the number of BA.1 positions.
+    Returns:    the DataFrame of 'Frequency Rank' and 'Variant Frequency' pairs
     """
     
-    # Initialize the count.
-    count = 0
+    # Stop at the first rank at which all the variant positions are found, or at the last rank.
+    complete_ranks = np.flatnonzero(counts == variant_size)
+    last_rank = complete_ranks[0] if len(complete_ranks) else len(counts) - 1
     
-    # For each matching amino acid position, increment the count.
-    for pos in variant_mutation_list.position:
-        if pos in list(subset['Amino Acid Position']):
-            count += 1
+    return pd.DataFrame({'Frequency Rank': np.arange(last_rank + 1), 'Variant Frequency': counts[:last_rank + 1]/variant_size})
 
-    
-    # If the count is not equal to 0, print the number of sites and the percentage of Omicron BA.1 substitutions.
-    if count != 0:
-        print("Number of sites: {0}".format(len(subset)))
-        print("Percent of "+variant_name+" " + mutation_type + ": {0:.2%}".format(count/(len(variant_mutation_list))))
-        pass
-        
-    # Return the count.
-    return count
-    
-def get_variant_plotable_data(row, mutation_list, mutation_type):
+def print_variant_count(variant_name, count, variant_size, number_of_sites, mutation_type):
     """
-    Makes a plottable column to separate out a frequencies for positions
-    of a specific mutation type and setting all other frequencies to 0.
+    Prints the number of sites and the percentage of the variant positions found in them, if any were found.
     
-    Parameters: row - the row in the dataset the function will be applied to
-                mutation_list - the list of mutation positions that will be compared
-                mutation_type - the type of mutation for which the frequencies will be returned
+    Parameters: variant_name - the name of the variant
+                count - the number of variant positions found
+                variant_size - the number of substitutions/deletions in the variant
+                number_of_sites - the number of sites searched
+                mutation_type - the type of mutations counted
     """
-    # If the amino acid position is found in the mutation_list (for example, BA.1 nonsynonymous substitutions):
-    if row['Amino Acid Position'] in set(mutation_list.position):
-        # If "Substitution" was passed, return the substitution frequency.
-        if mutation_type == "Substitution":
-            return row['Substitution_Freq']
-        
-        # If "Deletion" was passed, return the deletion frequency.
-        elif mutation_type == "Deletion":
-            return row['Deletion_Freq']
-        
-        # If "All" was passed, return the sum of the two frequencies.
-        elif mutation_type == 'All':
-            return row['Substitution_Freq'] + row['Deletion_Freq']
-    # Otherwise, return 0.
-    else:
-        return 0
-        
-def get_nonvariant_plotable_data(row, mutation_list, mutation_type):
-    """
-    Makes a plottable column to separate out a frequencies for positions
-    of a specific mutation type and setting all other frequencies to 0.
-    
-    Parameters: row - the row in the dataset the function will be applied to
-                mutation_list - the list of mutation positions that will be compared
-                mutation_type - the type of mutation for which the frequencies will be returned
-                
-    Note: This function creates the complement of get_variant_plotable_data
-    """
-    
-    # If the position is not in the mutation list, return the respective frequency value.
-    if not (row['Amino Acid Position'] in set(mutation_list.position)):
-        if mutation_type == "Substitution":
-            return row['Substitution_Freq']
-        elif mutation_type == "Deletion":
-            return row['Deletion_Freq']
-        elif mutation_type == 'All':
-            return row['Substitution_Freq'] + row['Deletion_Freq']
+    if count != 0:
+        print("Number of sites: {0}".format(number_of_sites))
+        print("Percent of "+variant_name+" " + mutation_type + ": {0:.2%}".format(count/variant_size))
     
-    # Otherwise, return 0.
-    else:
-        return 0
-
-def generate_frequency_rank_plots(datasets, variants, frequency_ranks_data):
+def generate_frequency_rank_plots(datasets, variants, frequency_ranks_data, scheduler=None):
     """
     Generates the frequency rank plots and saves them as .html files.
     
     Parameters: datasets - the dictionary containing the dataset information
                 variants - the dictionary containg the variant information
                 frequency_ranks_data - a dictionary containing the frequency ranks data
+                scheduler - the ChartScheduler saving the plots, or None to save them in this process
     """
     
+    # Save the plots in this process if no scheduler was passed.
+    scheduler = scheduler or ChartScheduler()
+    
     # For each dataset name:
     for dataset_name in frequency_ranks_data:
     
@@ -380,35 +323,43 @@ def generate_frequency_rank_plots(datasets, variants, frequency_ranks_data):
             # Get the substitution frequency ranks.
             substitution_frequency_ranks = frequency_ranks_data[dataset_name][variant_name]['substitutions']
             
-            # Create the substitution frequency ranks plot.
-            substitution_frequency_ranks_plot = alt.Chart(substitution_frequency_ranks).mark_line(color='black').encode(
-                                             x = alt.X('Frequency Rank',
-                                             title='Frequency Rank of All Subtitution Positions in the S-gene', 
-                                             axis=alt.Axis(titleFontSize=14, 
-                                             labelFontSize=12)),
-                                             y = alt.Y('Variant Frequency', 
-                                             axis=alt.Axis(title='Cumulative '+variant_name+' S-gene Substitution Frequency', 
-                                             titleFontSize=14, 
-                                             labelFontSize=12)),).properties(
-                                             width=900,
-                                             height=450,
-                                             #title={"text":"Cumulative Omicron BA.1 S-Gene Substitution Frequency vs. Frequency Rank: UniqueSeqs-Sept", "fontSize":14}
-                                            )
-
-            # Save the plot as an .html.
-            substitution_frequency_ranks_plot.save('{0}_{1}_substitution_frequency_ranks_plot.html'.format(dataset_name, variant_name))
+            # Create the substitution frequency ranks plot and save it as an .html.
+            scheduler.submit('{0}_{1}_substitution_frequency_ranks_plot.html'.format(dataset_name, variant_name),
+                             build_frequency_ranks_plot,
+                             substitution_frequency_ranks,
+                             'Frequency Rank of All Subtitution Positions in the S-gene',
+                             'Cumulative '+variant_name+' S-gene Substitution Frequency')
             
             # Get the deletion frequency ranks.
             deletion_frequency_ranks = frequency_ranks_data[dataset_name][variant_name]['deletions']
             
-            # Create the deletion frequency ranks plot.
-            deletion_frequency_ranks_plot = alt.Chart(substitution_frequency_ranks).mark_line(color='black').encode(
+            # Create the deletion frequency ranks plot and save it as an .html.
+            scheduler.submit('{0}_{1}_deletion_frequency_ranks_plot.html'.format(dataset_name, variant_name),
+                             build_frequency_ranks_plot,
+                             substitution_frequency_ranks,
+                             'Frequency Rank of All Deletion Positions in the S-gene',
+                             'Cumulative '+variant_name+' S-gene Deletion Frequency')
+    
+    # Wait for the plots to be saved.
+    scheduler.wait()
+
+def build_frequency_ranks_plot(frequency_ranks, rank_title, frequency_title):
+    """
+    Builds a frequency rank plot.
+    
+    Parameters: frequency_ranks - the DataFrame of 'Frequency Rank' and 'Variant Frequency' pairs
+                rank_title - the title of the frequency rank axis
+                frequency_title - the title of the variant frequency axis
+    
+    Returns:    the Altair Chart of the frequency ranks
+    """
+    return alt.Chart(frequency_ranks).mark_line(color='black').encode(
                                              x = alt.X('Frequency Rank',
-                                             title='Frequency Rank of All Deletion Positions in the S-gene', 
+                                             title=rank_title, 
                                              axis=alt.Axis(titleFontSize=14, 
                                              labelFontSize=12)),
                                              y = alt.Y('Variant Frequency', 
-                                             axis=alt.Axis(title='Cumulative '+variant_name+' S-gene Deletion Frequency', 
+                                             axis=alt.Axis(title=frequency_title, 
                                              titleFontSize=14, 
                                              labelFontSize=12)),).properties(
                                              width=900,
@@ -416,9 +367,6 @@ def generate_frequency_rank_plots(datasets, variants, frequency_ranks_data):
                                              #title={"text":"Cumulative Omicron BA.1 S-Gene Substitution Frequency vs. Frequency Rank: UniqueSeqs-Sept", "fontSize":14}
                                             )
 
-            # Save the plot as an .html.
-            deletion_frequency_ranks_plot.save('{0}_{1}_deletion_frequency_ranks_plot.html'.format(dataset_name, variant_name))
-
 def get_plotted_attributes(variant_name):
     """
     Generates a list of attributes to be plotted in the mutation frequency plots.
@@ -438,15 +386,19 @@ def get_plotted_attributes(variant_name):
     return plotted_attributes
     
 
-def generate_black_and_white_mutation_frequency_plots(datasets, variants, frequency_ranks_data):
+def generate_black_and_white_mutation_frequency_plots(datasets, variants, frequency_ranks_data, scheduler=None):
     """
     Generates the black and white mutation frequency plots.
     
     Parameters: datasets - the dictionary of dataset information
                 variants - the dictionary of variant information
                 frequency_ranks_data - the dictionary of frequency ranks information
+                scheduler - the ChartScheduler saving the plots, or None to save them in this process
     """
     
+    # Save the plots in this process if no scheduler was passed.
+    scheduler = scheduler or ChartScheduler()
+    
     # For each dataset:
     for dataset in datasets.values():
         # For each variant:
@@ -484,50 +436,69 @@ def generate_black_and_white_mutation_frequency_plots(datasets, variants, freque
                 # Subset for the plotting range.
                 plotted_subset = data_subset[(data_subset['Nucleotide Position'] >= plotting_range['start']) & (data_subset['Nucleotide Position'] <= plotting_range['end'])]
                 
-                # Generate the top plot.
-                plot_top = alt.Chart(plotted_subset).transform_fold(plotted_attributes).mark_bar(width=1, color='black').encode(
-                           x =alt.X('Nucleotide Position', axis=alt.Axis(title='Nucleotide Positions of the S-gene', titleFontSize=14, labelFontSize=12), scale=alt.Scale(nice=False)),
-                           y= alt.Y('value:Q', scale=alt.Scale(domain=[0,1]),axis=alt.Axis(title='Mutation Frequency', titleFontSize=14, labelFontSize=12)),
-                           #color=alt.Color('key:N', scale=alt.Scale(range=category_colors), title='Mutation Category'),
-                           tooltip=['Nucleotide Position','Amino Acid Position:N','Substitution_Freq', 'Deletion_Freq']).properties(
-                           width=800,
-                           height=150,
-                           #title={"text":'Mutation Frequency vs. S-Gene Nucleic Acid Index: Subset of UniqueSeqs-Sept Containing All Omicron S-Gene BA.1 Substitutions', "fontSize":14}
-                        )
-                
-                # Add the subplots dividing the mutation category as rows.
-                subplots_bottom = alt.Chart(plotted_subset).transform_fold(plotted_attributes).mark_bar(width=1, color='black').encode(
-                x =alt.X('Nucleotide Position', axis=alt.Axis(title='Nucleotide Positions of the S-gene', titleFontSize=14, labelFontSize=12), scale=alt.Scale(nice=False)),
-                y= alt.Y('value:Q', scale=alt.Scale(domain=[0,1]), axis=alt.Axis(title='Mutation Frequency', titleFontSize=12, labelFontSize=12)),
-                #color=alt.Color('key:N', scale=alt.Scale(range=category_colors), title='Mutation Category'),
-                tooltip=['Nucleotide Position','Amino Acid Position:N','Substitution_Freq', 'Deletion_Freq'],
-                row=alt.Row('key:N', title='Mutation Category', header=alt.Header(titleFontSize=14,labelFontSize=12))).properties(
-                width=800,
-                height=150,
-                #title='Mutation Frequency vs. S-Gene Nucleic Acid Index: Pre-Omicron Mutation Subset Containing All Omicron S-Gene BA.1 Substitutions'
-                ).resolve_scale(x='independent')
-                
                 # Save the plot as a .html file.
                 print("Saving: {}_{}_at_{}_black_and_white_separated_mutation_frequency_plots.html".format(dataset['name'],
                                                                                                                          variant['name'],
                                                                                                                          plotting_range['name']))
-                                                                                                                         
-                (plot_top & subplots_bottom).save('{}_{}_at_{}_black_and_white_separated_mutation_frequency_plots.html'.format(dataset['name'],
-                                                                                                                         variant['name'],
-                                                                                                                         plotting_range['name']))
+                
+                # Generate the top plot and the subplots dividing the mutation category as rows, and save them.
+                scheduler.submit('{}_{}_at_{}_black_and_white_separated_mutation_frequency_plots.html'.format(dataset['name'],
+                                                                                                            variant['name'],
+                                                                                                            plotting_range['name']),
+                                 build_black_and_white_mutation_frequency_plot,
+                                 plotted_subset,
+                                 plotted_attributes)
+    
+    # Wait for the plots to be saved.
+    scheduler.wait()
 
+def build_black_and_white_mutation_frequency_plot(plotted_subset, plotted_attributes):
+    """
+    Builds a black and white mutation frequency plot, with the mutation categories as rows below it.
+    
+    Parameters: plotted_subset - the subset of the dataset in the plotting range
+                plotted_attributes - the list of plotted attributes
+    
+    Returns:    the combined Altair chart
+    """
+    
+    # Generate the top plot.
+    plot_top = alt.Chart(plotted_subset).transform_fold(plotted_attributes).mark_bar(width=1, color='black').encode(
+               x =alt.X('Nucleotide Position', axis=alt.Axis(title='Nucleotide Positions of the S-gene', titleFontSize=14, labelFontSize=12), scale=alt.Scale(nice=False)),
+               y= alt.Y('value:Q', scale=alt.Scale(domain=[0,1]),axis=alt.Axis(title='Mutation Frequency', titleFontSize=14, labelFontSize=12)),
+               #color=alt.Color('key:N', scale=alt.Scale(range=category_colors), title='Mutation Category'),
+               tooltip=['Nucleotide Position','Amino Acid Position:N','Substitution_Freq', 'Deletion_Freq']).properties(
+               width=800,
+               height=150,
+               #title={"text":'Mutation Frequency vs. S-Gene Nucleic Acid Index: Subset of UniqueSeqs-Sept Containing All Omicron S-Gene BA.1 Substitutions', "fontSize":14}
+            )
+    
+    # Add the subplots dividing the mutation category as rows.
+    subplots_bottom = alt.Chart(plotted_subset).transform_fold(plotted_attributes).mark_bar(width=1, color='black').encode(
+    x =alt.X('Nucleotide Position', axis=alt.Axis(title='Nucleotide Positions of the S-gene', titleFontSize=14, labelFontSize=12), scale=alt.Scale(nice=False)),
+    y= alt.Y('value:Q', scale=alt.Scale(domain=[0,1]), axis=alt.Axis(title='Mutation Frequency', titleFontSize=12, labelFontSize=12)),
+    #color=alt.Color('key:N', scale=alt.Scale(range=category_colors), title='Mutation Category'),
+    tooltip=['Nucleotide Position','Amino Acid Position:N','Substitution_Freq', 'Deletion_Freq'],
+    row=alt.Row('key:N', title='Mutation Category', header=alt.Header(titleFontSize=14,labelFontSize=12))).properties(
+    width=800,
+    height=150,
+    #title='Mutation Frequency vs. S-Gene Nucleic Acid Index: Pre-Omicron Mutation Subset Containing All Omicron S-Gene BA.1 Substitutions'
+    ).resolve_scale(x='independent')
+    
+    return plot_top & subplots_bottom
 
-def generate_dataset_comparison_plots(datasets, variants, frequency_ranks_data):
+def generate_dataset_comparison_plots(datasets, variants, frequency_ranks_data, scheduler=None):
     """
     Generate the dataset comparison plots and save them as .html files.
     
     Parameters: datasets - the dictionary containing the dataset information
                 variants - the dictionary containing the variant information
                 frequency_ranks_data - the dictionary containing the frequency ranks data
+                scheduler - the ChartScheduler saving the plots, or None to save them in this process
     """
     
-    # Set the plotting colors for the plotted attributes.
-    category_colors = ['#984ea3', '#377eb8', '#4daf4a', '#e41a1c']
+    # Save the plots in this process if no scheduler was passed.
+    scheduler = scheduler or ChartScheduler()
     
     # For each pair of datasets:
     for first_dataset in datasets.values():
@@ -558,44 +529,72 @@ def generate_dataset_comparison_plots(datasets, variants, frequency_ranks_data):
                         second_plotted_subset = second_subset[(second_subset['Nucleotide Position'] >= plotting_range['start']) & (second_subset['Nucleotide Position'] <= plotting_range['end'])]
                         
                         
-                        # Generate the two plots.
-                        first_dataset_plot = alt.Chart(first_plotted_subset).transform_fold(plotted_attributes
-                        ).mark_bar(width=1, color='black').encode(
-                            x =alt.X('Nucleotide Position', axis=alt.Axis(title='Nucleotide Positions of the S-gene', titleFontSize=14, labelFontSize=12), scale=alt.Scale(nice=False)),
-                            y= alt.Y('value:Q', scale=alt.Scale(domain=[0,1]),axis=alt.Axis(title='Mutation Frequency',titleFontSize=14, labelFontSize=12)),
-                            color=alt.Color('key:N', legend=alt.Legend(titleFontSize=14, labelFontSize=12, labelLimit=300), scale=alt.Scale(range=category_colors), title='Mutation Category'),
-                            tooltip=['Nucleotide Position','Amino Acid Position:N','Substitution_Freq', 'Deletion_Freq']).properties(
-                            width=800,
-                            height=150,
-                            title={'text':'Subset of ' + first_dataset['name'],"fontSize":14,
-                            #       'subtitle':'Index: 1000-2500', "subtitleFontSize":14
-                            }
-                        )
-
-                        # Create the second hotspot plot for the new data, and combine the two plots.
-                        second_dataset_plot = alt.Chart(second_plotted_subset).transform_fold(plotted_attributes
-                        ).mark_bar(width=1, color='black').encode(
-                            x =alt.X('Nucleotide Position', axis=alt.Axis(title='Nucleotide Positions of the S-gene', titleFontSize=14, labelFontSize=12), scale=alt.Scale(nice=False)),
-                            y= alt.Y('value:Q', scale=alt.Scale(domain=[0,1]),axis=alt.Axis(title='Mutation Frequency',titleFontSize=14, labelFontSize=12)),
-                            color=alt.Color('key:N', scale=alt.Scale(range=category_colors), title='Mutation Category'),
-                            tooltip=['Nucleotide Position','Amino Acid Position:N','Substitution_Freq', 'Deletion_Freq']).properties(
-                            width=800,
-                            height=150,
-                            title={'text':'Subset of '+ second_dataset['name'],"fontSize":14,
-                            #       'subtitle':'Index: 1000-2500', "subtitleFontSize":14
-                            }
-                        )
-
                         # Save the .html file.
                         print("Saving: {}_vs_{}_{}_at_{}_comparison_mutation_frequency_plot.html".format(first_dataset['name'], 
                                                                                                          second_dataset['name'], 
                                                                                                          variant['name'],
                                                                                                          plotting_range['name']))
+                        
+                        # Generate the two plots, combine them and save them.
+                        scheduler.submit('{}_vs_{}_{}_at_{}_comparison_mutation_frequency_plot.html'.format(first_dataset['name'],
+                                                                                                           second_dataset['name'],
+                                                                                                           variant['name'],
+                                                                                                           plotting_range['name']),
+                                         build_dataset_comparison_plot,
+                                         first_plotted_subset,
+                                         second_plotted_subset,
+                                         plotted_attributes,
+                                         first_dataset['name'],
+                                         second_dataset['name'])
+    
+    # Wait for the plots to be saved.
+    scheduler.wait()
 
-                        (first_dataset_plot & second_dataset_plot).save('{}_vs_{}_{}_at_{}_comparison_mutation_frequency_plot.html'.format(first_dataset['name'],
-                                                                                                                                           second_dataset['name'],
-                                                                                                                                           variant['name'],
-                                                                                                                                           plotting_range['name']))
+def build_dataset_comparison_plot(first_plotted_subset, second_plotted_subset, plotted_attributes, first_dataset_name, second_dataset_name):
+    """
+    Builds a color dataset comparison plot, with the first dataset on top.
+    
+    Parameters: first_plotted_subset - the subset of the first dataset in the plotting range
+                second_plotted_subset - the subset of the second dataset in the plotting range
+                plotted_attributes - the list of plotted attributes
+                first_dataset_name - the name of the first dataset
+                second_dataset_name - the name of the second dataset
+    
+    Returns:    the combined Altair chart
+    """
+    
+    # Set the plotting colors for the plotted attributes.
+    category_colors = ['#984ea3', '#377eb8', '#4daf4a', '#e41a1c']
+    
+    # Generate the two plots.
+    first_dataset_plot = alt.Chart(first_plotted_subset).transform_fold(plotted_attributes
+    ).mark_bar(width=1, color='black').encode(
+        x =alt.X('Nucleotide Position', axis=alt.Axis(title='Nucleotide Positions of the S-gene', titleFontSize=14, labelFontSize=12), scale=alt.Scale(nice=False)),
+        y= alt.Y('value:Q', scale=alt.Scale(domain=[0,1]),axis=alt.Axis(title='Mutation Frequency',titleFontSize=14, labelFontSize=12)),
+        color=alt.Color('key:N', legend=alt.Legend(titleFontSize=14, labelFontSize=12, labelLimit=300), scale=alt.Scale(range=category_colors), title='Mutation Category'),
+        tooltip=['Nucleotide Position','Amino Acid Position:N','Substitution_Freq', 'Deletion_Freq']).properties(
+        width=800,
+        height=150,
+        title={'text':'Subset of ' + first_dataset_name,"fontSize":14,
+        #       'subtitle':'Index: 1000-2500', "subtitleFontSize":14
+        }
+    )
+    
+    # Create the second hotspot plot for the new data, and combine the two plots.
+    second_dataset_plot = alt.Chart(second_plotted_subset).transform_fold(plotted_attributes
+    ).mark_bar(width=1, color='black').encode(
+        x =alt.X('Nucleotide Position', axis=alt.Axis(title='Nucleotide Positions of the S-gene', titleFontSize=14, labelFontSize=12), scale=alt.Scale(nice=False)),
+        y= alt.Y('value:Q', scale=alt.Scale(domain=[0,1]),axis=alt.Axis(title='Mutation Frequency',titleFontSize=14, labelFontSize=12)),
+        color=alt.Color('key:N', scale=alt.Scale(range=category_colors), title='Mutation Category'),
+        tooltip=['Nucleotide Position','Amino Acid Position:N','Substitution_Freq', 'Deletion_Freq']).properties(
+        width=800,
+        height=150,
+        title={'text':'Subset of '+ second_dataset_name,"fontSize":14,
+        #       'subtitle':'Index: 1000-2500', "subtitleFontSize":14
+        }
+    )
+    
+    return first_dataset_plot & second_dataset_plot
 
 def print_high_frequency_substitution_or_deletion_positions(datasets):
     """
@@ -625,35 +624,50 @@ def print_high_frequency_substitution_or_deletion_positions(datasets):
 
 # If the user runs the file:    
 if __name__ == '__main__':
+    # Parse the command line arguments.
+    parser = argparse.ArgumentParser(description='Finds the variant mutations in the datasets listed in finder_data.in and variant_data.in.')
+    add_profile_arguments(parser)
+    add_loader_arguments(parser)
+    add_chart_arguments(parser)
+    args = parser.parse_args()
+    profiler = profiler_from_arguments(args, 'general_variant_finder')
+    scheduler = chart_scheduler_from_arguments(args)
+    
     print("Output of general_variant_finder.py")
     print("Generated at {}.\n".format(datetime.datetime.now()))
     print("!Importing datasets.\n")
-    datasets = import_counts_freqs_data()
+    datasets = profiler.call("Importing datasets", import_counts_freqs_data, cache_directory_from_arguments(args))
     
     print("!Importing variant information.\n")
-    variants = import_variant_data()
+    variants = profiler.call("Importing variant information", import_variant_data)
     
     print("!Printing the numbers of mutations in each dataset.\n")
-    print_numbers_of_variant_mutations(variants)
+    profiler.call("Printing the numbers of mutations in each dataset", print_numbers_of_variant_mutations, variants)
     
     print("!Adding mutation classification attributes.\n")
-    add_mutation_classification_attributes(datasets, variants)
+    profiler.call("Adding mutation classification attributes", add_mutation_classification_attributes, datasets, variants)
     
     print("!Printing the variant counts in each dataset.\n")
-    print_variant_counts_in_each_dataset(datasets, variants)
+    profiler.call("Printing the variant counts in each dataset", print_variant_counts_in_each_dataset, datasets, variants)
     
     print("Finding frequency ranks data.\n")
-    frequency_ranks_data = find_variant_frequency_ranks_per_dataset(datasets, variants)
+    frequency_ranks_data = profiler.call("Finding frequency ranks data", find_variant_frequency_ranks_per_dataset, datasets, variants)
     
     print("!Plotting the substitution and deletion frequency rank plots for each dataset.\n")
-    generate_frequency_rank_plots(datasets, variants, frequency_ranks_data)
+    profiler.call("Plotting the frequency rank plots", generate_frequency_rank_plots, datasets, variants, frequency_ranks_data, scheduler)
     
     print("!Generating black and white mutation frequency plots.\n")
-    generate_black_and_white_mutation_frequency_plots(datasets, variants, frequency_ranks_data)
+    profiler.call("Generating black and white mutation frequency plots", generate_black_and_white_mutation_frequency_plots, datasets, variants, frequency_ranks_data, scheduler)
     
     print("\n!Generating color dataset comparison plots.\n")
-    generate_dataset_comparison_plots(datasets, variants, frequency_ranks_data)
+    profiler.call("Generating color dataset comparison plots", generate_dataset_comparison_plots, datasets, variants, frequency_ranks_data, scheduler)
     
     print("\n!Printing high frequency substitution or deletion positions.\n")
-    print_high_frequency_substitution_or_deletion_positions(datasets)
+    profiler.call("Printing high frequency positions", print_high_frequency_substitution_or_deletion_positions, datasets)
+    
+    # Wait for the last charts and print the summary of the saved and failed charts.
+    scheduler.close()
+    
+    # Write the profile, if --profile was passed.
+    profiler.write()
     
\ No newline at end of file
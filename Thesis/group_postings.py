@@ -0,0 +1,180 @@
+# Filename: group_postings.py
+# Tool Name: Group Postings
+#
+# Compact storage for the groups of every (position, nucleotide) cell in the mutation counts.
+# While counting, each mutation event is appended to growable typed arrays (the cell, the uint32 group_id and the
+# uint32 weight, which is the number of sequences the event stands for).
+# When frozen, the events are grouped by cell into CSR form: an offsets array and flat uint32 arrays of group_ids and weights.
+# The count of a cell is the sum of the weights of its postings, so no separate count has to be kept.
+# Frozen postings are saved as a directory of .npy files, which can be memory-mapped so that the groups
+# of a single position are read without loading the whole file.
+
+
+# Import required libraries.
+import os
+from array import array
+import numpy as np
+from alignment_arrays import NUCLEOTIDES
+
+
+class GroupPostings:
+    """
+    Stores the group_ids of the mutation events for each (position, nucleotide) cell.
+
+    Attributes: length      - the number of nucleotide positions
+                cell_buffer - the growable uint32 array of the cell of each new event
+                group_buffer - the growable uint32 array of the group_id of each new event
+                weight_buffer - the growable uint32 array of the weight of each new event
+                offsets     - the frozen CSR offsets, where the groups of cell c are groups[offsets[c]:offsets[c + 1]]
+                groups      - the frozen uint32 array of group_ids
+                weights     - the frozen uint32 array of weights
+    """
+
+    def __init__(self, length=3822):
+        self.length = length
+        self.cell_buffer = array('I')
+        self.group_buffer = array('I')
+        self.weight_buffer = array('I')
+        self.offsets = np.zeros(length * len(NUCLEOTIDES) + 1, dtype=np.int64)
+        self.groups = np.zeros(0, dtype=np.uint32)
+        self.weights = np.zeros(0, dtype=np.uint32)
+
+    def __repr__(self):
+        return 'GroupPostings({} positions, {} events)'.format(self.length, len(self.groups) + len(self.group_buffer))
+
+    def add(self, positions, columns, group_ids, weights=1):
+        """
+        Appends one event for each mutated (position, nucleotide column).
+
+        Parameters: positions - the array of mutated positions
+                    columns   - the array of count matrix columns
+                    group_ids - the group_id of every event, or a single group_id for all of them
+                    weights   - the number of sequences each event stands for, or a single weight for all of them
+        """
+        cells = np.asarray(positions, dtype=np.uint32) * len(NUCLEOTIDES) + np.asarray(columns, dtype=np.uint32)
+        self.cell_buffer.frombytes(cells.tobytes())
+        self.group_buffer.frombytes(np.broadcast_to(np.asarray(group_ids, dtype=np.uint32), cells.shape).tobytes())
+        self.weight_buffer.frombytes(np.broadcast_to(np.asarray(weights, dtype=np.uint32), cells.shape).tobytes())
+
+    def merge(self, other):
+        """
+        Appends the events of another GroupPostings after the events of this one.
+
+        Parameter: other - the other GroupPostings
+        """
+        other.freeze()
+        other_cells = np.repeat(np.arange(len(other.offsets) - 1, dtype=np.uint32), np.diff(other.offsets))
+        self.cell_buffer.frombytes(other_cells.tobytes())
+        self.group_buffer.frombytes(other.groups.tobytes())
+        self.weight_buffer.frombytes(other.weights.tobytes())
+
+    def freeze(self):
+        """
+        Moves the buffered events into the CSR arrays.
+        The stable sort keeps the groups of each cell in the order they were added.
+        """
+
+        # If there are no buffered events, the CSR arrays are up to date.
+        if len(self.cell_buffer) == 0:
+            return
+
+        # Combine the frozen events with the buffered events.
+        cells = np.concatenate((np.repeat(np.arange(len(self.offsets) - 1, dtype=np.uint32), np.diff(self.offsets)),
+                                np.frombuffer(self.cell_buffer, dtype=np.uint32)))
+        groups = np.concatenate((self.groups, np.frombuffer(self.group_buffer, dtype=np.uint32)))
+        weights = np.concatenate((self.weights, np.frombuffer(self.weight_buffer, dtype=np.uint32)))
+
+        # Group the events by cell.
+        order = np.argsort(cells, kind='stable')
+        self.groups = groups[order]
+        self.weights = weights[order]
+        self.offsets = np.zeros(len(self.offsets), dtype=np.int64)
+        np.cumsum(np.bincount(cells, minlength=len(self.offsets) - 1), out=self.offsets[1:])
+
+        # Empty the buffers.
+        self.cell_buffer = array('I')
+        self.group_buffer = array('I')
+        self.weight_buffer = array('I')
+
+    def save(self, directory):
+        """
+        Saves the frozen postings as offsets.npy, groups.npy and weights.npy in a directory.
+
+        Parameter: directory - the path to the output directory
+        """
+        self.freeze()
+        os.makedirs(directory, exist_ok=True)
+        np.save(os.path.join(directory, 'offsets.npy'), self.offsets)
+        np.save(os.path.join(directory, 'groups.npy'), self.groups)
+        np.save(os.path.join(directory, 'weights.npy'), self.weights)
+
+    @classmethod
+    def load(cls, directory, mmap_mode='r'):
+        """
+        Loads postings saved with save().
+
+        Parameters: directory - the path to the saved postings
+                    mmap_mode - the numpy memory-map mode, or None to read the arrays into memory
+
+        Returns:    postings - the GroupPostings
+        """
+        offsets = np.load(os.path.join(directory, 'offsets.npy'), mmap_mode=mmap_mode)
+        postings = cls((len(offsets) - 1) // len(NUCLEOTIDES))
+        postings.offsets = offsets
+        postings.groups = np.load(os.path.join(directory, 'groups.npy'), mmap_mode=mmap_mode)
+
+        # Postings saved before weights were stored have a weight of 1 for every event.
+        if os.path.exists(os.path.join(directory, 'weights.npy')):
+            postings.weights = np.load(os.path.join(directory, 'weights.npy'), mmap_mode=mmap_mode)
+        else:
+            postings.weights = np.ones(len(postings.groups), dtype=np.uint32)
+        return postings
+
+    def counts(self):
+        """
+        Gets the mutation counts from the summed weights of the postings.
+
+        Returns: the (length x 5) count matrix
+        """
+        self.freeze()
+        cumulative_weights = np.concatenate(([0], np.cumsum(self.weights, dtype=np.int64)))
+        return np.diff(cumulative_weights[self.offsets]).reshape(self.length, len(NUCLEOTIDES))
+
+    def groups_at(self, position, nuc):
+        """
+        Gets the group_ids of one cell.
+
+        Parameters: position - the nucleotide index
+                    nuc      - the nucleotide character
+
+        Returns:    the uint32 array of group_ids
+        """
+        self.freeze()
+        cell = position * len(NUCLEOTIDES) + NUCLEOTIDES.index(nuc)
+        return self.groups[self.offsets[cell]:self.offsets[cell + 1]]
+
+    def to_legacy_dict(self):
+        """
+        Builds the legacy mutation_counts structure, a list with a {nuc: {'Count', 'Groups'}} dictionary for each position.
+        Nucleotides without any groups are left out, as simplify_counts_dict did.
+
+        Returns: mutation_counts - the list of dictionaries
+        """
+        self.freeze()
+        mutation_counts = [{} for i in range(self.length)]
+        offsets = self.offsets.tolist()
+        counts = self.counts().ravel().tolist()
+        for cell in np.flatnonzero(np.diff(self.offsets)).tolist():
+            groups = self.groups[offsets[cell]:offsets[cell + 1]].tolist()
+            mutation_counts[cell // len(NUCLEOTIDES)][NUCLEOTIDES[cell % len(NUCLEOTIDES)]] = {'Count': counts[cell], 'Groups': groups}
+        return mutation_counts
+
+def load_legacy_counts(directory):
+    """
+    Loads saved postings and rebuilds the legacy mutation_counts list of dictionaries.
+
+    Parameter: directory - the path to the saved postings
+
+    Returns:   mutation_counts - the list with a {nuc: {'Count', 'Groups'}} dictionary for each position
+    """
+    return GroupPostings.load(directory).to_legacy_dict()
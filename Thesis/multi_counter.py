@@ -0,0 +1,372 @@
+# Filename: multi_counter.py
+# Tool Name: Multi Counter
+#
+# Required input files:
+# A multi-alignment file in the .maf format passed in the command line.
+#
+# Output file names (for each gene, S by default):
+# new_mutation_counts_freq_for_<gene>_all.csv
+# test13_above97_mutation_counts/ (test13_above97_mutation_counts_<gene>/ for the other genes)
+# multi_deletion_counts_freq_for_<gene>_all.csv
+# multi_deletion_lengths_counts_freq_for_<gene>_all.csv
+#
+# Runs the analyses of multi_mutation_counter.py and multi_deletion_counter.py in a single pass over the file.
+# Each sequence pair is read and has its insertion columns removed once, and is then passed to every
+# analysis (visitor) that was selected on the command line.
+# With --genes, the file holds whole genome alignments, and every analysis is run on each selected gene.
+# The events found in recently seen sequence pairs are cached, so a repeated pair is not compared again.
+
+
+# Import required libraries.
+import argparse
+from functools import partial
+from gene_reader import dna_reader
+from alignment_arrays import fix_sequences, stack_sequences, fix_sequence_block, find_mutations, find_deletion_runs
+from multi_maf_reader import read_alignment_pairs, read_alignment_batches, read_weights
+from sharded_counting import ProgressPrinter, run_sharded
+from checkpoints import add_checkpoint_arguments, checkpointer_from_arguments, count_shard_with_checkpoints, update_state
+from deletion_events import DeletionEventCounter
+from gene_sets import GENOME_LENGTH, select_genes
+from event_cache import EventCache
+from counter_metrics import metrics, add_metrics_arguments, configure_metrics_from_arguments
+from step_profiler import add_profile_arguments, profiler_from_arguments
+from count_writers import add_output_arguments
+import multi_mutation_counter
+import multi_deletion_counter
+
+
+class SubstitutionVisitor:
+    """
+    Counts the substitutions and single nucleotide deletions at each position (multi_mutation_counter.py).
+
+    Attributes: gene            - the protein name of the gene
+                columns         - the slice of the aligned sequences covering the gene
+                mutation_counts - the GroupPostings containing the mutation counts
+    """
+
+    def __init__(self, gene='S', start=0, length=3822):
+        self.gene = gene
+        self.columns = slice(start, start + length)
+        self.mutation_counts = multi_mutation_counter.new_mutation_counts(length)
+
+    def find_events(self, reference, other):
+        """
+        Finds the mutations in one sequence pair without insertion columns.
+
+        Parameters: reference - the reference sequence
+                    other     - the other/variant sequence
+
+        Returns:    the (positions, columns) arrays of the mutations
+        """
+        return find_mutations(reference[self.columns], other[self.columns])
+
+    def add_events(self, events, group_id, weight=1):
+        """
+        Counts the mutations found by find_events.
+
+        Parameters: events   - the (positions, columns) arrays of the mutations
+                    group_id - the group_id for the sequence pair
+                    weight   - the multiplicity of the sequence pair
+        """
+        self.mutation_counts.add(*events, group_id, weight)
+
+    def visit_block(self, reference_block, other_block, group_ids, weights=None):
+        """
+        Counts the mutations in a block of sequence pairs without insertion columns.
+
+        Parameters: reference_block - the (N x L) matrix of aligned reference sequences
+                    other_block     - the (N x L) matrix of aligned other/variant sequences
+                    group_ids       - the list of group_ids for the sequence pairs
+                    weights         - the list of multiplicities for the sequence pairs, or None for 1 each
+        """
+        multi_mutation_counter.compare_sequence_block(reference_block[:, self.columns], other_block[:, self.columns], self.mutation_counts, group_ids, weights)
+
+    def merge(self, other):
+        """
+        Adds the counts of the same analysis from a later shard of the file.
+
+        Parameter: other - the SubstitutionVisitor of the later shard
+        """
+        self.mutation_counts.merge(other.mutation_counts)
+
+    def write(self, sequence_number, output_format='csv'):
+        """
+        Writes new_mutation_counts_freq_for_<gene>_all.csv and the saved mutation counts.
+
+        Parameters: sequence_number - the total number of sequences
+                    output_format   - the format of the count/frequency files (see count_writers.py)
+        """
+        deletion_counts = [0 for i in range(self.mutation_counts.length)]
+        multi_mutation_counter.fill_deletion_counts(self.mutation_counts, deletion_counts)
+        multi_mutation_counter.simplify_counts_dict(self.mutation_counts)
+        multi_mutation_counter.save_mutation_counts(self.mutation_counts, self.gene)
+        multi_mutation_counter.counts_to_file(self.mutation_counts, deletion_counts, sequence_number, self.gene, output_format)
+
+class DeletionVisitor:
+    """
+    Counts the contiguous deletions and deletion lengths (multi_deletion_counter.py).
+
+    Attributes: gene - the protein name of the gene
+                columns - the slice of the aligned sequences covering the gene
+                deletion_counter - the DeletionEventCounter containing the contiguous deletion counts
+                num_sequences_with_deletions - the number of sequences with deletions
+    """
+
+    def __init__(self, gene='S', start=0, length=3822):
+        self.gene = gene
+        self.columns = slice(start, start + length)
+        self.deletion_counter = DeletionEventCounter()
+        self.num_sequences_with_deletions = 0
+
+    def find_events(self, reference, other):
+        """
+        Finds the contiguous deletions in one sequence pair without insertion columns.
+
+        Parameters: reference - the reference sequence
+                    other     - the other/variant sequence
+
+        Returns:    the (rows, starts, lengths) arrays of the deletions
+        """
+        return find_deletion_runs(other[self.columns])
+
+    def add_events(self, events, group_id, weight=1):
+        """
+        Counts the contiguous deletions found by find_events.
+
+        Parameters: events   - the (rows, starts, lengths) arrays of the deletions
+                    group_id - the group_id for the sequence pair
+                    weight   - the multiplicity of the sequence pair
+        """
+        self.deletion_counter.add_runs(*events, [weight])
+        if len(events[1]) > 0:
+            self.num_sequences_with_deletions += weight
+
+    def visit_block(self, reference_block, other_block, group_ids, weights=None):
+        """
+        Counts the contiguous deletions in a block of sequence pairs without insertion columns.
+
+        Parameters: reference_block - the (N x L) matrix of aligned reference sequences
+                    other_block     - the (N x L) matrix of aligned other/variant sequences
+                    group_ids       - the list of group_ids for the sequence pairs
+                    weights         - the list of multiplicities for the sequence pairs, or None for 1 each
+        """
+        self.num_sequences_with_deletions += multi_deletion_counter.count_contiguous_deletion_block(other_block[:, self.columns], self.deletion_counter, weights)
+
+    def merge(self, other):
+        """
+        Adds the counts of the same analysis from a later shard of the file.
+
+        Parameter: other - the DeletionVisitor of the later shard
+        """
+        self.deletion_counter.merge(other.deletion_counter)
+        self.num_sequences_with_deletions += other.num_sequences_with_deletions
+
+    def write(self, sequence_number, output_format='csv'):
+        """
+        Writes multi_deletion_counts_freq_for_<gene>_all.csv and multi_deletion_lengths_counts_freq_for_<gene>_all.csv.
+
+        Parameters: sequence_number - the total number of sequences
+                    output_format   - the format of the count/frequency files (see count_writers.py)
+        """
+        multi_deletion_counter.contiguous_deletion_counts_to_file(self.deletion_counter, sequence_number, self.num_sequences_with_deletions, self.gene, output_format)
+        multi_deletion_counter.deletion_lengths_to_file(self.deletion_counter, sequence_number, self.gene, output_format)
+
+# The available analyses.
+ANALYSES = {'substitutions': SubstitutionVisitor,
+            'deletions': DeletionVisitor}
+
+
+# The main function.
+def main():
+
+    # Parse the command line arguments.
+    parser = argparse.ArgumentParser(description='Counts the substitutions and contiguous deletions in the S-gene, or in each selected gene, in a single pass.')
+    parser.add_argument('maf_file', help='the multi alignment .maf file, optionally gzip, bgzip or zstd compressed, or - for stdin')
+    parser.add_argument('--analyses', default=','.join(ANALYSES), help='the comma separated analyses to run: ' + ', '.join(ANALYSES))
+    parser.add_argument('--genes', help='the comma separated protein names of the genes to count in whole genome alignments (by default, the file holds S-gene alignments)')
+    parser.add_argument('--genome-length', type=int, default=GENOME_LENGTH, help='the length of the reference genome in the whole genome alignments')
+    parser.add_argument('--batch-size', type=int, default=1, help='the number of sequence pairs processed together as one block')
+    parser.add_argument('--workers', type=int, default=1, help='the number of worker processes, each counting one shard of the file')
+    parser.add_argument('--cache-size', type=int, default=10000, help='the number of recent unique sequence pairs whose events are reused, or 0 for no cache')
+    parser.add_argument('--weights', help='the file with the multiplicity of each group_id, for files of collapsed unique sequences')
+    parser.add_argument('--state', help='the state file with the raw counts of earlier runs, which the counts of this file are added to')
+    add_checkpoint_arguments(parser, 'multi_counter_checkpoints')
+    add_metrics_arguments(parser)
+    add_profile_arguments(parser)
+    add_output_arguments(parser)
+    args = parser.parse_args()
+    checkpointer = checkpointer_from_arguments(args)
+    configure_metrics_from_arguments(args, 'multi_counter')
+    profiler = profiler_from_arguments(args, 'multi_counter')
+
+    # Make sure every requested analysis exists.
+    analysis_names = args.analyses.split(',')
+    for analysis_name in analysis_names:
+        if analysis_name not in ANALYSES:
+            parser.error('unknown analysis: {}'.format(analysis_name))
+
+    # Import the gene information.
+    genes = profiler.call("Importing the gene information", dna_reader)
+
+    # Get the genes to count and the length of the aligned sequences.
+    # Without --genes, the aligned sequences are the S-gene itself.
+    if args.genes is None:
+        gene_set = [('S', 0, 3822)]
+        alignment_length = 3822
+    else:
+        gene_set = select_genes(genes, args.genes.split(','))
+        alignment_length = args.genome_length
+
+    # Read the multiplicity of each group, if a weights file was passed.
+    weights = read_weights(args.weights) if args.weights is not None else None
+
+    with profiler.step("Counting the sequence pairs"):
+        # If more than one worker was requested, count the shards of the file in parallel and merge them.
+        if args.workers > 1:
+            shard_results = run_sharded(count_shard_with_checkpoints, args.maf_file, args.workers, 'temp_multi_counter.txt', checkpointer, count_shard, args.batch_size, args.cache_size, weights, analysis_names, gene_set, alignment_length)
+            sequence_number, visitors = merge_shard_counts(shard_results)
+
+        # Otherwise, count the whole file in this process.
+        else:
+            progress_printer = ProgressPrinter('temp_multi_counter.txt')
+            sequence_number, visitors = count_shard_with_checkpoints(args.maf_file, 0, None, checkpointer, count_shard, args.batch_size, args.cache_size, weights, analysis_names, gene_set, alignment_length, progress=progress_printer.add)
+
+    # If a state file was passed, add the counts of the earlier runs and save the updated state.
+    if args.state is not None:
+        with profiler.step("Adding the counts of the state file"):
+            sequence_number, visitors = update_state(args.state, 'multi_counter:{}:{}'.format(','.join(analysis_names), ','.join(gene[0] for gene in gene_set)), merge_shard_counts, (sequence_number, visitors))
+
+    # Print the number of sequences.
+    print("Sequence Number: {}".format(sequence_number))
+
+    # Write the output files of every analysis.
+    with profiler.step("Writing the output files"), metrics.timer('output'):
+        for visitor in visitors:
+            visitor.write(sequence_number, args.output_format)
+
+    # Write the final metrics and the profile.
+    metrics.write()
+    profiler.write()
+
+def count_shard(maf_file, start, end, batch_size, cache_size, weights, analysis_names, gene_set, alignment_length, progress, result=None, checkpoint=None):
+    """
+    Runs the selected analyses over the sequence pairs of one byte range (shard) of the multi alignment file.
+
+    Parameters: maf_file - the path to the multi alignment .maf file
+                start - the byte offset of the shard
+                end - the ending byte offset of the shard, or None for the end of the file
+                batch_size - the number of sequence pairs processed together as one block
+                cache_size - the number of recent unique sequence pairs whose events are reused
+                weights - the dictionary from group_id to multiplicity, or None for a multiplicity of 1
+                analysis_names - the list of analyses to run
+                gene_set - the list of (protein_name, start index, length) for each gene to count
+                alignment_length - the length of the aligned sequences after the insertion columns are removed
+                progress - the function called with the number of new sequences read
+                result - the (sequence_number, visitors) counts to continue from, or None to start new counts
+                checkpoint - the function called with the byte offset and the counts at the end of each alignment block, or None
+
+    Returns:    sequence_number - the number of sequences read, counting each by its multiplicity
+                visitors - the list of analysis visitors containing the counts
+    """
+
+    # Initialize variables, continuing the counts that were passed.
+    if result is None:
+        result = 0, [ANALYSES[analysis_name](*gene) for gene in gene_set for analysis_name in analysis_names]
+    sequence_number, visitors = result
+
+    # Initialize the cache of the events of recent unique sequence pairs.
+    event_cache = EventCache(cache_size)
+    find_events = partial(find_pair_events, visitors=visitors, alignment_length=alignment_length)
+
+    # If a batch size was passed, process the pairs as blocks of sequences.
+    if batch_size > 1:
+        # For each batch of sequence pairs in the shard:
+        for ref_sequences, other_sequences, group_ids, batch_end in metrics.timed('parse', read_alignment_batches(maf_file, batch_size, start, end, with_offsets=True)):
+            # Get the multiplicity of each sequence in the block.
+            block_weights = None if weights is None else [weights.get(group_id, 1) for group_id in group_ids]
+
+            # Increment the number of sequences read.
+            sequence_number += len(group_ids) if block_weights is None else sum(block_weights)
+            progress(len(group_ids))
+
+            # Stack the block into (N x L) matrices and remove the insertion columns once.
+            with metrics.timer('fix_sequences'):
+                reference_block, other_block = fix_sequence_block(stack_sequences(ref_sequences), stack_sequences(other_sequences), alignment_length)
+
+            # Pass the block to every analysis.
+            with metrics.timer('compare'):
+                for visitor in visitors:
+                    visitor.visit_block(reference_block, other_block, group_ids, block_weights)
+
+            # Pass the counts up to the end of the batch to the checkpoint function.
+            if checkpoint is not None:
+                checkpoint(batch_end, (sequence_number, visitors))
+
+    # Otherwise, process the pairs one at a time.
+    else:
+        # For each sequence pair in the shard:
+        for ref_sequence, other_sequence, other_group_id, block_end in metrics.timed('parse', read_alignment_pairs(maf_file, start, end, with_offsets=True)):
+            # Get the multiplicity of the sequence.
+            weight = 1 if weights is None else weights.get(other_group_id, 1)
+
+            # Increment the number of sequences read.
+            sequence_number += weight
+            progress(1)
+
+            # Find the events of every analysis, reusing them if the same pair was seen recently.
+            pair_events = event_cache.find(ref_sequence, other_sequence, find_events)
+
+            # Pass the events to every analysis.
+            with metrics.timer('count'):
+                for visitor, events in zip(visitors, pair_events):
+                    visitor.add_events(events, other_group_id, weight)
+
+            # Pass the counts up to the end of the block to the checkpoint function.
+            if checkpoint is not None:
+                checkpoint(block_end, (sequence_number, visitors))
+
+    return sequence_number, visitors
+
+def find_pair_events(ref_sequence, other_sequence, visitors, alignment_length):
+    """
+    Removes the insertion columns of a sequence pair once and finds the events of every analysis.
+
+    Parameters: ref_sequence - the aligned reference sequence
+                other_sequence - the aligned other/variant sequence
+                visitors - the list of analysis visitors
+                alignment_length - the length of the aligned sequences after the insertion columns are removed
+
+    Returns:    the list of events found by each visitor
+    """
+
+    # Remove the insertion columns once.
+    with metrics.timer('fix_sequences'):
+        reference, other, insertions = fix_sequences(ref_sequence, other_sequence, alignment_length)
+
+    # Find the events of every analysis.
+    with metrics.timer('compare'):
+        return [visitor.find_events(reference, other) for visitor in visitors]
+
+def merge_shard_counts(shard_results):
+    """
+    Merges the analysis visitors from the shards of the multi alignment file in file order.
+
+    Parameter: shard_results - the list of (sequence_number, visitors) results in file order
+
+    Returns:   the merged (sequence_number, visitors)
+    """
+
+    # Start from the first shard.
+    sequence_number, visitors = shard_results[0]
+
+    # For each remaining shard, add the counts of every analysis.
+    for shard_sequence_number, shard_visitors in shard_results[1:]:
+        sequence_number += shard_sequence_number
+        for visitor, shard_visitor in zip(visitors, shard_visitors):
+            visitor.merge(shard_visitor)
+
+    return sequence_number, visitors
+
+# Run the main function.
+if __name__ == '__main__':
+    main()
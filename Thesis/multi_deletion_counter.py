@@ -12,150 +12,235 @@
 
 
 # Import required libraries.
-import re
+import argparse
+import numpy as np
 from gene_reader import dna_reader
-from sys import argv
+from alignment_arrays import GAP, fix_sequences, stack_sequences, fix_sequence_block, find_deletion_runs
+from deletion_events import DeletionEventCounter
+from sharded_counting import ProgressPrinter, run_sharded
+from checkpoints import add_checkpoint_arguments, checkpointer_from_arguments, count_shard_with_checkpoints, update_state
+from multi_maf_reader import read_alignment_pairs, read_alignment_batches, read_weights
+from event_cache import EventCache
+from counter_metrics import metrics, add_metrics_arguments, configure_metrics_from_arguments
+from step_profiler import add_profile_arguments, profiler_from_arguments
+from count_writers import write_contiguous_deletion_counts, write_deletion_length_counts, add_output_arguments
+
+# Set gene constants. This counter reads S-gene alignments only; multi_counter.py --genes counts other genes.
+LENGTH_OF_S_GENE = 3822
 
 # The main function.
 def main():
 
-    # Initialize variables.
-    reference = True
-    lengths = {}
-    sequence_number = 0
-    ref_sequence = ''
-    variant_sequence = ''
-    
+    # Parse the command line arguments.
+    parser = argparse.ArgumentParser(description='Counts the contiguous deletions in the S-gene. For other genes, use multi_counter.py --genes.')
+    parser.add_argument('maf_file', help='the multi alignment .maf file, optionally gzip, bgzip or zstd compressed, or - for stdin')
+    parser.add_argument('--batch-size', type=int, default=1, help='the number of sequence pairs processed together as one block')
+    parser.add_argument('--workers', type=int, default=1, help='the number of worker processes, each counting one shard of the file')
+    parser.add_argument('--cache-size', type=int, default=10000, help='the number of recent unique sequence pairs whose deletions are reused, or 0 for no cache')
+    parser.add_argument('--weights', help='the file with the multiplicity of each group_id, for files of collapsed unique sequences')
+    parser.add_argument('--state', help='the state file with the raw counts of earlier runs, which the counts of this file are added to')
+    add_checkpoint_arguments(parser, 'multi_deletion_counter_checkpoints')
+    add_metrics_arguments(parser)
+    add_profile_arguments(parser)
+    add_output_arguments(parser)
+    args = parser.parse_args()
+    checkpointer = checkpointer_from_arguments(args)
+    configure_metrics_from_arguments(args, 'multi_deletion_counter')
+    profiler = profiler_from_arguments(args, 'multi_deletion_counter')
     
-    # Initialize counts.
-    contiguous_deletion_counts = [{} for i in range(3822)]
-    deletion_length_counts = {}
-    num_sequences_with_deletions = 0
+    # Read the multiplicity of each group, if a weights file was passed.
+    weights = read_weights(args.weights) if args.weights is not None else None
     
     
     # Import the gene information.
-    genes = dna_reader()
+    genes = profiler.call("Importing the gene information", dna_reader)
     
     
-    # For each line in the multi alignment .txt file:
-    # If the line starts with 's':
-    for line in (line for line in open(argv[-1]) if line.startswith('s')):
+    with profiler.step("Counting the sequence pairs"):
+        # If more than one worker was requested, count the shards of the file in parallel and merge them.
+        if args.workers > 1:
+            shard_results = run_sharded(count_shard_with_checkpoints, args.maf_file, args.workers, 'temp_multi_contiguous_deletion_counter.txt', checkpointer, count_shard, args.batch_size, args.cache_size, weights)
+            sequence_number, num_sequences_with_deletions, deletion_counter = merge_shard_counts(shard_results)
         
-        # Split the line into tokens.
-        line_tokens = re.split('\s+', line.rstrip())
-
-        # If it corresponds to a reference sequence:
-        if reference:
+        # Otherwise, count the whole file in this process.
+        else:
+            progress_printer = ProgressPrinter('temp_multi_contiguous_deletion_counter.txt')
+            sequence_number, num_sequences_with_deletions, deletion_counter = count_shard_with_checkpoints(args.maf_file, 0, None, checkpointer, count_shard, args.batch_size, args.cache_size, weights, progress=progress_printer.add)
+    
+    # If a state file was passed, add the counts of the earlier runs and save the updated state.
+    if args.state is not None:
+        with profiler.step("Adding the counts of the state file"):
+            sequence_number, num_sequences_with_deletions, deletion_counter = update_state(args.state, 'multi_deletion_counter', merge_shard_counts,
+                                                                                           (sequence_number, num_sequences_with_deletions, deletion_counter))
+    
+    with profiler.step("Writing the output files"), metrics.timer('output'):
+        # Print the deletion counter.    
+        print(deletion_counter)
+        
+        # Print the number of sequences with deletions.
+        print(num_sequences_with_deletions)
         
-            # Get the reference starting position, reference length, and reference sequence.
-            line_refstart = int(line_tokens[2])
-            line_reflength = int(line_tokens[3])
-            ref_sequence = line_tokens[-1]
+        # Write the contiguous deletion counts to a .csv file.
+        contiguous_deletion_counts_to_file(deletion_counter, sequence_number, num_sequences_with_deletions, output_format=args.output_format)
+        
+        # Write the deletion length data to a .csv file.
+        deletion_lengths_to_file(deletion_counter, sequence_number, output_format=args.output_format)
+    
+    # Write the final metrics and the profile.
+    metrics.write()
+    profiler.write()
 
-            # Find the reference sequence length.
-            refsequence_length = len(ref_sequence)
+def count_shard(maf_file, start, end, batch_size, cache_size, weights, progress, result=None, checkpoint=None):
+    """
+    Counts the contiguous deletions in the sequence pairs of one byte range (shard) of the multi alignment file.
+    
+    Parameters: maf_file - the path to the multi alignment .maf file
+                start - the byte offset of the shard
+                end - the ending byte offset of the shard, or None for the end of the file
+                batch_size - the number of sequence pairs processed together as one block
+                cache_size - the number of recent unique sequence pairs whose deletions are reused
+                weights - the dictionary from group_id to multiplicity, or None for a multiplicity of 1
+                progress - the function called with the number of new sequences read
+                result - the (sequence_number, num_sequences_with_deletions, deletion_counter) counts to continue from, or None to start new counts
+                checkpoint - the function called with the byte offset and the counts at the end of each alignment block, or None
+                
+    Returns:    sequence_number - the number of sequences read, counting each by its multiplicity
+                num_sequences_with_deletions - the number of sequences with deletions, counting each by its multiplicity
+                deletion_counter - the DeletionEventCounter containing the contiguous deletion counts
+    """
+    
+    # Initialize variables and counts, continuing the counts that were passed.
+    if result is None:
+        result = 0, 0, DeletionEventCounter()
+    sequence_number, num_sequences_with_deletions, deletion_counter = result
+    
+    # Initialize the cache of the deletions of recent unique sequence pairs.
+    event_cache = EventCache(cache_size)
+    
+    # If a batch size was passed, process the pairs as blocks of sequences.
+    if batch_size > 1:
+        # For each batch of sequence pairs in the shard:
+        for ref_sequences, other_sequences, group_ids, batch_end in metrics.timed('parse', read_alignment_batches(maf_file, batch_size, start, end, with_offsets=True)):
+            # Get the multiplicity of each sequence in the block.
+            block_weights = None if weights is None else [weights.get(group_id, 1) for group_id in group_ids]
             
-            # Set the reference tag to false since a reference line has been read.
-            reference = False
-
-        # Otherwise, the sequence is a variant:
-        else:
             # Increment the number of sequences read.
-            sequence_number += 1
+            sequence_number += len(group_ids) if block_weights is None else sum(block_weights)
+            progress(len(group_ids))
             
-            # For every 1000 sequences read, print the current sequence number to the temp_file and stdout.
-            if sequence_number % 1000 == 0:
-                with open('temp_multi_contiguous_deletion_counter.txt', 'w') as temp_file:
-                    temp_file.write(str(sequence_number) + '\n')
-                print(sequence_number)
-                
-               
-            # Get the relevant sequence information for the other/variant sequence.
-            other_group_id = int(line_tokens[1])
-            line_otherstart = int(line_tokens[2])
-            line_otherlength = int(line_tokens[3])
-            other_sequence = line_tokens[-1]
-            othersequence_length = len(other_sequence)
-                
-            # Remove insertions 
-            ref_sequence, other_sequence = fix_sequences(ref_sequence, other_sequence)
+            # Stack the block into (N x L) matrices and remove the insertion columns.
+            with metrics.timer('fix_sequences'):
+                reference_block, other_block = fix_sequence_block(stack_sequences(ref_sequences), stack_sequences(other_sequences), LENGTH_OF_S_GENE)
+            
+            # Count the contiguous deletions in the whole block.
+            with metrics.timer('compare'):
+                num_sequences_with_deletions += count_contiguous_deletion_block(other_block, deletion_counter, block_weights)
+            
+            # Pass the counts up to the end of the batch to the checkpoint function.
+            if checkpoint is not None:
+                checkpoint(batch_end, (sequence_number, num_sequences_with_deletions, deletion_counter))
+    
+    # Otherwise, process the pairs one at a time.
+    else:
+        # For each sequence pair in the shard:
+        for ref_sequence, other_sequence, other_group_id, block_end in metrics.timed('parse', read_alignment_pairs(maf_file, start, end, with_offsets=True)):
+            # Get the multiplicity of the sequence.
+            weight = 1 if weights is None else weights.get(other_group_id, 1)
+            
+            # Increment the number of sequences read.
+            sequence_number += weight
+            progress(1)
+            
+            # Find the deletions of the pair, reusing them if the same pair was seen recently.
+            rows, starts, lengths = event_cache.find(ref_sequence, other_sequence, find_pair_deletions)
             
             # If the other/variant sequence contains a '-':
-            if '-' in other_sequence:
+            if len(starts) > 0:
                 # Increment the number of sequences with deletions.
-                num_sequences_with_deletions += 1
+                num_sequences_with_deletions += weight
                 
             # Count the contiguous deletions.
-            count_contiguous_deletions(ref_sequence, other_sequence, contiguous_deletion_counts, deletion_length_counts)
+            with metrics.timer('count'):
+                deletion_counter.add_runs(rows, starts, lengths, [weight])
+            
+            # Pass the counts up to the end of the block to the checkpoint function.
+            if checkpoint is not None:
+                checkpoint(block_end, (sequence_number, num_sequences_with_deletions, deletion_counter))
+    
+    return sequence_number, num_sequences_with_deletions, deletion_counter
 
-            # Set the reference tag to true since a reference sequence will be read next.            
-            reference = True
+def merge_shard_counts(shard_results):
+    """
+    Merges the deletion counts from the shards of the multi alignment file.
     
-    # Print the deletion counts dictionary.    
-    print(contiguous_deletion_counts)
+    Parameter: shard_results - the list of (sequence_number, num_sequences_with_deletions, deletion_counter) results
     
-    # Print the number of sequences with deletions.
-    print(num_sequences_with_deletions)
+    Returns:   the merged (sequence_number, num_sequences_with_deletions, deletion_counter)
+    """
+    
+    # Start from the first shard.
+    sequence_number, num_sequences_with_deletions, deletion_counter = shard_results[0]
     
-    # Write the contiguous deletion counts to a .csv file.
-    contiguous_deletion_counts_to_file(contiguous_deletion_counts, sequence_number, num_sequences_with_deletions)
+    # For each remaining shard, add its counts.
+    for shard_sequence_number, shard_num_sequences_with_deletions, shard_deletion_counter in shard_results[1:]:
+        sequence_number += shard_sequence_number
+        num_sequences_with_deletions += shard_num_sequences_with_deletions
+        deletion_counter.merge(shard_deletion_counter)
     
-    # Write the deletion length data to a .csv file.
-    deletion_lengths_to_file(deletion_length_counts, sequence_number)
+    return sequence_number, num_sequences_with_deletions, deletion_counter
 
-def count_contiguous_deletions(reference, other, contiguous_deletion_counts, deletion_length_counts):
+def find_pair_deletions(ref_sequence, other_sequence):
     """
-    Counts the numbers of contiguous deletions (continuous strings of '-'s).
+    Finds the contiguous deletions (continuous strings of '-'s) in an aligned other/variant sequence,
+    including a deletion that runs to the end of the gene.
     
-    Parameters: reference - the reference gene sequence
-                other     - the other/variant gene sequence
-                contiguous_deletion_counts - the dictionary containing the contiguous deletion counts
-                deletion_length_counts - the dictionary containing the deletion length data
+    Parameters: ref_sequence - the aligned reference sequence
+                other_sequence - the aligned other/variant sequence
+                
+    Returns:    rows - the row of each deletion (always 0)
+                starts - the starting index of each deletion
+                lengths - the length of each deletion
     """
     
-    # Initialize the deletion length and temp length counts dictionary.
-    deletion_length = 0
-    temp_length_counts = {}
+    # Remove insertions 
+    with metrics.timer('fix_sequences'):
+        reference, other, insertions = fix_sequences(ref_sequence, other_sequence, LENGTH_OF_S_GENE)
     
-    # For each nucleotide index.
-    for nucleotide_index in range(len(other)):
+    # Find the (start, length) runs of '-'s.
+    with metrics.timer('compare'):
+        return find_deletion_runs(other)
+
+def count_contiguous_deletion_block(other_block, deletion_counter, weights=None):
+    """
+    Counts the contiguous deletions (continuous strings of '-'s) in every sequence of a block at once.
     
-        # Get the nucleotide in the other/variant sequence.
-        nucleotide = other[nucleotide_index]
-        
-        # If it is a '-', increment the deletion length. 
-        if nucleotide == '-':
-            deletion_length += 1
-            
-        # Otherwise, it is either the character is before a deletion or after a deletion:    
-        else:
-            # If the character is after a deletion (i.e. current deletion length is not 0):
-            if deletion_length != 0:
-                # Add the starting position, and deletion length to the dictionary.
-                contiguous_deletion_counts[nucleotide_index - deletion_length][deletion_length] = contiguous_deletion_counts[nucleotide_index - deletion_length].get(deletion_length, 0) + 1
-                
-                # Increment the deletion length count by 1.
-                temp_length_counts[deletion_length] = temp_length_counts.get(deletion_length, 0) + 1
+    Parameters: other_block - the (N x 3822) matrix of other/variant sequences without insertion columns
+                deletion_counter - the DeletionEventCounter containing the contiguous deletion counts
+                weights - the list of multiplicities for the sequences, or None for 1 each
                 
-                # Reset the deletion length to 0.
-                deletion_length = 0
-                
-            # Otherwise continue the deletion.
-            else:
-                continue
-                
-    # Increment the deletion length counts for all new deletions.            
-    for deletion_length in temp_length_counts.keys():
-        deletion_length_counts[deletion_length] = deletion_length_counts.get(deletion_length, 0) + 1
+    Returns:    the number of sequences in the block with deletions, counting each by its multiplicity
+    """
+    
+    # Find the deletions in every row of the block and add them to the counter.
+    deletion_counter.add_runs(*find_deletion_runs(other_block), weights)
+    
+    # Find the sequences with deletions.
+    has_deletions = (other_block == GAP).any(axis=1)
         
+    # Return the number of sequences with deletions.
+    if weights is None:
+        return int(np.count_nonzero(has_deletions))
+    return int(np.asarray(weights)[has_deletions].sum())
 
-def contiguous_deletion_counts_to_file(contiguous_deletion_counts, sequence_number, num_sequences_with_deletions):
+def contiguous_deletion_counts_to_file(deletion_counter, sequence_number, num_sequences_with_deletions, gene='S', output_format='csv'):
     """
     Writes the contiguous (continuous string of '-'s) deletion data to an output file.
     
-    Parameters: contiguous_deletion_counts - the dictionary with the contiguous deletion information
+    Parameters: deletion_counter - the DeletionEventCounter containing the contiguous deletion counts
                 sequence_number - the number of sequences read
                 num_sequences_with_deletions - the number of sequences with deletions
+                gene - the protein name of the gene used in the file name
+                output_format - the format of the output file (see count_writers.py)
     """
     
     # Print the number of sequences and the number of sequences with deletions.
@@ -163,101 +248,25 @@ def contiguous_deletion_counts_to_file(contiguous_deletion_counts, sequence_numb
     print("Number of Sequences with Deletions:",num_sequences_with_deletions)
     
     
-    # Open the new counts file.
-    counts_file = open('multi_deletion_counts_freq_for_S_all.csv', 'w')
-
-    # Write the column names for the .csv file.
-    counts_file.write('Starting_Nucleotide_Position,Deletion_Length,Ending_Nucleotide_Position,Deletion_Count,Deletion_Freq,Num_Sequences_With_Deletions,Ratio_With_Deletions\n')
-    
-    # For each index value.
-    for i in range(3822):
-        # Get the nucleotide position.
-        nucleotide_position = i + 1
-        
-        # For each deletion length:
-        for deletion_length in sorted(contiguous_deletion_counts[i].keys()):
-            # Calculate the ending position.
-            ending_position = nucleotide_position + deletion_length - 1
-               
-            # Get the deletion count.
-            deletion_length_count = contiguous_deletion_counts[i][deletion_length]
-            
-            # Calculate the frequency.
-            deletion_length_freq = deletion_length_count / sequence_number
-            
-            # Calculate the frequency of sequences with deletions.
-            ratio_with_deletions = num_sequences_with_deletions / sequence_number 
-            
-            # Write the line in the output file.
-            counts_file.write('{},{},{},{},{},{},{}\n'.format(nucleotide_position, deletion_length, ending_position, deletion_length_count, deletion_length_freq,num_sequences_with_deletions, ratio_with_deletions))
-
-    # Close the counts file.
-    counts_file.close()
+    # Write the counts and frequencies of the deletions sorted by starting position and length.
+    write_contiguous_deletion_counts(*deletion_counter.deletion_counts(), sequence_number, num_sequences_with_deletions,
+                                     'multi_deletion_counts_freq_for_{}_all.csv'.format(gene), output_format)
 
-def deletion_lengths_to_file(deletion_length_counts, sequence_number):
+def deletion_lengths_to_file(deletion_counter, sequence_number, gene='S', output_format='csv'):
     """
     Writes the deletion lengths, counts, and frequencies to a output file.
     
-    Parameters: deletion_length_counts - the dictionary containing the numbers of deletions of each length
+    Parameters: deletion_counter - the DeletionEventCounter containing the numbers of sequences with deletions of each length
                 sequence_number - the number of sequences read 
+                gene - the protein name of the gene used in the file name
+                output_format - the format of the output file (see count_writers.py)
     """
     
-    # Open the output file for the deletion length data.
-    lengths_file = open('multi_deletion_lengths_counts_freq_for_S_all.csv', 'w')
-    
-    # Write the header.
-    lengths_file.write('Deletion Length,Count,Frequency\n')
-    
-    # For each deletion length:
-    for length in sorted(deletion_length_counts.keys()):
-    
-        # Get the count of deletions of that length.
-        deletion_length_count = deletion_length_counts[length]
-        
-        # Calculate the frequency.
-        deletion_length_freq = deletion_length_count / sequence_number
-        
-        # Write the line with the data.
-        lengths_file.write('{},{},{}\n'.format(length, deletion_length_count, deletion_length_freq))
-        
-    # Close the file.
-    lengths_file.close()
+    # Write the counts and frequencies of the deletion lengths in sorted order.
+    write_deletion_length_counts(*deletion_counter.length_counts(), sequence_number,
+                                 'multi_deletion_lengths_counts_freq_for_{}_all.csv'.format(gene), output_format)
 
         
-def fix_sequences(reference, other):
-    """
-    Removes columns from sequences for insertions.
-    
-    Parameters: reference - the reference sequence
-                other     - the other/variant sequence
-                
-    Returns:    new_ref   - the updated reference sequence
-                new_other - the updated other/variant sequence
-    """
-    
-    # Initialize the new sequences.
-    new_ref = ''
-    new_other = ''
-    
-    # For each position in the reference sequence:
-    for i in range(len(reference)):
-        # If an insertion is found, skip it.
-        if reference[i] == '-':
-            pass
-            
-        # Otherwise append the characters.
-        else:
-            new_ref += reference[i]
-            new_other += other[i]
-    # Make sure the lengths are correct.
-    # Otherwise stop and print a message.
-    if len(new_ref) == len(new_other) and len(new_ref) == 3822:
-        return new_ref, new_other
-    else:
-        print("The length of the sequences is not 3822.")
-        exit()
-        
-        
 # Run the main function.        
 if __name__ == '__main__':
     main()
@@ -0,0 +1,221 @@
+# Filename: multi_maf_reader.py
+# Tool Name: Multi MAF Reader
+#
+# Reads the reference and other/variant sequence pairs from a multi alignment .maf file.
+# The 's' lines alternate between a reference sequence and an other/variant sequence.
+# The file is read in binary mode so that a byte range (shard) of the file can be read on its own.
+# Compressed files and stdin ('-') are opened through compressed_maf.py, and the byte offsets are uncompressed offsets.
+
+
+# Import required libraries.
+import re
+from compressed_maf import open_maf, open_seekable_maf, maf_size
+
+# Set the number of bytes read at a time.
+READ_CHUNK_BYTES = 1 << 22
+
+# The whitespace characters that end a line.
+WHITESPACE = b' \t\r\n'
+
+
+def read_alignment_pairs(filepath, start=0, end=None, with_offsets=False):
+    """
+    Reads the (reference, other/variant) sequence pairs from a multi alignment file.
+    The file is read in large chunks, and each alignment block ('a' line) must hold exactly two 's' lines,
+    the reference sequence and then the other/variant sequence.
+
+    Parameters: filepath - the path to the multi alignment .maf file, or '-' for stdin
+                start    - the byte offset to start reading from (an alignment block boundary)
+                end      - the byte offset to stop reading at (an alignment block boundary), or None for the end of the file
+                with_offsets - whether to also yield the byte offset of the end of each alignment block
+
+    Yields:     ref_sequence   - the reference sequence, as a memoryview of the chunk
+                other_sequence - the other/variant sequence, as a memoryview of the chunk
+                other_group_id - the group_id for the sequence pair
+                block_end      - the byte offset of the end of the alignment block, if with_offsets is True
+    """
+
+    # Open the file at the start of the shard.
+    with open_maf(filepath, start) as maf_file:
+        # Initialize the unparsed bytes, which always start at the start of a line, and their offset in the file.
+        buffer = b''
+        offset = start
+        at_end = False
+
+        # For each chunk of the file:
+        while not at_end:
+            chunk = maf_file.read(READ_CHUNK_BYTES)
+            at_end = not chunk
+            buffer = buffer + chunk if buffer else chunk
+
+            # Parse up to the start of the last alignment block, which may continue in the next chunk.
+            limit = len(buffer) if at_end else buffer.rfind(b'\na') + 1
+            if limit <= 0:
+                continue
+            view = memoryview(buffer)
+
+            # Find the first alignment block, or the limit if there is none.
+            block_start = 0 if buffer.startswith(b'a') else buffer.find(b'\na', 0, limit) + 1 or limit
+
+            # For each complete alignment block:
+            while block_start < limit:
+                # Stop at the end of the shard.
+                if end is not None and offset + block_start >= end:
+                    return
+
+                # Find the end of the block.
+                block_end = buffer.find(b'\na', block_start, limit) + 1 or limit
+
+                # Find the reference and other/variant 's' lines and check that the block holds no other 's' line.
+                ref_line = buffer.find(b'\ns', block_start, block_end) + 1
+                other_line = buffer.find(b'\ns', ref_line, block_end) + 1 if ref_line else 0
+                if not other_line or buffer.find(b'\ns', other_line, block_end) >= 0:
+                    raise ValueError('the alignment block at byte {} of {} does not hold exactly one reference and one other/variant sequence'.format(offset + block_start, filepath))
+
+                # Yield the sequences and the group_id of the other/variant line, and the offset of the end of the block.
+                ref_start, ref_end = find_sequence(buffer, ref_line, block_end)
+                other_start, other_end = find_sequence(buffer, other_line, block_end)
+                pair = view[ref_start:ref_end], view[other_start:other_end], int(buffer[other_line + 1:other_start].split(None, 1)[0])
+                yield pair + (offset + block_end,) if with_offsets else pair
+
+                block_start = block_end
+
+            # Keep the bytes of the incomplete block for the next chunk.
+            buffer = buffer[limit:]
+            offset += limit
+
+def find_sequence(buffer, line_start, block_end):
+    """
+    Finds the sequence text, the last field, of an 's' line.
+
+    Parameters: buffer     - the bytes holding the line
+                line_start - the offset of the line in the buffer
+                block_end  - the offset of the end of the alignment block holding the line
+
+    Returns:    the offsets of the start and end of the sequence
+    """
+
+    # Find the end of the line, leaving out trailing whitespace.
+    line_end = buffer.find(b'\n', line_start, block_end)
+    if line_end < 0:
+        line_end = block_end
+    while line_end > line_start and buffer[line_end - 1] in WHITESPACE:
+        line_end -= 1
+
+    # The sequence starts after the last space or tab.
+    return max(buffer.rfind(b' ', line_start, line_end), buffer.rfind(b'\t', line_start, line_end)) + 1, line_end
+
+def read_alignment_batches(filepath, batch_size, start=0, end=None, with_offsets=False):
+    """
+    Reads the sequence pairs from a multi alignment file in batches.
+
+    Parameters: filepath   - the path to the multi alignment .maf file
+                batch_size - the maximum number of pairs in each batch
+                start      - the byte offset to start reading from
+                end        - the byte offset to stop reading at, or None for the end of the file
+                with_offsets - whether to also yield the byte offset of the end of each batch
+
+    Yields:     ref_sequences   - the list of reference sequences
+                other_sequences - the list of other/variant sequences
+                group_ids       - the list of group_ids
+                batch_end       - the byte offset of the end of the last alignment block of the batch, if with_offsets is True
+    """
+
+    # Initialize the batch lists.
+    ref_sequences = []
+    other_sequences = []
+    group_ids = []
+    batch_end = start
+
+    # For each pair, add it to the batch and yield the batch once it is full.
+    for ref_sequence, other_sequence, group_id, batch_end in read_alignment_pairs(filepath, start, end, with_offsets=True):
+        ref_sequences.append(ref_sequence)
+        other_sequences.append(other_sequence)
+        group_ids.append(group_id)
+
+        if len(group_ids) == batch_size:
+            yield (ref_sequences, other_sequences, group_ids, batch_end) if with_offsets else (ref_sequences, other_sequences, group_ids)
+            ref_sequences = []
+            other_sequences = []
+            group_ids = []
+
+    # Yield the final partial batch.
+    if group_ids:
+        yield (ref_sequences, other_sequences, group_ids, batch_end) if with_offsets else (ref_sequences, other_sequences, group_ids)
+
+def read_weights(filepath):
+    """
+    Reads the multiplicity of each group from a weights file, for multi alignment files of collapsed unique sequences.
+    Each line holds a group_id and the number of sequences it stands for, separated by whitespace or a comma.
+
+    Parameter: filepath - the path to the weights file
+
+    Returns:   weights - the dictionary from group_id to multiplicity
+    """
+
+    # Initialize the weights.
+    weights = {}
+
+    with open(filepath) as weights_file:
+        # For each line that is not empty or a comment, add the weight of the group.
+        for line in weights_file:
+            line_tokens = re.split(r'[\s,]+', line.strip())
+            if line_tokens[0] and not line_tokens[0].startswith('#'):
+                weights[int(line_tokens[0])] = int(line_tokens[1])
+
+    return weights
+
+def find_block_start(maf_file, offset, file_size):
+    """
+    Finds the first alignment block ('a' line) that starts at or after the next full line after an offset.
+
+    Parameters: maf_file  - the multi alignment file opened in binary mode
+                offset    - the byte offset to search from
+                file_size - the size of the file
+
+    Returns:    the byte offset of the alignment block, or the file size if there are no more blocks
+    """
+
+    # Skip to the start of the next full line.
+    maf_file.seek(offset)
+    maf_file.readline()
+    offset = maf_file.tell()
+
+    # Move forward to the next alignment block.
+    for line in maf_file:
+        if line.startswith(b'a'):
+            return offset
+        offset += len(line)
+    return file_size
+
+def find_shard_offsets(filepath, number_of_shards):
+    """
+    Splits a multi alignment file into byte ranges that start at alignment block ('a' line) boundaries.
+    Files without random access (gzip, zstd and stdin) are a single shard.
+
+    Parameters: filepath         - the path to the multi alignment .maf file
+                number_of_shards - the requested number of shards
+
+    Returns:    shards - the list of (start, end) byte offsets, where end is None for a file without random access
+    """
+
+    # Get the size of the file.
+    file_size = maf_size(filepath)
+    if file_size is None:
+        return [(0, None)]
+
+    # Initialize the list of shard boundaries.
+    boundaries = [0]
+
+    with open_seekable_maf(filepath) as maf_file:
+        # For each evenly spaced offset, move forward to the next alignment block.
+        for shard_number in range(1, number_of_shards):
+            offset = find_block_start(maf_file, max(file_size * shard_number // number_of_shards, boundaries[-1]), file_size)
+
+            # Add the boundary if it starts a new, non-empty shard.
+            if boundaries[-1] < offset < file_size:
+                boundaries.append(offset)
+
+    # Add the end of the file and pair up the boundaries.
+    boundaries.append(file_size)
+    return list(zip(boundaries[:-1], boundaries[1:]))
@@ -7,275 +7,320 @@
 # 
 # Output file names:
 # new_mutation_counts_freq_for_S_all.csv
+# test13_above97_mutation_counts/ (offsets.npy, groups.npy and weights.npy, see group_postings.py)
 
 
 # Import required libraries.
-import pickle
 import numpy as np
-import pandas as pd
-import re
+import argparse
 from gene_reader import dna_reader
-from sys import argv
+from alignment_arrays import NUCLEOTIDES, find_mutations
+from alignment_arrays import fix_sequences, stack_sequences, fix_sequence_block, find_mutation_block
+from multi_maf_reader import read_alignment_pairs, read_alignment_batches, read_weights
+from sharded_counting import ProgressPrinter, run_sharded
+from checkpoints import add_checkpoint_arguments, checkpointer_from_arguments, count_shard_with_checkpoints, update_state
+from group_postings import GroupPostings
+from event_cache import EventCache
+from counter_metrics import metrics, add_metrics_arguments, configure_metrics_from_arguments
+from step_profiler import add_profile_arguments, profiler_from_arguments
+from count_writers import write_mutation_counts, add_output_arguments
+
+# Set gene constants. This counter reads S-gene alignments only; multi_counter.py --genes counts other genes.
+LENGTH_OF_S_GENE = 3822
 
 # The main function.
 def main():
 
-    # Initialize variables.
-    reference = True
-    lengths = {}
-    sequence_number = 0
-    ref_sequence = ''
-    other_sequence = ''
+    # Parse the command line arguments.
+    parser = argparse.ArgumentParser(description='Counts the substitutions and single nucleotide deletions at each S-gene position. For other genes, use multi_counter.py --genes.')
+    parser.add_argument('maf_file', help='the multi alignment .maf file, optionally gzip, bgzip or zstd compressed, or - for stdin')
+    parser.add_argument('--batch-size', type=int, default=1, help='the number of sequence pairs compared together as one block')
+    parser.add_argument('--workers', type=int, default=1, help='the number of worker processes, each counting one shard of the file')
+    parser.add_argument('--cache-size', type=int, default=10000, help='the number of recent unique sequence pairs whose mutations are reused, or 0 for no cache')
+    parser.add_argument('--weights', help='the file with the multiplicity of each group_id, for files of collapsed unique sequences')
+    parser.add_argument('--state', help='the state file with the raw counts of earlier runs, which the counts of this file are added to')
+    add_checkpoint_arguments(parser, 'new_mutation_counter_checkpoints')
+    add_metrics_arguments(parser)
+    add_profile_arguments(parser)
+    add_output_arguments(parser)
+    args = parser.parse_args()
+    checkpointer = checkpointer_from_arguments(args)
+    configure_metrics_from_arguments(args, 'multi_mutation_counter')
+    profiler = profiler_from_arguments(args, 'multi_mutation_counter')
     
+    # Read the multiplicity of each group, if a weights file was passed.
+    weights = read_weights(args.weights) if args.weights is not None else None
     
     # Initialize counts.
-    mutation_counts = [ {} for i in range(3822)]
-    deletion_counts = [ 0 for i in range(3822)]
-    
-    for i in range(len(mutation_counts)):
-        for nuc in ('A', 'T', 'G', 'C', '-'):
-            mutation_counts[i][nuc] = {'Count': 0, 'Groups': []}
+    deletion_counts = [ 0 for i in range(LENGTH_OF_S_GENE)]
 
 
     # Import the gene information.
-    genes = dna_reader()
+    genes = profiler.call("Importing the gene information", dna_reader)
     
     # Print the number of genes and the length of the reference S-gene sequence.
     print(genes)
     print(len(genes[3]['sequence']))
 
-    # For each line in the multi alignment .txt file:
-    # If the line starts with 's':
-    for line in (line for line in open(argv[-1]) if line.startswith('s')):
+    with profiler.step("Counting the sequence pairs"):
+        # If more than one worker was requested, count the shards of the file in parallel and merge them.
+        if args.workers > 1:
+            shard_results = run_sharded(count_shard_with_checkpoints, args.maf_file, args.workers, 'temp_new_mutation_counter.txt', checkpointer, count_shard, args.batch_size, args.cache_size, weights)
+            sequence_number, mutation_counts = merge_shard_counts(shard_results)
         
-        # Split the line into tokens.
-        line_tokens = re.split('\s+', line.rstrip())
+        # Otherwise, count the whole file in this process.
+        else:
+            progress_printer = ProgressPrinter('temp_new_mutation_counter.txt')
+            sequence_number, mutation_counts = count_shard_with_checkpoints(args.maf_file, 0, None, checkpointer, count_shard, args.batch_size, args.cache_size, weights, progress=progress_printer.add)
+    
+    # If a state file was passed, add the counts of the earlier runs and save the updated state.
+    if args.state is not None:
+        with profiler.step("Adding the counts of the state file"):
+            sequence_number, mutation_counts = update_state(args.state, 'multi_mutation_counter', merge_shard_counts, (sequence_number, mutation_counts))
 
-        # If it corresponds to a reference genome:
-        if reference:
-            # Get the reference starting position, reference length, and reference sequence.
-            line_refstart = int(line_tokens[2])
-            line_reflength = int(line_tokens[3])
-            ref_sequence = line_tokens[-1]
 
-            # Find the reference sequence length.
-            refsequence_length = len(ref_sequence)
-            
-            # Set the reference tag to false since a reference line has been read.
-            reference = False
+    # Print the mutation counts.
+    print(mutation_counts)
+    
+    with profiler.step("Writing the output files"), metrics.timer('output'):
+        # Fill the deletion counts dictionary.
+        fill_deletion_counts(mutation_counts, deletion_counts)
+        
+        # Simplify the counts by freezing the postings.
+        simplify_counts_dict(mutation_counts)
+        
+        # Convert the counts to the parsable file.
+        #convert_to_parse_file(mutation_counts)
+        
+        # Save the counts as memory-mappable binary files.
+        save_mutation_counts(mutation_counts)
+        
+        # Save the counts/frequencies to an output file.
+        counts_to_file(mutation_counts, deletion_counts, sequence_number, output_format=args.output_format)
+    
+    # Write the final metrics and the profile.
+    metrics.write()
+    profiler.write()
 
-        # Otherwise, the sequence is a variant:
-        else:
+def new_mutation_counts(length=LENGTH_OF_S_GENE):
+    """
+    Creates the empty mutation counts, which store the groups for each nucleotide at each position.
+    
+    Parameter: length - the number of nucleotide positions in the gene
+    
+    Returns:   mutation_counts - the GroupPostings containing the mutation counts
+    """
+    return GroupPostings(length)
+
+def count_shard(maf_file, start, end, batch_size, cache_size, weights, progress, result=None, checkpoint=None):
+    """
+    Counts the mutations in the sequence pairs of one byte range (shard) of the multi alignment file.
+    
+    Parameters: maf_file - the path to the multi alignment .maf file
+                start - the byte offset of the shard
+                end - the ending byte offset of the shard, or None for the end of the file
+                batch_size - the number of sequence pairs compared together as one block
+                cache_size - the number of recent unique sequence pairs whose mutations are reused
+                weights - the dictionary from group_id to multiplicity, or None for a multiplicity of 1
+                progress - the function called with the number of new sequences read
+                result - the (sequence_number, mutation_counts) counts to continue from, or None to start new counts
+                checkpoint - the function called with the byte offset and the counts at the end of each alignment block, or None
+                
+    Returns:    sequence_number - the number of sequences read, counting each by its multiplicity
+                mutation_counts - the GroupPostings containing the mutation counts
+    """
+    
+    # Initialize variables and counts, continuing the counts that were passed.
+    if result is None:
+        result = 0, new_mutation_counts()
+    sequence_number, mutation_counts = result
+    
+    # Initialize the cache of the mutations of recent unique sequence pairs.
+    event_cache = EventCache(cache_size)
+    
+    # If a batch size was passed, process the pairs as blocks of sequences.
+    if batch_size > 1:
+        # For each batch of sequence pairs in the shard:
+        for ref_sequences, other_sequences, group_ids, batch_end in metrics.timed('parse', read_alignment_batches(maf_file, batch_size, start, end, with_offsets=True)):
+            # Get the multiplicity of each sequence in the block.
+            block_weights = None if weights is None else [weights.get(group_id, 1) for group_id in group_ids]
+            
             # Increment the number of sequences read.
-            sequence_number += 1
+            sequence_number += len(group_ids) if block_weights is None else sum(block_weights)
+            progress(len(group_ids))
             
-            # For every 1000 sequences read, print the current sequence number to the temp_file and stdout.
-            if sequence_number % 1000 == 0:
-                with open('temp_new_mutation_counter.txt', 'w') as temp_file:
-                    temp_file.write(str(sequence_number) + '\n')
-                print(sequence_number)
-                
-                
-            # Get the relevant sequence information for the other/variant sequence.
-            other_group_id = int(line_tokens[1])
-            line_otherstart = int(line_tokens[2])
-            line_otherlength = int(line_tokens[3])
-            other_sequence = line_tokens[-1]
-            othersequence_length = len(other_sequence)
+            # Stack the block into (N x L) matrices and remove the insertion columns.
+            with metrics.timer('fix_sequences'):
+                reference_block, other_block = fix_sequence_block(stack_sequences(ref_sequences), stack_sequences(other_sequences), LENGTH_OF_S_GENE)
             
+            # Compare the whole block of reference and other/variant sequences.
+            with metrics.timer('compare'):
+                compare_sequence_block(reference_block, other_block, mutation_counts, group_ids, block_weights)
             
-            # Use the fix sequences method to remove insertion columns.
-            ref_sequence, other_sequence = fix_sequences(ref_sequence, other_sequence)
+            # Pass the counts up to the end of the batch to the checkpoint function.
+            if checkpoint is not None:
+                checkpoint(batch_end, (sequence_number, mutation_counts))
+    
+    # Otherwise, process the pairs one at a time.
+    else:
+        # For each sequence pair in the shard:
+        for ref_sequence, other_sequence, other_group_id, block_end in metrics.timed('parse', read_alignment_pairs(maf_file, start, end, with_offsets=True)):
+            # Get the multiplicity of the sequence.
+            weight = 1 if weights is None else weights.get(other_group_id, 1)
             
-            # Use the compare_sequences to compare the reference and other/variant sequences.
-            compare_sequences(ref_sequence, other_sequence, mutation_counts, other_group_id)
+            # Increment the number of sequences read.
+            sequence_number += weight
+            progress(1)
             
-            # Set the reference tag to true since a reference sequence will be read next.
-            reference = True
-
+            # Find the mutations of the pair, reusing them if the same pair was seen recently.
+            positions, columns = event_cache.find(ref_sequence, other_sequence, find_pair_mutations)
+            
+            # Append the group for each mutated position.
+            with metrics.timer('count'):
+                mutation_counts.add(positions, columns, other_group_id, weight)
+            
+            # Pass the counts up to the end of the block to the checkpoint function.
+            if checkpoint is not None:
+                checkpoint(block_end, (sequence_number, mutation_counts))
+    
+    return sequence_number, mutation_counts
 
-    # Print the mutation counts dictionary.
-    print(mutation_counts)
+def merge_shard_counts(shard_results):
+    """
+    Merges the counts from the shards of the multi alignment file.
+    The groups are appended in shard order, so the result is the same as a serial run.
     
-    # Fill the deletion counts dictionary.
-    fill_deletion_counts(mutation_counts, deletion_counts)
+    Parameter: shard_results - the list of (sequence_number, mutation_counts) results in file order
     
-    # Simplify the counts dictionary by removing empty inner dictionaries.
-    simplify_counts_dict(mutation_counts)
+    Returns:   the merged (sequence_number, mutation_counts)
+    """
     
-    # Convert the counts to the parsable file.
-    #convert_to_parse_file(mutation_counts)
+    # Start from the first shard.
+    sequence_number, mutation_counts = shard_results[0]
     
-    # Save the counts as a pickle binary file.
-    save_pickle(mutation_counts)
+    # For each remaining shard, add its counts and groups.
+    for shard_sequence_number, shard_mutation_counts in shard_results[1:]:
+        sequence_number += shard_sequence_number
+        mutation_counts.merge(shard_mutation_counts)
     
-    # Save the counts/frequencies to an output file.
-    counts_to_file(mutation_counts, deletion_counts, sequence_number)
+    return sequence_number, mutation_counts
 
 def fill_deletion_counts(mutation_counts, deletion_counts):
     """
-    Fills the deletion counts dictionary with the deletion values from the mutation_counts dictionary.
+    Fills the deletion counts dictionary with the deletion values from the mutation_counts.
     """
-    for i in range(len(mutation_counts)):
-        deletion_counts[i] = mutation_counts[i]['-']['Count']
+    deletion_counts[:] = mutation_counts.counts()[:, NUCLEOTIDES.index('-')].tolist()
 
-def save_pickle(mutation_counts):
+def save_mutation_counts(mutation_counts, gene='S'):
     """
-    Saves the mutation_counts dictionary as a pkl file.
+    Saves the mutation_counts as CSR offsets and a flat group_id array in the test13_above97_mutation_counts directory,
+    or in test13_above97_mutation_counts_<gene> for the genes other than the S-gene.
+    The legacy list of dictionaries can be rebuilt with group_postings.load_legacy_counts.
+    
+    Parameters: mutation_counts - the GroupPostings containing the mutation counts
+                gene - the protein name of the gene
     """
-    pickle_file = open('test13_above97_mutation_counts.pkl', 'wb')
-    pickle.dump(mutation_counts, pickle_file)
+    mutation_counts.save('test13_above97_mutation_counts' if gene == 'S' else 'test13_above97_mutation_counts_' + gene)
 
-def compare_sequences(reference, other, mutation_counts, group_id):
+def find_pair_mutations(ref_sequence, other_sequence):
     """
-    Increments the mutation_counts dictionary for the mutations between a reference sequence and
-    an other/variant sequence.
+    Finds the mutations between an aligned reference sequence and an aligned other/variant sequence.
     
-    Parameters: reference - the reference sequence string being compared
-                other - the other/variant sequence string being compared
-                mutation_counts - the dictionary containing the mutation counts
-                group_id - the group_id for the sequence pair
+    Parameters: ref_sequence - the aligned reference sequence
+                other_sequence - the aligned other/variant sequence
+                
+    Returns:    positions - the array of mutated positions
+                columns - the array of count matrix columns for the mutated nucleotides
     """
+    
+    # Use the fix sequences method to remove insertion columns.
+    with metrics.timer('fix_sequences'):
+        reference, other, _ = fix_sequences(ref_sequence, other_sequence, LENGTH_OF_S_GENE)
+    
+    # Find every substitution or deletion with a single vectorized comparison.
+    with metrics.timer('compare'):
+        return find_mutations(reference, other)
 
-    # For each nucleotide position in the reference sequence,
-    for i in range(len(reference)):
-        # If a substitution or deletion is found:
-        if reference[i] in 'ATCG' and other[i] in 'ATCG-':
-            if reference[i] != other[i]:
-                # Increment the mutation counts at the position and append the groups subdictionary.
-                mutation_counts[i][other[i]]['Count'] += 1
-                mutation_counts[i][other[i]]['Groups'].append(group_id)
+def compare_sequence_block(reference_block, other_block, mutation_counts, group_ids, weights=None):
+    """
+    Adds the mutations in every pair of a block of sequence pairs to the mutation counts at once.
+    
+    Parameters: reference_block - the (N x 3822) matrix of reference sequences without insertion columns
+                other_block - the (N x 3822) matrix of other/variant sequences without insertion columns
+                mutation_counts - the GroupPostings containing the mutation counts
+                group_ids - the list of group_ids for the sequence pairs
+                weights - the list of multiplicities for the sequence pairs, or None for 1 each
+    """
+    
+    # Find every mutation in the block.
+    rows, positions, columns = find_mutation_block(reference_block, other_block)
+    
+    # Append the groups and their weights in the order of the sequences.
+    mutation_counts.add(positions, columns, np.asarray(group_ids)[rows], 1 if weights is None else np.asarray(weights)[rows])
 
 def simplify_counts_dict(mutation_counts):
     """
-    Simplifies the mutation_counts dictionary by removing empty subdictionaries.
+    Simplifies the mutation_counts by freezing the postings.
+    Empty (position, nucleotide) cells take no space once the postings are frozen.
     
-    Parameter: mutation_counts - the dictionary containing the mutation counts
+    Parameter: mutation_counts - the GroupPostings containing the mutation counts
     """
-    
-    # For each position in the mutation counts dictionary:
-    for i in range(len(mutation_counts)):
-        # For each type of nucleotide character (ATCG-):
-        for nuc in list(mutation_counts[i].keys()):
-        
-            # If the subdictionary is empty, pop it.
-            if len(mutation_counts[i][nuc]['Groups']) == 0:
-                mutation_counts[i].pop(nuc)
+    mutation_counts.freeze()
 
 def convert_to_parse_file(mutation_counts):
     """
     Write a parsable file with the full substitution information.
     This includes the resulting nucleotide.
     
-    # Parameter: mutation_counts - the dictionary containing the mutation counts.
+    # Parameter: mutation_counts - the GroupPostings containing the mutation counts.
     """
     
+    # Get the mutation counts from the summed weights of the postings.
+    counts = mutation_counts.counts()
+    
     # Open the output parse file:
     with open('test13.above97.substitution.unique.sites.txt', 'w') as parse_file:
 
-        # For each position in the mutation_counts dictionary:
-        for i in range(len(mutation_counts)):
-            # If the position has substitutions:
-            if len(mutation_counts[i]) > 0:
-                # Write the position the number of substitutions.
-                parse_file.write('{} : {} : '.format(i, len(mutation_counts[i])))
+        # For each position with mutations:
+        for i in np.flatnonzero(counts.sum(axis=1)).tolist():
+            # Get the nucleotides with groups.
+            nucs = [nuc for nuc, count in zip(NUCLEOTIDES, counts[i].tolist()) if count > 0]
+            
+            # Write the position the number of substitutions.
+            parse_file.write('{} : {} : '.format(i, len(nucs)))
+            
+            # For each nucleotide type:
+            for nuc in sorted(nucs):
+                # Get the groups.
+                groups = mutation_counts.groups_at(i, nuc)
                 
-                # For each nucleotide type:
-                for nuc in sorted(mutation_counts[i].keys()):
+                # Write the nucleotide character and the mutation count.
+                parse_file.write('< {} : {} : '.format(nuc, len(groups)))
                 
-                    # Check that the number of mutations is correct.
-                    assert mutation_counts[i][nuc]['Count'] == len(mutation_counts[i][nuc]['Groups'])
-                    
-                    # Write the nucleotide character and the mutation count.
-                    parse_file.write('< {} : {} : '.format(nuc, mutation_counts[i][nuc]['Count']))
-                    
-                    # Write the groups.
-                    for group in sorted(mutation_counts[i][nuc]['Groups']):
-                        parse_file.write('{} '.format(group))
-                    parse_file.write('> ')
-                    
-                # End the line.
-                parse_file.write('\n')
+                # Write the groups.
+                parse_file.write(''.join('{} '.format(group) for group in sorted(groups.tolist())))
+                parse_file.write('> ')
+                
+            # End the line.
+            parse_file.write('\n')
 
 
-def counts_to_file(mutation_counts, deletion_counts, sequence_number):
+def counts_to_file(mutation_counts, deletion_counts, sequence_number, gene='S', output_format='csv'):
     """
     Writes the substitution and deletion counts and frequencies to the output file.
     
-    Parameters: mutation_counts - the dictionary containing the mutation counts
+    Parameters: mutation_counts - the GroupPostings containing the mutation counts
                 deletion_counts - the dictionary containing the deletion counts
                 sequence_number - the variable containing the total number of sequences
+                gene - the protein name of the gene used in the file name
+                output_format - the format of the output file (see count_writers.py)
     """
     
     # Print the number of sequences.
     print("Sequences Number: {}".format(sequence_number))
     
-    # Open the new counts file.
-    counts_file = open('new_mutation_counts_freq_for_S_all.csv', 'w')
-
-    # Write the column names for the .csv file.
-    counts_file.write('Index,Substitution_Count,Deletion_Count,Substitution_Freq,Deletion_Freq\n')
-
-    # For each index position in the sequence:
-    for i in range(len(mutation_counts)):
-        # Write the index and mutation count to the file.
-        substitution_count = 0
-        for nuc in ('A','T','C','G'):
-            if nuc in mutation_counts[i].keys():
-                substitution_count += mutation_counts[i][nuc]['Count']
-            else:
-                substitution_count += 0
-
-        # Calculate the substitution frequency.
-        substitution_freq = substitution_count/sequence_number
-        
-        # Get the deletion count.
-        if '-' in mutation_counts[i].keys():
-            deletion_count = mutation_counts[i]['-']['Count']
-        else:
-            deletion_count = 0
-            
-        # Calculate the deletion frequency.
-        deletion_freq = deletion_count/sequence_number
-
-        # Write the corresponding line in the output .csv file.
-        counts_file.write('{},{},{},{},{}\n'.format(i,substitution_count,deletion_count,substitution_freq,deletion_freq))
-
-    # Close the counts file.
-    counts_file.close()
-        
-def fix_sequences(reference, other):
-    """
-    Removes columns from sequences for insertions.
-    
-    Parameters: reference - the reference sequence
-                other     - the other/variant sequence
-                
-    Returns:    new_ref   - the updated reference sequence
-                new_other - the updated other/variant sequence
-    """
-    
-    # Initialize the new sequences.
-    new_ref = ''
-    new_other = ''
-    
-    # For each position in the reference sequence:
-    for i in range(len(reference)):
-        # If an insertion is found, skip it.
-        if reference[i] == '-':
-            pass
-        # Otherwise append the characters.
-        else:
-            new_ref += reference[i]
-            new_other += other[i]
-
-    # Make sure the lengths are correct.
-    # Otherwise stop and print a message.
-    if len(new_ref) == len(new_other) and len(new_ref) == 3822:
-        return new_ref, new_other
-    else:
-        print("Sequences were not the correct length. (3822)")
-        exit()
+    # Write the counts and frequencies of each position from the summed weights of the postings.
+    write_mutation_counts(mutation_counts.counts(), sequence_number, 'new_mutation_counts_freq_for_{}_all.csv'.format(gene), output_format)
         
 # Run the main function.
 if __name__ == '__main__':
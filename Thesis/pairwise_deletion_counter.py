@@ -7,206 +7,231 @@
 # 2. bad_files.out
 # 
 # 
-# Output file names:
-#     pairwise_deletion_counts_freq_for_S_all.csv
-#     pairwise_deletion_lengths_counts_freq_for_S_all.csv
+# Output file names (for each gene selected with --genes, S by default):
+#     pairwise_deletion_counts_freq_for_<gene>_all.csv
+#     pairwise_deletion_lengths_counts_freq_for_<gene>_all.csv
 #
 
 # Import required libraries/packages.
-from sys import argv
-from os import listdir
+import os
+import argparse
+import multiprocessing
+from functools import partial
+from concurrent.futures import ThreadPoolExecutor
 from maf_reader import extract_sequences
 from gene_reader import dna_reader
 import numpy as np
 import pandas as pd
 from sequence_comparer import compare_dna_sequences
+from alignment_arrays import find_deletion_runs
+from deletion_events import DeletionEventCounter
+from gene_sets import select_genes
+from step_profiler import add_profile_arguments, profiler_from_arguments
+from count_writers import write_contiguous_deletion_counts, write_deletion_length_counts, add_output_arguments
+
+# Set the directory containing the pairwise alignment files.
+PWS_DIRECTORY = '../uniqueSeqs.d/pws.d/'
 
 # The main function.
 def main():
-   
-    # Get the total number of unique sequences.
-    MAX_NUMBER = sum(1 for file in listdir('../uniqueSeqs.d/pws.d/'))
     
-    # Import the gene information.
-    genes = dna_reader()
+    # Parse the command line arguments.
+    parser = argparse.ArgumentParser(description='Counts the contiguous deletions in each selected gene of the pairwise alignment files.')
+    parser.add_argument('--genes', default='S', help='the comma separated protein names of the genes to count')
+    parser.add_argument('--workers', type=int, default=1, help='the number of worker processes, each counting chunks of the files')
+    parser.add_argument('--chunk-size', type=int, default=1000, help='the number of files sent to a worker at a time')
+    parser.add_argument('--prefetch-threads', type=int, default=8, help='the number of threads reading the files of a chunk ahead of the counting')
+    add_profile_arguments(parser)
+    add_output_arguments(parser)
+    args = parser.parse_args()
+    profiler = profiler_from_arguments(args, 'pairwise_deletion_counter')
+    
+    # Import the gene information and select the genes to count.
+    genes = profiler.call("Importing the gene information", dna_reader)
+    gene_set = select_genes(genes, args.genes.split(','))
+    
+    with profiler.step("Counting the pairwise files"):
+        # Input the set of files missing sequences.
+        bad_files = set(line.rstrip() for line in open('bad_files.out'))
+    
+        # Get the list of valid maf files.
+        with os.scandir(PWS_DIRECTORY) as entries:
+            maf_files = [entry.name for entry in entries if entry.name not in bad_files]
+    
+        # Split the files into chunks.
+        chunks = [maf_files[i:i + args.chunk_size] for i in range(0, len(maf_files), args.chunk_size)]
+        count_chunk = partial(count_file_chunk, gene_set=gene_set, prefetch_threads=args.prefetch_threads)
+    
+        # If more than one worker was requested, count the chunks in a process pool.
+        if args.workers > 1:
+            with multiprocessing.Pool(args.workers) as pool:
+                file_number, num_sequences_with_deletions, deletion_counters = merge_chunk_counts(pool.imap(count_chunk, chunks), len(gene_set))
+    
+        # Otherwise, count the chunks in this process.
+        else:
+            file_number, num_sequences_with_deletions, deletion_counters = merge_chunk_counts(map(count_chunk, chunks), len(gene_set))
     
-    # Initialize the contiguous_deletion_counts list.
-    contiguous_deletion_counts = [{} for i in range(3822)]
+    with profiler.step("Writing the output files"):
+        # For each gene:
+        for (gene, gene_start, gene_length), gene_num_sequences_with_deletions, deletion_counter in zip(gene_set, num_sequences_with_deletions, deletion_counters):
+            # Print the deletion counter.    
+            print(deletion_counter)
+        
+            # Write the final file number and the deletion counter to the temp file.
+            with open('old_deletion_temp.txt', 'a') as temp_file:
+                print(file_number, file=temp_file)
+                print(deletion_counter, file=temp_file)
+        
+            # Write the contiguous deletion counts to a .csv file.    
+            contiguous_deletion_counts_to_file(deletion_counter, file_number, gene_num_sequences_with_deletions, gene, args.output_format)
+        
+            # Write the deletion length data to a .csv file.
+            deletion_lengths_to_file(deletion_counter, file_number, gene, args.output_format)
     
-    # Initialize the number of files.
-    file_number = 0
+    # Write the profile, if --profile was passed.
+    profiler.write()
+        
+def extract_gene_sequences(maf_file, gene_set):
+    """
+    Reads a pairwise maf file and splices out the gene sequences from the whole genome sequences.
+    
+    Parameters: maf_file - the name of the maf file
+                gene_set - the list of (protein_name, start index, length) for each gene
+                
+    Returns:    gene_sequences - the list of (reference, other/variant) gene sequences for each gene
+    """
+    
+    # Extract the reference and other/variant sequences from the maf file. 
+    reference_sequence, other_sequence = extract_sequences(maf_file)
     
-    # Input the list of files missing sequences.
-    bad_files = list(line.rstrip() for line in open('bad_files.out'))
+    # For each gene, splice out the gene sequences from the whole genome sequences.
+    gene_sequences = []
+    for protein_name, gene_start, gene_length in gene_set:
+        ref_gene_sequence = reference_sequence[gene_start-reference_sequence.start:gene_start+gene_length-reference_sequence.start]
+        other_gene_sequence = other_sequence[gene_start-reference_sequence.start:gene_start+gene_length-reference_sequence.start]
+        gene_sequences.append((ref_gene_sequence, other_gene_sequence))
     
-    # Initialize the deletion length counts dictionary.
-    deletion_length_counts = {}
+    return gene_sequences
+
+def count_file_chunk(maf_files, gene_set, prefetch_threads):
+    """
+    Counts the contiguous deletions of each gene in a chunk of pairwise maf files.
+    The files are read by a pool of threads, so that waiting on the file opens overlaps with the counting.
+    
+    Parameters: maf_files - the list of maf file names
+                gene_set - the list of (protein_name, start index, length) for each gene
+                prefetch_threads - the number of threads reading the files, or 0 to read them in this thread
+                
+    Returns:    file_number - the number of files read
+                num_sequences_with_deletions - the list of the number of sequences with deletions in each gene
+                deletion_counters - the list of DeletionEventCounters containing the contiguous deletion counts of each gene
+    """
     
-    # Initialize the number of sequences with deletions.
-    num_sequences_with_deletions = 0
+    # Initialize the counts.
+    deletion_counters = [DeletionEventCounter() for gene in gene_set]
+    num_sequences_with_deletions = [0] * len(gene_set)
     
-    # For each valid maf file:
-    for maf_file in (file for file in listdir('../uniqueSeqs.d/pws.d/') if (file not in bad_files)):
-        # Increment the number of files.
-        file_number += 1
+    # Read the gene sequences of the files in order, ahead of the counting if threads were requested.
+    read_gene_sequences = partial(extract_gene_sequences, gene_set=gene_set)
+    with ThreadPoolExecutor(max(prefetch_threads, 1)) as executor:
+        file_gene_sequences = executor.map(read_gene_sequences, maf_files) if prefetch_threads > 0 else map(read_gene_sequences, maf_files)
+        
+        # Count the numbers of contiguous (strings of '-'s) deletions in the compared sequences of each gene.
+        for gene_sequences in file_gene_sequences:
+            for gene_number, ((ref_gene_sequence, other_gene_sequence), deletion_counter) in enumerate(zip(gene_sequences, deletion_counters)):
+                # If the other/variant gene sequence contains a deletion, increment the number of sequences with deletions.
+                if count_contiguous_deletions(ref_gene_sequence, other_gene_sequence, deletion_counter):
+                    num_sequences_with_deletions[gene_number] += 1
+    
+    return len(maf_files), num_sequences_with_deletions, deletion_counters
         
-        # Write the number of files read for every 1000 sequences.
-        if file_number % 1000 == 0:
+def merge_chunk_counts(chunk_results, number_of_genes):
+    """
+    Merges the deletion tables of the counted chunks, printing the number of files read for every 1000 files.
+    
+    Parameters: chunk_results - the iterable of count_file_chunk results
+                number_of_genes - the number of genes counted
+    
+    Returns:    file_number - the number of files read
+                num_sequences_with_deletions - the list of the number of sequences with deletions in each gene
+                deletion_counters - the list of DeletionEventCounters containing the contiguous deletion counts of each gene
+    """
+    
+    # Initialize the contiguous deletion counter of each gene.
+    deletion_counters = [DeletionEventCounter() for i in range(number_of_genes)]
+    
+    # Initialize the number of files.
+    file_number = 0
+    
+    # Initialize the number of sequences with deletions in each gene.
+    num_sequences_with_deletions = [0] * number_of_genes
+    
+    # For each counted chunk:
+    for chunk_file_number, chunk_num_sequences_with_deletions, chunk_deletion_counters in chunk_results:
+        # Add the chunk counts.
+        file_number += chunk_file_number
+        num_sequences_with_deletions = [total + chunk_total for total, chunk_total in zip(num_sequences_with_deletions, chunk_num_sequences_with_deletions)]
+        for deletion_counter, chunk_deletion_counter in zip(deletion_counters, chunk_deletion_counters):
+            deletion_counter.merge(chunk_deletion_counter)
+        
+        # Write the number of files read for every 1000 files.
+        if file_number // 1000 != (file_number - chunk_file_number) // 1000:
             with open('old_deletion_temp.txt', 'w') as temp_file:
                 print(file_number, file=temp_file)
             print("Files Read: {}".format(file_number))
-            
-        
-        # Split the name of the maf file into tokens.
-        tokens = maf_file.split('.')
-        
-        # Extract the reference and other/variant sequences from the maf file. 
-        reference_sequence, other_sequence = extract_sequences(maf_file)
-        
-        # For the S-gene, splice out the S-gene sequences from the whole genome sequences.
-        for protein_number in [3]:
-            protein_name = genes[protein_number]['protein_name']
-            locations = genes[protein_number]['location']
-            
-            ref_gene_sequence = reference_sequence[locations[0]+-1-reference_sequence.start:locations[1]-reference_sequence.start]
-            other_gene_sequence = other_sequence[locations[0]+-1-reference_sequence.start:locations[1]-reference_sequence.start]
-            
-        # Count the numbers of contiguous (strings of '-'s) deletions in the compared sequences.
-        count_contiguous_deletions(ref_gene_sequence, other_gene_sequence, contiguous_deletion_counts, deletion_length_counts)
-    
-    # Print the file contiguous deletion counts dictionary.    
-    print(contiguous_deletion_counts)
-    
-    # Write the final file number and contiguous deletion counts to the temp file.
-    with open('old_deletion_temp.txt', 'a') as temp_file:
-        print(file_number, file=temp_file)
-        print(contiguous_deletion_counts, file=temp_file)
-    
-    # Write the contiguous deletion counts to a .csv file.    
-    contiguous_deletion_counts_to_file(contiguous_deletion_counts, file_number,num_sequences_with_deletions)
-    
-    # Write the deletion length data to a .csv file.
-    deletion_lengths_to_file(deletion_length_counts, file_number)    
-        
-        
-def count_contiguous_deletions(reference, other, contiguous_deletion_counts, deletion_length_counts):
+    
+    return file_number, num_sequences_with_deletions, deletion_counters
+
+def count_contiguous_deletions(reference, other, deletion_counter):
     """
-    Counts the numbers of contiguous (continuous strings of '-'s) deletions between two sequences.
+    Counts the numbers of contiguous (continuous strings of '-'s) deletions between two sequences,
+    including a deletion that runs to the end of the gene.
     
     Parameters: reference - the reference sequence string
                 other     - the other/variant sequence string
-                contiguous_deletion_counts - the container of contiguous deletion counts
-                deletion_length_counts - the dictionary containing the numbers of deletions of each given length
+                deletion_counter - the DeletionEventCounter containing the contiguous deletion counts
+                
+    Returns:    True if the other/variant sequence contains a deletion
     """
     
-    # Initialize the deletion length variable.
-    deletion_length = 0
+    # Find the (start, length) runs of '-'s and add them to the counter.
+    rows, starts, lengths = find_deletion_runs(str(other))
+    deletion_counter.add_runs(rows, starts, lengths)
     
-    # Initialize the temporary length counts dictionary.
-    temp_length_counts = {}
-    
-    # For each nucleotide index/position in the other/variant sequence:
-    for nucleotide_index in range(len(other)):
-        # Get the nucleotide character.
-        nucleotide = other[nucleotide_index]
-        
-        # If it is a '-', increment the deletion length.
-        if nucleotide == '-':
-            deletion_length += 1
-        
-        # Otherwise, it is either the character is before a deletion or after a deletion:
-        else:
-            # If the character is after a deletion (i.e. current deletion length is not 0):
-            if deletion_length != 0:
-                # Add the starting position, and deletion length to the dictionary.
-                contiguous_deletion_counts[nucleotide_index - deletion_length][deletion_length] = contiguous_deletion_counts[nucleotide_index - deletion_length].get(deletion_length, 0) + 1
-                
-                # Increment the deletion length count by 1.
-                temp_length_counts[deletion_length] = temp_length_counts.get(deletion_length, 0) + 1
-                
-                # Reset the deletion length to 0.
-                deletion_length = 0
-            # Otherwise continue the deletion.
-            else:
-                continue
-    # Increment the deletion length counts for all new deletions.
-    for deletion_length in temp_length_counts.keys():
-        deletion_length_counts[deletion_length] = deletion_length_counts.get(deletion_length, 0) + 1
+    return len(starts) > 0
     
    
-def contiguous_deletion_counts_to_file(contiguous_deletion_counts, sequence_number, num_sequences_with_deletions):
+def contiguous_deletion_counts_to_file(deletion_counter, sequence_number, num_sequences_with_deletions, gene='S', output_format='csv'):
     """
     Saves the deletion counts to a .csv file.
     
-    Parameters: contiguous_deletion_counts - the dictionary containing the deletion counts
+    Parameters: deletion_counter - the DeletionEventCounter containing the contiguous deletion counts
                 sequence_number - the total number of sequences
                 num_sequences_with_deletions - the number of sequences with deletions
+                gene - the protein name of the gene used in the file name
+                output_format - the format of the output file (see count_writers.py)
     """
     
     # Print the number of sequences.
     print("Sequence Number: {}".format(sequence_number))
     
-    # Open the new counts file.
-    counts_file = open('pairwise_deletion_counts_freq_for_S_all.csv', 'w')
-
-    # Write the column names for the .csv file.
-    counts_file.write('Starting_Nucleotide_Position,Deletion_Length,Ending_Nucleotide_Position,Deletion_Count,Deletion_Freq,Num_Sequences_With_Deletions,Ratio_With_Deletions\n')
-
-    # For each index value:
-    for i in range(3822):
-    
-        # Get the nucleotide position.
-        nucleotide_position = i + 1
-        
-        # For each deletion length:
-        for deletion_length in sorted(contiguous_deletion_counts[i].keys()):
-        
-            # Calculate the ending position.
-            ending_position = nucleotide_position + deletion_length - 1
-            
-            # Get the deletion length count.
-            deletion_length_count = contiguous_deletion_counts[i][deletion_length]
-        
-            # Calculate the frequency.
-            deletion_length_freq = deletion_length_count / sequence_number
-            
-            # Get the percentage of sequences with deletions.
-            ratio_with_deletions = num_sequences_with_deletions / sequence_number
-            
-            # Write the line in the output file.
-            counts_file.write('{},{},{},{},{},{},{}\n'.format(nucleotide_position, deletion_length, ending_position, deletion_length_count, deletion_length_freq, num_sequences_with_deletions, ratio_with_deletions))
+    # Write the counts and frequencies of the deletions sorted by starting position and length.
+    write_contiguous_deletion_counts(*deletion_counter.deletion_counts(), sequence_number, num_sequences_with_deletions,
+                                     'pairwise_deletion_counts_freq_for_{}_all.csv'.format(gene), output_format)
 
-    # Close the counts file.
-    counts_file.close()
-
-def deletion_lengths_to_file(deletion_length_counts, sequence_number):
+def deletion_lengths_to_file(deletion_counter, sequence_number, gene='S', output_format='csv'):
     """
     Writes the (deletion length, frequency) data to a .csv file.
 
-    Parameters: deletion_length_counts - the dictionary containing the deletion lengths
+    Parameters: deletion_counter - the DeletionEventCounter containing the numbers of sequences with deletions of each length
                 sequence_number - the number of sequences    
+                gene - the protein name of the gene used in the file name
+                output_format - the format of the output file (see count_writers.py)
     """
     
-    # Open the output file.
-    lengths_file = open('pairwise_deletion_lengths_counts_freq_for_S_all.csv', 'w')
-    
-    # Write the column names for the output file.
-    lengths_file.write('Deletion Length,Count,Frequency\n')
-    
-    # For each deletion length:
-    for length in sorted(deletion_length_counts.keys()):
-    
-        # Get the count of deletions with the given length.
-        deletion_length_count = deletion_length_counts[length]
-        
-        # Calculate the frequency.
-        deletion_length_freq = deletion_length_count / sequence_number
-        
-        # Write the line in the output file.
-        lengths_file.write('{},{},{}\n'.format(length, deletion_length_count, deletion_length_freq))
-        
-    # Close the file.
-    lengths_file.close()
+    # Write the counts and frequencies of the deletion lengths in sorted order.
+    write_deletion_length_counts(*deletion_counter.length_counts(), sequence_number,
+                                 'pairwise_deletion_lengths_counts_freq_for_{}_all.csv'.format(gene), output_format)
 
         
 # Runs the count_mutations function and times the execution.
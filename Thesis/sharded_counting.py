@@ -0,0 +1,135 @@
+# Filename: sharded_counting.py
+# Tool Name: Sharded Counting
+#
+# Runs a counter over a single multi alignment file with a pool of worker processes.
+# The file is split into shards at alignment block boundaries, each shard is counted in its own process,
+# and the per-shard results are returned in file order so that they can be merged into the same result as a serial run.
+# Files without random access (gzip, zstd and stdin) cannot be split, so they are counted in the calling process.
+
+
+# Import required libraries.
+import multiprocessing
+import time
+from multi_maf_reader import find_shard_offsets
+from counter_metrics import metrics
+
+# The shared progress counter used by the worker processes and the updates not yet added to it.
+shared_progress = None
+pending_progress = 0
+
+
+class ProgressPrinter:
+    """
+    Prints the number of sequences read and writes it to a temp file for every 1000 sequences.
+
+    Attributes: temp_filename   - the name of the temp file
+                sequence_number - the number of sequences read so far
+    """
+
+    def __init__(self, temp_filename):
+        self.temp_filename = temp_filename
+        self.sequence_number = 0
+
+    def add(self, number_of_sequences=1):
+        """
+        Adds to the number of sequences read.
+
+        Parameter: number_of_sequences - the number of new sequences
+        """
+        self.update(self.sequence_number + number_of_sequences)
+
+    def update(self, sequence_number):
+        """
+        Sets the number of sequences read, and reports it if a multiple of 1000 was passed.
+
+        Parameter: sequence_number - the total number of sequences read
+        """
+
+        # Get the previous number of sequences read.
+        previous_sequence_number = self.sequence_number
+        self.sequence_number = sequence_number
+
+        # Pass the number of sequences to the metrics.
+        metrics.update(sequence_number)
+
+        # For every 1000 sequences read, print the current sequence number to the temp_file and stdout.
+        if sequence_number // 1000 != previous_sequence_number // 1000:
+            with open(self.temp_filename, 'w') as temp_file:
+                temp_file.write(str(sequence_number) + '\n')
+            print(sequence_number)
+
+def initialize_worker(progress):
+    """
+    Stores the shared progress counter in a worker process.
+
+    Parameter: progress - the shared multiprocessing.Value counting the sequences read by all workers
+    """
+    global shared_progress
+    shared_progress = progress
+
+def add_shared_progress(number_of_sequences=1):
+    """
+    Adds to the shared progress counter, holding the updates back until 1000 sequences are pending.
+
+    Parameter: number_of_sequences - the number of new sequences, or 0 to flush the pending sequences
+    """
+    global pending_progress
+    pending_progress += number_of_sequences
+    if pending_progress >= 1000 or (number_of_sequences == 0 and pending_progress > 0):
+        with shared_progress.get_lock():
+            shared_progress.value += pending_progress
+        pending_progress = 0
+
+def count_shard_in_worker(count_shard, filepath, start, end, args):
+    """
+    Counts one shard in a worker process.
+
+    Parameters: count_shard - the counter function for a shard
+                filepath    - the path to the multi alignment file
+                start, end  - the byte offsets of the shard
+                args        - the additional arguments for the counter function
+
+    Returns:    the result of the counter function
+    """
+    result = count_shard(filepath, start, end, *args, progress=add_shared_progress)
+    add_shared_progress(0)
+    return result
+
+def run_sharded(count_shard, filepath, workers, temp_filename, *args):
+    """
+    Counts a multi alignment file in shards with a pool of worker processes.
+
+    Parameters: count_shard   - the counter function, called as count_shard(filepath, start, end, *args, progress=...)
+                filepath      - the path to the multi alignment file
+                workers       - the number of worker processes
+                temp_filename - the name of the progress temp file
+                args          - the additional arguments for the counter function
+
+    Returns:    shard_results - the list of counter results in file order
+    """
+
+    # Split the file at alignment block boundaries.
+    shards = find_shard_offsets(filepath, workers)
+    progress_printer = ProgressPrinter(temp_filename)
+
+    # If the file cannot be split, count it in this process.
+    if shards == [(0, None)]:
+        print("{} can only be read from start to end, so it is counted in one process.".format(filepath))
+        return [count_shard(filepath, 0, None, *args, progress=progress_printer.add)]
+    print("Counting {} shards with {} workers.".format(len(shards), workers))
+
+    # Initialize the progress counter shared by all workers.
+    progress = multiprocessing.Value('q', 0)
+
+    with multiprocessing.Pool(workers, initializer=initialize_worker, initargs=(progress,)) as pool:
+        # Start counting every shard.
+        pending_results = [pool.apply_async(count_shard_in_worker, (count_shard, filepath, start, end, args)) for start, end in shards]
+
+        # Report the progress across all workers until every shard is counted.
+        while not all(result.ready() for result in pending_results):
+            time.sleep(1)
+            progress_printer.update(progress.value)
+        progress_printer.update(progress.value)
+
+        # Collect the results in file order.
+        return [result.get() for result in pending_results]
@@ -0,0 +1,169 @@
+# Filename: step_profiler.py
+# Tool Name: Step Profiler
+#
+# Output file names (with --profile, for a tool named <tool>):
+# <tool>_profile_summary.txt - the steps ranked by wall time
+# <tool>_profile.prof - the cProfile dump of the whole run, which can be loaded into snakeviz
+# <tool>_profile_steps/<number>_<step>.prof - the cProfile dump of each step
+#
+# Profiles the top-level steps of the analyzers and counters. Each step is named by the caller, and its wall time,
+# CPU time and peak traced memory (tracemalloc) are recorded along with a cProfile of the step alone.
+# Only the main process is profiled, so the work done by worker processes is counted as the wall time of
+# the step that waits on them. Without --profile, the steps are a shared empty context.
+
+
+# Import required libraries.
+import os
+import re
+import time
+import pstats
+import cProfile
+import tracemalloc
+import contextlib
+
+# The step context used while profiling is disabled.
+NULL_STEP = contextlib.nullcontext()
+
+
+class StepProfiler:
+    """
+    Records the wall time, CPU time, peak memory and cProfile of each named step.
+
+    Attributes: enabled - whether the steps are profiled
+                prefix  - the prefix of the output file names
+                steps   - the list of (step name, wall seconds, CPU seconds, peak bytes, cProfile.Profile) of each step
+    """
+
+    def __init__(self, enabled=False, prefix='profile'):
+        self.enabled = enabled
+        self.prefix = prefix
+        self.steps = []
+
+    def step(self, step_name):
+        """
+        Gets the context manager that profiles one step.
+
+        Parameter: step_name - the name of the step used in the summary and dump file names
+
+        Returns:   the context manager, or an empty context if profiling is disabled
+        """
+        if not self.enabled:
+            return NULL_STEP
+        return self.profile_step(step_name)
+
+    @contextlib.contextmanager
+    def profile_step(self, step_name):
+        """
+        Profiles the code run inside the with block as one step.
+
+        Parameter: step_name - the name of the step
+        """
+
+        # Start tracing the memory of this step.
+        if not tracemalloc.is_tracing():
+            tracemalloc.start()
+        tracemalloc.reset_peak()
+        start_memory = tracemalloc.get_traced_memory()[0]
+
+        # Start the timers and the profiler.
+        profile = cProfile.Profile()
+        start_wall_time = time.perf_counter()
+        start_cpu_time = time.process_time()
+        profile.enable()
+        try:
+            yield
+        finally:
+            # Stop the profiler and the timers, and record the step.
+            profile.disable()
+            wall_seconds = time.perf_counter() - start_wall_time
+            cpu_seconds = time.process_time() - start_cpu_time
+            peak_bytes = tracemalloc.get_traced_memory()[1] - start_memory
+            self.steps.append((step_name, wall_seconds, cpu_seconds, peak_bytes, profile))
+
+    def call(self, step_name, function, *args, **kwargs):
+        """
+        Calls a function as one step.
+
+        Parameters: step_name - the name of the step
+                    function  - the function to call
+                    args, kwargs - the arguments of the function
+
+        Returns:    the return value of the function
+        """
+        with self.step(step_name):
+            return function(*args, **kwargs)
+
+    def write(self):
+        """
+        Writes the ranked summary, the cProfile dump of the whole run and the cProfile dump of each step.
+        """
+
+        # If profiling is disabled or no steps were run, there is nothing to write.
+        if not self.enabled or not self.steps:
+            return
+        tracemalloc.stop()
+
+        # Write the dump of each step, numbered in the order the steps ran.
+        steps_directory = self.prefix + '_steps'
+        os.makedirs(steps_directory, exist_ok=True)
+        for step_number, (step_name, wall_seconds, cpu_seconds, peak_bytes, profile) in enumerate(self.steps, 1):
+            profile.dump_stats(os.path.join(steps_directory, '{:02d}_{}.prof'.format(step_number, step_filename(step_name))))
+
+        # Combine the steps into the dump of the whole run.
+        combined_stats = pstats.Stats(*[step[4] for step in self.steps])
+        combined_stats.dump_stats(self.prefix + '.prof')
+
+        # Write the summary of the steps ranked by wall time.
+        total_wall_seconds = sum(step[1] for step in self.steps)
+        with open(self.prefix + '_summary.txt', 'w') as summary_file:
+            summary_file.write('{:<5} {:<60} {:>10} {:>10} {:>7} {:>12}  {}\n'.format('Rank', 'Step', 'Wall (s)', 'CPU (s)', 'Wall %', 'Peak (MB)', 'Slowest function (cumulative s)'))
+            for rank, (step_name, wall_seconds, cpu_seconds, peak_bytes, profile) in enumerate(sorted(self.steps, key=lambda step: -step[1]), 1):
+                summary_file.write('{:<5} {:<60} {:>10.3f} {:>10.3f} {:>6.1f}% {:>12.1f}  {}\n'.format(
+                    rank, step_name[:60], wall_seconds, cpu_seconds, 100 * wall_seconds / total_wall_seconds if total_wall_seconds > 0 else 0,
+                    peak_bytes / 2**20, slowest_function(pstats.Stats(profile))))
+
+        print("Profile written to {0}_summary.txt, {0}.prof and {1}/.".format(self.prefix, steps_directory))
+
+def step_filename(step_name):
+    """
+    Converts a step name to a file name.
+
+    Parameter: step_name - the name of the step
+
+    Returns:   the lowercase name with every run of other characters replaced by an underscore
+    """
+    return re.sub(r'[^a-z0-9]+', '_', step_name.lower()).strip('_')[:60]
+
+def slowest_function(stats):
+    """
+    Finds the function of a step with the largest cumulative time, leaving out the profiler itself.
+
+    Parameter: stats - the pstats.Stats of the step
+
+    Returns:   the 'file:line(function) seconds' description of the function, or '' if nothing was recorded
+    """
+    functions = [(cumulative_time, function) for function, (primitive_calls, calls, total_time, cumulative_time, callers) in stats.stats.items()
+                 if not function[0].endswith(('step_profiler.py', 'contextlib.py')) and function[2] != "<method 'disable' of '_lsprof.Profiler' objects>"]
+    if not functions:
+        return ''
+    cumulative_time, (filename, line_number, function_name) = max(functions)
+    return '{}:{}({}) {:.3f}'.format(os.path.basename(filename), line_number, function_name, cumulative_time)
+
+def add_profile_arguments(parser):
+    """
+    Adds the --profile option to an argument parser.
+
+    Parameter: parser - the argparse.ArgumentParser
+    """
+    parser.add_argument('--profile', action='store_true', help='profile each step and write a ranked summary and cProfile dumps')
+
+def profiler_from_arguments(args, tool_name):
+    """
+    Creates the StepProfiler for the parsed command line arguments.
+
+    Parameters: args      - the parsed arguments
+                tool_name - the name of the tool used as the prefix of the output files
+
+    Returns:    the StepProfiler, which is disabled unless --profile was passed
+    """
+    return StepProfiler(args.profile, tool_name + '_profile')
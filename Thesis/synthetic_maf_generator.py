@@ -0,0 +1,190 @@
+# Filename: synthetic_maf_generator.py
+# Tool Name: Synthetic MAF Generator
+#
+# Output files:
+# A multi alignment .maf file with the 's' line layout read by the multi counters.
+# Optionally, one pairwise .maf file for each sequence pair in the pws.d/ layout read by pairwise_deletion_counter.py.
+#
+# Writes synthetic S-gene (or whole genome) alignments that can be shared and used to reproduce the performance
+# of the counters at scale. A random reference sequence is generated, and a fixed number of distinct haplotypes
+# are derived from it with substitutions, deletions and insertions. Each output sequence is one of the haplotypes,
+# so the bytes of every haplotype are built once and the records are written by joining them with the group_ids.
+
+
+# Import required libraries.
+import os
+import argparse
+import numpy as np
+from alignment_arrays import GAP
+from gene_sets import GENOME_LENGTH
+from step_profiler import add_profile_arguments, profiler_from_arguments
+
+# Set the bases and the lookup table from an ASCII byte to its index in BASES.
+BASES = np.frombuffer(b'ATGC', dtype=np.uint8)
+BASE_INDEX = np.zeros(256, dtype=np.uint8)
+BASE_INDEX[BASES] = np.arange(len(BASES))
+
+# Set the number of records joined before each write.
+WRITE_BATCH_SIZE = 10000
+
+
+# The main function.
+def main():
+
+    # Parse the command line arguments.
+    parser = argparse.ArgumentParser(description='Writes a synthetic multi alignment .maf file of S-gene sequences for scale testing.')
+    parser.add_argument('maf_file', help='the output multi alignment .maf file')
+    parser.add_argument('--sequences', type=int, default=100000, help='the number of other/variant sequences')
+    parser.add_argument('--haplotypes', type=int, default=1000, help='the number of distinct other/variant sequences')
+    parser.add_argument('--length', type=int, default=3822, help='the length of the reference sequence')
+    parser.add_argument('--mutation-rate', type=float, default=0.001, help='the probability of a substitution at each position')
+    parser.add_argument('--deletion-rate', type=float, default=0.0005, help='the probability of a deletion starting at each position')
+    parser.add_argument('--deletion-lengths', default='1:4,3:3,6:2,9:1', help='the comma separated length:weight pairs of the deletion length distribution')
+    parser.add_argument('--insertion-rate', type=float, default=0.0001, help='the probability of an insertion before each position')
+    parser.add_argument('--pws-directory', help='the directory to also write one pairwise .maf file for each sequence pair into')
+    parser.add_argument('--reference-start', type=int, default=21562, help='the 0-based genome position of the reference in the pairwise files')
+    parser.add_argument('--seed', type=int, default=0, help='the seed of the random number generator')
+    add_profile_arguments(parser)
+    args = parser.parse_args()
+    profiler = profiler_from_arguments(args, 'synthetic_maf_generator')
+
+    # Parse the deletion length distribution.
+    deletion_lengths, deletion_weights = parse_length_distribution(args.deletion_lengths)
+
+    # Generate the reference sequence and the haplotypes.
+    with profiler.step("Generating the haplotypes"):
+        rng = np.random.default_rng(args.seed)
+        reference = BASES[rng.integers(len(BASES), size=args.length)]
+        haplotypes = [make_haplotype(reference, args.mutation_rate, args.deletion_rate, deletion_lengths, deletion_weights, args.insertion_rate, rng)
+                      for i in range(args.haplotypes)]
+
+        # Choose the haplotype of every sequence.
+        haplotype_ids = rng.integers(args.haplotypes, size=args.sequences)
+
+    # Write the multi alignment file.
+    profiler.call("Writing the multi alignment file", write_maf, args.maf_file, haplotypes, haplotype_ids)
+    print("Sequences Written: {}".format(args.sequences))
+
+    # Write the pairwise files, if a directory was passed.
+    if args.pws_directory is not None:
+        profiler.call("Writing the pairwise files", write_pairwise_files, args.pws_directory, haplotypes, haplotype_ids, args.reference_start)
+        print("Pairwise Files Written: {}".format(args.sequences))
+
+    # Write the profile, if --profile was passed.
+    profiler.write()
+
+def parse_length_distribution(length_distribution):
+    """
+    Parses a deletion length distribution of comma separated length:weight pairs.
+
+    Parameter: length_distribution - the distribution string, for example '1:4,3:3,6:2,9:1'
+
+    Returns:   lengths - the array of deletion lengths
+               probabilities - the array of the probability of each length
+    """
+    pairs = [pair.split(':') for pair in length_distribution.split(',')]
+    lengths = np.array([int(length) for length, weight in pairs])
+    weights = np.array([float(weight) for length, weight in pairs])
+    return lengths, weights / weights.sum()
+
+def make_haplotype(reference, mutation_rate, deletion_rate, deletion_lengths, deletion_probabilities, insertion_rate, rng):
+    """
+    Derives an aligned (reference, other/variant) pair from the reference sequence with random mutations.
+
+    Parameters: reference - the reference sequence as a uint8 array
+                mutation_rate - the probability of a substitution at each position
+                deletion_rate - the probability of a deletion starting at each position
+                deletion_lengths - the array of deletion lengths
+                deletion_probabilities - the array of the probability of each length
+                insertion_rate - the probability of an insertion of 1 to 3 nucleotides before each position
+                rng - the numpy random Generator
+
+    Returns:    ref_aligned - the aligned reference sequence, with a gap in each insertion column
+                other_aligned - the aligned other/variant sequence
+    """
+
+    # Substitute a different base at the mutated positions.
+    other = reference.copy()
+    positions = np.flatnonzero(rng.random(len(reference)) < mutation_rate)
+    shifts = rng.integers(1, len(BASES), size=len(positions))
+    other[positions] = BASES[(BASE_INDEX[reference[positions]] + shifts) % len(BASES)]
+
+    # Replace the deleted runs with gaps.
+    starts = np.flatnonzero(rng.random(len(reference)) < deletion_rate)
+    lengths = rng.choice(deletion_lengths, size=len(starts), p=deletion_probabilities)
+    for start, length in zip(starts, lengths):
+        other[start:start + length] = GAP
+
+    # Add the insertion columns, which are gaps in the reference.
+    insertion_positions = np.flatnonzero(rng.random(len(reference)) < insertion_rate)
+    insertion_columns = np.repeat(insertion_positions, rng.integers(1, 4, size=len(insertion_positions)))
+    ref_aligned = np.insert(reference, insertion_columns, GAP)
+    other_aligned = np.insert(other, insertion_columns, BASES[rng.integers(len(BASES), size=len(insertion_columns))])
+
+    return ref_aligned, other_aligned
+
+def format_records(haplotypes, reference_start=0, source_size=None):
+    """
+    Builds the 's' line bytes of each haplotype once.
+    The group_id is the only part of a record that changes, so each other/variant line is split before it.
+
+    Parameters: haplotypes - the list of aligned (reference, other/variant) pairs
+                reference_start - the 0-based position of the reference in its source sequence
+                source_size - the length of the reference source sequence, or None for the reference length
+
+    Returns:    ref_lines - the list of reference 's' lines
+                other_tails - the list of the other/variant 's' lines after the group_id
+    """
+    ref_lines = []
+    other_tails = []
+    for ref_aligned, other_aligned in haplotypes:
+        ref_size = np.count_nonzero(ref_aligned != GAP)
+        other_size = np.count_nonzero(other_aligned != GAP)
+        ref_lines.append(b's ref %d %d + %d %s\n' % (reference_start, ref_size, source_size or ref_size, ref_aligned.tobytes()))
+        other_tails.append(b' 0 %d + %d %s\n' % (other_size, other_size, other_aligned.tobytes()))
+    return ref_lines, other_tails
+
+def write_maf(maf_file, haplotypes, haplotype_ids):
+    """
+    Writes the multi alignment file with one alignment block for each sequence, numbered by group_id.
+
+    Parameters: maf_file - the path to the output .maf file
+                haplotypes - the list of aligned (reference, other/variant) pairs
+                haplotype_ids - the array of the haplotype of each sequence
+    """
+
+    # Build the lines of each haplotype once.
+    ref_lines, other_tails = format_records(haplotypes)
+
+    with open(maf_file, 'wb') as output_file:
+        output_file.write(b'##maf version=1\n\n')
+
+        # For each batch of sequences, join the records and write them at once.
+        for batch_start in range(0, len(haplotype_ids), WRITE_BATCH_SIZE):
+            records = []
+            for group_id, haplotype_id in enumerate(haplotype_ids[batch_start:batch_start + WRITE_BATCH_SIZE].tolist(), batch_start):
+                records += (b'a score=0\n', ref_lines[haplotype_id], b's %d' % group_id, other_tails[haplotype_id], b'\n')
+            output_file.write(b''.join(records))
+
+def write_pairwise_files(pws_directory, haplotypes, haplotype_ids, reference_start):
+    """
+    Writes one pairwise .maf file (<group_id>.maf) for each sequence, as read by pairwise_deletion_counter.py.
+
+    Parameters: pws_directory - the path to the output directory
+                haplotypes - the list of aligned (reference, other/variant) pairs
+                haplotype_ids - the array of the haplotype of each sequence
+                reference_start - the 0-based genome position of the reference
+    """
+
+    # Build the lines of each haplotype once, placing the reference in the genome.
+    ref_lines, other_tails = format_records(haplotypes, reference_start, GENOME_LENGTH)
+
+    # Write the file of each sequence.
+    os.makedirs(pws_directory, exist_ok=True)
+    for group_id, haplotype_id in enumerate(haplotype_ids.tolist()):
+        with open(os.path.join(pws_directory, '{}.maf'.format(group_id)), 'wb') as output_file:
+            output_file.write(b''.join((b'##maf version=1\n\na score=0\n', ref_lines[haplotype_id], b's %d' % group_id, other_tails[haplotype_id])))
+
+# Run the main function.
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,102 @@
+# Filename: variant_positions.py
+# Tool Name: Variant Positions
+#
+# A position index of the substitution or deletion positions of many variants, used by general_variant_finder.py.
+# The index is a (amino acid position x variant) table of the number of times each position is in each variant's
+# mutation list, so the variant positions found in any set of positions are counted for every variant at once,
+# and the positions found in the top i positions of a frequency ranking are counted for every rank i with one sort.
+# The counts match a count over each variant's mutation list, where a position listed twice is counted twice
+# and a missing position is not counted.
+
+
+# Import required libraries.
+import numpy as np
+
+
+class VariantPositionIndex:
+    """
+    Indexes the amino acid positions in the mutation lists of a number of variants.
+
+    Attributes: sizes - the array of the number of mutations in each variant's mutation list
+                table - the (amino acid position x variant) matrix of the number of times each position is in each mutation list
+    """
+
+    def __init__(self, mutation_lists):
+        """
+        Builds the index.
+
+        Parameter: mutation_lists - the list of mutation lists (with a position column), one for each variant
+        """
+
+        # Get the positions of every variant in one array, with the variant of each position.
+        positions = [mutation_list.position.dropna().to_numpy(dtype=np.int64) for mutation_list in mutation_lists]
+        variant_numbers = np.repeat(np.arange(len(positions)), [len(variant_positions) for variant_positions in positions])
+        positions = np.concatenate(positions) if positions else np.zeros(0, dtype=np.int64)
+
+        # Count each position of each variant, leaving out negative positions.
+        in_table = positions >= 0
+        self.sizes = np.array([len(mutation_list) for mutation_list in mutation_lists], dtype=np.int64)
+        self.table = np.zeros((positions.max(initial=0) + 1, len(mutation_lists)), dtype=np.int64)
+        np.add.at(self.table, (positions[in_table], variant_numbers[in_table]), 1)
+
+    def __repr__(self):
+        return 'VariantPositionIndex({} variants, {} positions)'.format(len(self.sizes), np.count_nonzero(self.table))
+
+    def lookup(self, amino_acid_positions):
+        """
+        Looks up the table row of each amino acid position.
+
+        Parameter: amino_acid_positions - the array of amino acid positions
+
+        Returns:   rows - the (positions x variants) matrix of the number of times each position is in each mutation list
+        """
+        amino_acid_positions = np.asarray(amino_acid_positions, dtype=np.int64)
+        in_table = (amino_acid_positions >= 0) & (amino_acid_positions < len(self.table))
+        rows = np.zeros((len(amino_acid_positions), self.table.shape[1]), dtype=np.int64)
+        rows[in_table] = self.table[amino_acid_positions[in_table]]
+        return rows
+
+    def masks(self, amino_acid_positions):
+        """
+        Finds which amino acid positions are in the mutation list of each variant.
+
+        Parameter: amino_acid_positions - the array of the amino acid position of each row
+
+        Returns:   the (rows x variants) boolean matrix, True where the row position is in the variant mutation list
+        """
+        return self.lookup(amino_acid_positions) > 0
+
+    def count(self, subsets):
+        """
+        Counts the mutations of each variant whose positions occur in each subset of positions.
+
+        Parameter: subsets - the list of arrays of amino acid positions, one for each subset
+
+        Returns:   counts - the (subsets x variants) matrix of counts
+        """
+
+        # Mark the distinct positions of each subset that are in the table.
+        present = np.zeros((len(subsets), len(self.table)), dtype=np.int64)
+        for subset_number, subset in enumerate(subsets):
+            subset = np.asarray(subset, dtype=np.int64)
+            present[subset_number, subset[(subset >= 0) & (subset < len(self.table))]] = 1
+
+        # Add up the table rows of the marked positions for every subset at once.
+        return present @ self.table
+
+    def count_ranks(self, ranked_positions):
+        """
+        Counts the mutations of each variant whose positions occur in the top i ranked positions, for each rank i.
+
+        Parameter: ranked_positions - the array of amino acid positions, sorted by frequency
+
+        Returns:   counts - the ((positions + 1) x variants) matrix, where row i holds the counts for the top i positions
+        """
+
+        # Find the first place of each distinct position in the ranking.
+        positions, first_places = np.unique(np.asarray(ranked_positions, dtype=np.int64), return_index=True)
+
+        # Add the table row of each position at the rank at which it is first included, then take the running sum over the ranks.
+        counts = np.zeros((len(ranked_positions) + 1, self.table.shape[1]), dtype=np.int64)
+        counts[first_places + 1] = self.lookup(positions)
+        return np.cumsum(counts, axis=0)